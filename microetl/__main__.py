@@ -12,20 +12,93 @@
 import os
 import sys
 import getopt
+import time
+import concurrent.futures
 
 import core as metl
 
+# Function that returns the list of jobs (YAML files) in the jobs configuration path
+def list_jobs(cfg_path):
+  jobs = []
+  for filename in sorted(os.listdir(cfg_path)):
+    if filename.lower().endswith('.yaml') or filename.lower().endswith('.yml'):
+      jobs.append(filename)
+  return jobs
+
+# Function that runs all the jobs, either one at the time (workers = 1) or
+# in a pool of worker processes, and returns the list of jobs summaries
+def run_jobs(jobs, workers: int = 1, profile: bool = False):
+  job_args = (str(metl.base_path), str(metl.cfg_path), str(metl.inp_path), str(metl.out_path), profile)
+  if workers <= 1:
+    return [metl.etleng_run_job(job, *job_args) for job in jobs]
+
+  results = {}
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+    futures = {pool.submit(metl.etleng_run_job, job, *job_args): job for job in jobs}
+    for future in concurrent.futures.as_completed(futures):
+      job = futures[future]
+      try:
+        results[job] = future.result()
+      except Exception as e:
+        # The worker process itself died (for example it was killed by the OS)
+        results[job] = {'job': job, 'status': 'failed', 'wall_time': None, 'rows_in': None, 'rows_out': None, 'write_throughput': None, 'error': str(e)}
+  return [results[job] for job in jobs]
+
+# Function that prints the summary of a run
+def print_summary(results, wall_time):
+  def fmt(value):
+    return '-' if value is None else str(value)
+
+  print('')
+  print('{:<40} {:<8} {:>10} {:>12} {:>12} {:>12}  {}'.format('Job', 'Status', 'Time (s)', 'Rows in', 'Rows out', 'Write rows/s', 'Error'))
+  for result in results:
+    job_time = '-' if result.get('wall_time') is None else '{:.2f}'.format(result.get('wall_time'))
+    print('{:<40} {:<8} {:>10} {:>12} {:>12} {:>12}  {}'.format(result.get('job'), result.get('status'), job_time,
+          fmt(result.get('rows_in')), fmt(result.get('rows_out')), fmt(result.get('write_throughput')), fmt(result.get('error'))))
+  failed = len([result for result in results if result.get('status') != 'ok'])
+  print('')
+  print('Jobs: ' + str(len(results)) + ', failed: ' + str(failed) + ', wall time: ' + '{:.2f}'.format(wall_time) + 's')
+
+# Function that prints the profile of each job of a run (see microetl/profiler.py)
+def print_profiles(results):
+  for result in results:
+    if result.get('profile') is not None:
+      print('')
+      print(metl.prof.format_profile_table(result.get('profile')))
+      if result.get('profile_report') is not None:
+        print('Report: ' + result.get('profile_report'))
+
+# Function that prints the summary of a watch mode micro-batch run
+def print_micro_batch(result):
+  def fmt(value):
+    return '-' if value is None else str(value)
+
+  print('{} {:<40} {:<8} files: {:>6} rows in: {:>10} rows out: {:>10} write rows/s: {:>10} time: {:.2f}s  {}'.format(
+        time.strftime('%Y-%m-%d %H:%M:%S'), result.get('job'), result.get('status'), fmt(result.get('files')),
+        fmt(result.get('rows_in')), fmt(result.get('rows_out')), fmt(result.get('write_throughput')), result.get('wall_time'),
+        fmt(result.get('error'))))
+  if result.get('profile') is not None:
+    print(metl.prof.format_profile_table(result.get('profile')))
+
 def main(argv):
   # Set the default paths:
   metl.base_path = os.getcwd()
   metl.cfg_path = os.path.join(metl.base_path, 'jobs')
   metl.out_path = os.path.join(metl.base_path, 'out_data')
   metl.inp_path = os.path.join(metl.base_path, 'inp_data')
+  workers = 1
+  profile = False
+  watch = False
+  watch_settings = {}
 
-  opts, args = getopt.getopt(argv,"hj:b:",["help","jobs=","base=","inp=","out="])
+  opts, args = getopt.getopt(argv,"hj:b:i:o:w:p",["help","jobs=","base=","inp=","out=","workers=","profile",
+                                                  "watch","poll-interval=","batch-files=","batch-latency=",
+                                                  "max-retries=","retry-delay="])
   for opt, arg in opts:
     if opt in ("-h", "--help"):
-      print ('microetl -j <jobs_configs_path> -i <inp_data_path> -o <out_data_path> -b <base_path>')
+      print ('microetl -j <jobs_configs_path> -i <inp_data_path> -o <out_data_path> -b <base_path> -w <workers> [-p]')
+      print ('         [--watch [--poll-interval <seconds>] [--batch-files <files>] [--batch-latency <seconds>]')
+      print ('                 [--max-retries <retries>] [--retry-delay <seconds>]]')
       sys.exit()
     elif opt in ("-j", "--jobs"):
       metl.cfg_path = arg
@@ -35,11 +108,39 @@ def main(argv):
       metl.inp_path = arg
     elif opt in ("-o", "--out"):
       metl.out_path = arg
+    elif opt in ("-w", "--workers"):
+      workers = int(arg)
+    elif opt in ("-p", "--profile"):
+      profile = True
+    elif opt == "--watch":
+      watch = True
+    elif opt == "--poll-interval":
+      watch_settings['poll_interval'] = float(arg)
+    elif opt == "--batch-files":
+      watch_settings['batch_files'] = int(arg)
+    elif opt == "--batch-latency":
+      watch_settings['batch_latency'] = float(arg)
+    elif opt == "--max-retries":
+      watch_settings['max_retries'] = int(arg)
+    elif opt == "--retry-delay":
+      watch_settings['retry_delay'] = float(arg)
 
-  # Load YAML test configuration:
-  for filename in os.listdir(metl.cfg_path):
-    if filename.lower().endswith('.yaml') or filename.lower().endswith('.yml'):
-      metl.etleng_run_pipeline_from_config(filename, str(metl.base_path), str(metl.cfg_path), str(metl.inp_path), str(metl.out_path))
+  # In watch mode, the jobs run on the files that arrive in their input directories, until interrupted:
+  if watch:
+    metl.etleng_watch_jobs(list_jobs(metl.cfg_path), str(metl.base_path), str(metl.cfg_path), str(metl.inp_path), str(metl.out_path),
+                           watch_settings, profile, print_micro_batch)
+    sys.exit()
+
+  # Run all the jobs found in the jobs configuration path:
+  start_time = time.perf_counter()
+  results = run_jobs(list_jobs(metl.cfg_path), workers, profile)
+  if profile:
+    print_profiles(results)
+  print_summary(results, time.perf_counter() - start_time)
+
+  # Exit with an error code if any of the jobs failed:
+  if any(result.get('status') != 'ok' for result in results):
+    sys.exit(1)
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
\ No newline at end of file
+    main(sys.argv[1:])
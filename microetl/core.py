@@ -16,6 +16,9 @@ import traceback
 import datetime
 import time
 import re
+import functools
+import tempfile
+import hashlib
 
 # Import pandas and numpy libraries
 # to read and write data in various formats
@@ -23,6 +26,20 @@ import re
 import pandas as pd
 import numpy as np
 
+# Import numexpr library (if available) to let pandas evaluate
+# filter expressions in a single pass
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Import pyarrow library (if available) to use Apache Arrow as
+# the in-memory format of the data between the pipeline stages
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 # Import jsonbender library to transform JSON data
 import jsonbender
 from jsonbender import bend, K, S, F, OptionalS, If, Switch, Alternation, Forall, list_ops, Reduce, Filter, FlatForall, Format
@@ -44,6 +61,9 @@ from jinja2.environment import Template, Environment
 from jinja2.runtime import Undefined 
 from jinja2.loaders import DictLoader
 
+# Jinja2 Environment used to render the actions parameters
+params_env = Environment(undefined=Undefined)
+
 # Import jinjaSQL library to allow for parameterized SQL queries
 from jinjasql import JinjaSql
 
@@ -58,6 +78,18 @@ import microetl.dbconn.interface as dbc
 # import the abstracted Web API client
 import microetl.apiclient as apic
 
+# import the pipelines profiler
+import microetl.profiler as prof
+
+# import the files discovery and reading functions
+import microetl.fileio as fio
+
+# import the processed-files manifest (incremental file ingestion)
+import microetl.manifest as mnf
+
+# import the landing directories watcher (watch mode)
+import microetl.watcher as wtc
+
 # Globals
 debug_level = 1
 base_path: str = os.path.dirname(os.path.realpath(__file__))
@@ -67,6 +99,22 @@ out_path: str = os.path.join(base_path, 'out_data')
 tmp_path: str = os.path.join(base_path, 'tmp_data')
 log_path: str = os.path.join(base_path, 'logs')
 
+# Execution modes
+# batch:     the whole source is read in memory and then transformed
+# streaming: the source produces fixed-size record batches and each
+#            batch flows through the transform sequence on its own
+default_batch_size: int = 10000
+
+# Data types backends (see execution.dtype_backend in the job configuration)
+# numpy:          pandas default (numpy) data types
+# numpy_nullable: pandas nullable data types
+# pyarrow:        Apache Arrow backed data types (requires pyarrow)
+dtype_backends = ['numpy', 'numpy_nullable', 'pyarrow']
+
+# Actions that need the whole dataset to produce their output (aka blocking
+# actions). In streaming mode, batches are collected before running them:
+blocking_actions = ['sort', 'limit', 'aggregate', 'pivot']
+
 # Error Messages
 err_msg = [
     # 0. Generic error message:
@@ -207,11 +255,13 @@ def read_config_file(config_file):
 
 # Function that takes microETL config, a datasource type and the input data path and returns data 
 # as required by the configuration
-def read_data_from_ds(config, datasource_type: str = 'file', section_name: str = 'source'):
+def read_data_from_ds(config, datasource_type: str = 'file', section_name: str = 'source', source_step=None):
     """
     Read data from the datasource
     :param config: Configuration
     :param datasource_type: Datasource Type
+    :param section_name: Section Name
+    :param source_step: Compiled step for the section action (compiled here if not provided)
     :return: processed data
     """
     try:
@@ -223,35 +273,55 @@ def read_data_from_ds(config, datasource_type: str = 'file', section_name: str =
             input_data_path: str = config.get("paths").get("inp_path")
         else:
             input_data_path: str = config.get("paths").get("base_path")
+        if source_step == None:
+            source_step = compile_step(config, input_data_path, section_name, config.get("actions").get(section_name))
 
-        if datasource_type.lower().strip() == 'csv':
-            data = pd.DataFrame()
-            for filename in os.listdir(input_data_path):
-                if filename.lower().endswith('.csv'):
-                    full_filename: str = os.path.join(input_data_path, filename)
-                    data += process_data(config, input_data_path, section_name, config.get("actions").get(section_name), pd.read_csv(full_filename)) 
-        elif datasource_type.lower().strip() == 'json':
-            data = json.loads('')
-            for filename in os.listdir(input_data_path):
-                if filename.lower().endswith('.json'):
-                    full_filename: str = os.path.join(input_data_path, filename)
-                    data += process_data(config, input_data_path, section_name, config.get("actions").get(section_name), pd.read_json(full_filename))
-        elif datasource_type.lower().strip() == 'excel':
-            data = pd.DataFrame()
-            for filename in os.listdir(input_data_path):
-                if filename.lower().endswith('.xlsx'):
-                    full_filename: str = os.path.join(input_data_path, filename)
-                    data += process_data(config, input_data_path, section_name, config.get("actions").get(section_name), pd.read_excel(full_filename))
+        if datasource_type.lower().strip() in ['csv', 'excel']:
+            # Read all the files (concurrently, if configured) and concatenate them once
+            ds_type = datasource_type.lower().strip()
+            files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+            files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+            reader = fio.get_file_reader(ds_type, read_options, get_file_cache_settings(config, section_name))
+            frames = fio.read_files(files, reader, files_settings['workers'], files_settings['executor'])
+            if get_partitioning(config, section_name) != None:
+                frames = [add_partition_columns(frame, fio.get_partition_values(input_data_path, filename)) for filename, frame in zip(files, frames)]
+            data = concat_data_batches([source_step(frame) for frame in frames])
+            if data is None:
+                data = pd.DataFrame()
+        elif datasource_type.lower().strip() in fio.columnar_formats:
+            # Columnar files are read with column and row group pruning
+            ds_type = datasource_type.lower().strip()
+            files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+            files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+            pushdown = get_columnar_pushdown(config, section_name, read_options)
+            tables = []
+            for values, group_files in get_partition_groups(config, section_name, input_data_path, files):
+                table = read_columnar_data(group_files, ds_type, get_partition_file_pushdown(pushdown, values))
+                tables.append(add_partition_columns(table, values, pushdown['columns']))
+            table = tables[0] if len(tables) == 1 else concat_data_batches(tables)
+            data = source_step(apply_dtype_backend(table, get_dtype_backend(config)))
+        elif datasource_type.lower().strip() in ['json', 'ndjson']:
+            # JSON files are parsed in bounded chunks (see iter_json_data) and concatenated once
+            ds_type = datasource_type.lower().strip()
+            files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+            files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+            chunk_size = int(read_options.get('chunk_size', default_batch_size))
+            data = concat_data_batches([add_partition_columns(chunk, values) for values, group_files in get_partition_groups(config, section_name, input_data_path, files)
+                                        for chunk in iter_json_data(group_files, ds_type, read_options, chunk_size)])
+            data = source_step(data if data is not None else pd.DataFrame())
         elif datasource_type.lower().strip() == 'api':
-            data = process_data(config, input_data_path, section_name, config.get("actions").get(section_name), read_data_from_api(config, section_name))
+            data = source_step(read_data_from_api(config, section_name))
         elif datasource_type.lower().strip() == 'file':
-            data = ''
-            for filename in os.listdir(input_data_path):
-                if filename != None and filename != '': 
-                    full_filename: str = os.path.join(input_data_path, filename)
-                    tmp_data = process_data(config, input_data_path, section_name, config.get("actions").get(section_name), read_data_from_file(full_filename))
-                    if tmp_data != None and tmp_data != '':
-                        data += str(tmp_data)
+            # Raw files are read as a single string, as memory-mapped buffers or as a lazy iterator of lines
+            files_settings, read_options = get_file_read_settings(config, section_name, 'file')
+            files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+            read_mode = get_file_read_mode(read_options)
+            if read_mode == 'mmap':
+                data = source_step(fio.map_files(files))
+            elif read_mode == 'lines':
+                data = source_step(fio.iter_file_lines(files, read_options.get('encoding', 'utf-8'), bool(read_options.get('keep_newlines', False))))
+            else:
+                data = fio.read_text_files(files, read_options.get('encoding', 'utf-8'), source_step)
         else:
             ds_type = datasource_type.lower().strip()
             db_list = ['snowflake', 'mysql', 'postgresql', 'neo4j', 'elasticsearch', 'mongodb']
@@ -266,6 +336,661 @@ def read_data_from_ds(config, datasource_type: str = 'file', section_name: str =
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Function that takes microETL config, a datasource type and yields data in batches of (at most)
+# batch_size records each, as required by the configuration (used by the streaming mode)
+def read_data_batches_from_ds(config, datasource_type: str = 'file', section_name: str = 'source', batch_size: int = default_batch_size, source_step=None):
+    """
+    Read data from the datasource in batches
+    :param config: Configuration
+    :param datasource_type: Datasource Type
+    :param section_name: Section Name
+    :param batch_size: Number of records per batch
+    :param source_step: Compiled step for the section action (compiled here if not provided)
+    :return: Generator of processed data batches
+    """
+    if section_name == "destination":
+        input_data_path: str = config.get("paths").get("out_path")
+    elif section_name == "source" or section_name == "transform":
+        input_data_path: str = config.get("paths").get("inp_path")
+    else:
+        input_data_path: str = config.get("paths").get("base_path")
+    action = config.get("actions").get(section_name)
+    if source_step == None:
+        source_step = compile_step(config, input_data_path, section_name, action)
+
+    ds_type = datasource_type.lower().strip()
+    action_type = str((action or {}).get('type', '')).lower().strip()
+    db_list = ['snowflake', 'mysql', 'postgresql', 'neo4j', 'elasticsearch', 'mongodb']
+    if ds_type == 'csv':
+        # pandas can parse CSV files one chunk at the time (directly into the job data types),
+        # so the files are streamed one after the other
+        files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+        files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+        for values, group_files in get_partition_groups(config, section_name, input_data_path, files):
+            for chunk in fio.iter_csv_chunks(group_files, batch_size, read_options):
+                yield source_step(add_partition_columns(chunk, values))
+    elif ds_type in fio.columnar_formats:
+        # Columnar files are read one record batch at the time, with column and row group pruning
+        files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+        files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+        pushdown = get_columnar_pushdown(config, section_name, read_options)
+        for values, group_files in get_partition_groups(config, section_name, input_data_path, files):
+            file_pushdown = get_partition_file_pushdown(pushdown, values)
+            for chunk in iter_columnar_data(group_files, ds_type, batch_size, file_pushdown):
+                chunk = add_partition_columns(chunk, values, pushdown['columns'])
+                yield source_step(apply_dtype_backend(chunk, get_dtype_backend(config)))
+    elif ds_type in ['json', 'ndjson']:
+        # JSON Lines files and the items selected by a JSON path are parsed batch_size records at the time
+        files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+        files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+        for values, group_files in get_partition_groups(config, section_name, input_data_path, files):
+            for chunk in iter_json_data(group_files, ds_type, read_options, batch_size):
+                yield source_step(add_partition_columns(chunk, values))
+    elif ds_type == 'file' and get_file_read_mode(get_file_read_settings(config, section_name, ds_type)[1]) == 'lines':
+        # Raw files in lines mode are streamed in batches of batch_size lines
+        files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+        files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+        lines = fio.iter_file_lines(files, read_options.get('encoding', 'utf-8'), bool(read_options.get('keep_newlines', False)))
+        for chunk in fio.iter_chunks(lines, batch_size):
+            yield source_step(chunk)
+    elif ds_type == 'excel':
+        # Excel files cannot be parsed in chunks, so each file is read and then split in batches
+        files_settings, read_options = get_file_read_settings(config, section_name, ds_type)
+        files = discover_datasource_files(config, section_name, input_data_path, files_settings)
+        cache = get_file_cache_settings(config, section_name)
+        partitioning = get_partitioning(config, section_name)
+        for filename in files:
+            data = fio.read_excel_file(filename, read_options, cache)
+            if partitioning != None:
+                data = add_partition_columns(data, fio.get_partition_values(input_data_path, filename))
+            for batch in iter_data_batches(source_step(data), batch_size):
+                yield batch
+    elif any(ds_type in s for s in db_list) and action_type in ['sql_to_dataframe', 'sql_to_arrow']:
+        # Databases can fetch the query results one batch at the time:
+        for batch in get_data_batches_from_db(config, input_data_path, datasource_type, section_name, batch_size, action_type == 'sql_to_arrow'):
+            yield source_step(batch)
+    else:
+        # All the other datasources are read at once and then split in batches:
+        for batch in iter_data_batches(read_data_from_ds(config, datasource_type, section_name, source_step), batch_size):
+            yield batch
+
+# Function that returns the incremental ingestion settings of a datasource, from its incremental
+# key (true, or a dictionary with the state_path, by default <base_path>/state, and the hash
+# algorithm used to compare the files content). Returns None when the datasource is not incremental
+def get_incremental_settings(config, section_name: str):
+    """
+    Get the Incremental ingestion settings of a datasource
+    :param config: Configuration
+    :param section_name: Section Name
+    :return: Incremental settings ({'state_path': directory, 'hash': algorithm or None}) or None
+    """
+    datasource = (config.get('datasources') or {}).get(section_name) or {}
+    incremental = datasource.get('incremental')
+    if incremental == None or incremental == False:
+        return None
+    if not isinstance(incremental, dict):
+        incremental = {}
+    if incremental.get('enabled', True) == False:
+        return None
+    default_path = os.path.join(str((config.get('paths') or {}).get('base_path') or '.'), 'state')
+    hash_algorithm = incremental.get('hash')
+    if hash_algorithm != None:
+        hash_algorithm = str(hash_algorithm).lower().strip()
+        if hash_algorithm not in hashlib.algorithms_available:
+            raise ValueError("Invalid incremental hash algorithm: " + hash_algorithm)
+    return {
+        'state_path': str(process_pyexpr(incremental.get('state_path', default_path))),
+        'hash': hash_algorithm,
+    }
+
+# Function that returns the partitioning of a file-based datasource (None, or hive for directories
+# laid out as key=value/key=value/files, whose keys become columns of the data)
+def get_partitioning(config, section_name: str):
+    """
+    Get the Partitioning of a datasource
+    :param config: Configuration
+    :param section_name: Section Name
+    :return: Partitioning (hive) or None
+    """
+    datasource = (config.get('datasources') or {}).get(section_name) or {}
+    partitioning = datasource.get('partitioning')
+    if partitioning == None or partitioning == False:
+        return None
+    if partitioning == True or str(partitioning).lower().strip() == 'hive':
+        return 'hive'
+    raise ValueError("Invalid partitioning: " + str(partitioning))
+
+# Function that returns the files of a datasource grouped by partition (a single group, with no
+# partition values, for datasources that are not partitioned)
+def get_partition_groups(config, section_name: str, input_data_path: str, files):
+    """
+    Get the Partition groups of the files of a datasource
+    :param config: Configuration
+    :param section_name: Section Name
+    :param input_data_path: Input Data path
+    :param files: List of file names
+    :return: List of (partition values, list of file names)
+    """
+    if get_partitioning(config, section_name) == None or len(files) == 0:
+        return [({}, files)]
+    return fio.group_partition_files(input_data_path, files)
+
+# Function that returns the pushdown for the files of a partition: the partition keys are not
+# columns of the files, so they are removed from the columns and the filters
+def get_partition_file_pushdown(pushdown, values):
+    """
+    Get the pushdown of the files of a Partition
+    :param pushdown: Dictionary with columns and filters
+    :param values: Partition values
+    :return: Dictionary with columns and filters
+    """
+    if len(values) == 0:
+        return pushdown
+    columns = pushdown['columns']
+    if columns != None:
+        columns = [column for column in columns if column not in values]
+    return { 'columns': columns, 'filters': [item for item in pushdown['filters'] if item[0] not in values] }
+
+# Function that adds the partition values (see fileio.get_partition_values) to the data as columns
+# (only the requested columns, when columns is not None, and never replacing a column of the files)
+def add_partition_columns(data, values, columns=None):
+    """
+    Add the Partition columns to the Data
+    :param data: Data (a DataFrame or an Arrow table)
+    :param values: Partition values
+    :param columns: List of requested columns (None for all the columns)
+    :return: Data
+    """
+    for key, value in values.items():
+        if columns != None and key not in columns:
+            continue
+        if pa != None and isinstance(data, pa.Table):
+            if key not in data.column_names:
+                data = data.append_column(key, pa.array([value] * data.num_rows))
+        elif key not in data.columns:
+            data[key] = value
+    return data
+
+# Datasource types whose data is read from files (and so can be watched, see etleng_watch_jobs)
+file_datasource_types = ['csv', 'excel', 'json', 'ndjson', 'parquet', 'feather', 'file']
+
+# Function that returns the files of a file-based datasource. For incremental datasources, only the
+# new or changed files (see microetl/manifest.py) are returned, and their states are kept in the job
+# configuration (incremental_state) until the run succeeds (see commit_incremental_state)
+def discover_datasource_files(config, section_name: str, input_data_path: str, files_settings):
+    """
+    Discover the Files of a datasource
+    :param config: Configuration
+    :param section_name: Section Name
+    :param input_data_path: Input Data path
+    :param files_settings: Files settings (see fileio.get_files_settings)
+    :return: List of file names
+    """
+    if section_name == 'source' and config.get('source_files') != None:
+        # The files to read were selected by the caller (e.g. a watch mode micro-batch)
+        files = sorted(config.get('source_files'))
+    elif get_partitioning(config, section_name) != None:
+        # Partitions that cannot match the filters pushed down to the source are not listed at all
+        read_options = ((config.get('datasources') or {}).get(section_name) or {}).get('read_options') or {}
+        filters = get_columnar_pushdown(config, section_name, read_options)['filters']
+        files = fio.discover_partitioned_files(input_data_path, files_settings['include'], files_settings['exclude'], filters)
+    else:
+        files = fio.discover_files(input_data_path, files_settings['include'], files_settings['exclude'], files_settings['recursive'])
+    incremental = get_incremental_settings(config, section_name)
+    if incremental == None:
+        return files
+    manifest_file = mnf.get_manifest_file(incremental['state_path'], config.get('job_name', 'job'), section_name)
+    manifest = mnf.load_manifest(manifest_file)
+    changed_files, states = mnf.select_changed_files(manifest, files, incremental['hash'])
+    logging.info("Incremental ingestion of " + section_name + ": " + str(len(changed_files)) + " new or changed files of " + str(len(files)))
+    if config.get('incremental_state') == None:
+        config['incremental_state'] = {}
+    config['incremental_state'][section_name] = {'manifest_file': manifest_file, 'manifest': manifest, 'states': states, 'files': changed_files}
+    return changed_files
+
+# Function that returns True when the incremental ingestion of a datasource found no new or changed
+# files in the current run (see discover_datasource_files), so the run has nothing to process
+def no_incremental_files(config, section_name: str = 'source'):
+    """
+    Check if an Incremental datasource has no files to read
+    :param config: Configuration
+    :param section_name: Section Name
+    :return: True if the datasource is incremental and no file was selected
+    """
+    state = (config.get('incremental_state') or {}).get(section_name)
+    return state != None and len(state.get('files')) == 0
+
+# Function that commits the manifests of the incremental datasources read by a run (see
+# discover_datasource_files). It is called only when the whole run, including the write to
+# the destination, succeeded, so the files of a failed run are read again by the next run
+def commit_incremental_state(config):
+    """
+    Commit the Incremental ingestion state of a run
+    :param config: Configuration
+    :return: True if all the manifests were written
+    """
+    result = True
+    for section_name, state in (config.pop('incremental_state', None) or {}).items():
+        if not mnf.commit_manifest(state.get('manifest_file'), state.get('manifest'), state.get('states')):
+            logging.error(err_msg[14] + "Cannot commit the manifest of the " + section_name + " datasource")
+            result = False
+    return result
+
+# Function that returns the files settings and the reader options of a file-based datasource
+# (see microetl/fileio.py). The reader options (e.g. usecols and dtype) are passed to the parser
+def get_file_read_settings(config, section_name: str, datasource_type: str):
+    """
+    Get the File read settings of a datasource
+    :param config: Configuration
+    :param section_name: Section Name
+    :param datasource_type: Datasource Type
+    :return: (files settings, reader options)
+    """
+    datasource = (config.get('datasources') or {}).get(section_name) or {}
+    files_settings = fio.get_files_settings(datasource, datasource_type)
+    read_options = dict(datasource.get('read_options') or {})
+    if get_dtype_backend(config) != 'numpy' and 'dtype_backend' not in read_options:
+        read_options['dtype_backend'] = get_dtype_backend(config)
+    return files_settings, read_options
+
+# Read options of the JSON datasources that are used by microETL (and not passed to pandas.read_json)
+json_read_options = ['json_path', 'parser', 'chunk_size']
+
+# Function that reads a list of JSON files and yields DataFrames of (at most) chunk_size records:
+# ndjson files are parsed one line at the time and, for json files, the items selected by the
+# json_path read option are streamed. Without json_path, each json file is parsed whole by pandas
+def iter_json_data(files, datasource_type: str, read_options, chunk_size: int):
+    """
+    Read JSON data in chunks
+    :param files: List of file names
+    :param datasource_type: Datasource Type (json or ndjson)
+    :param read_options: Datasource read options
+    :param chunk_size: Number of records per chunk
+    :return: Generator of DataFrames
+    """
+    parser = read_options.get('parser', 'auto')
+    if datasource_type == 'ndjson':
+        chunks = fio.iter_ndjson_records(files, chunk_size, parser)
+    elif read_options.get('json_path') != None:
+        chunks = fio.iter_json_records(files, chunk_size, read_options.get('json_path'), parser)
+    else:
+        pandas_options = {key: value for key, value in read_options.items() if key not in json_read_options}
+        for filename in files:
+            frame = pd.read_json(filename, **fio.with_compression(filename, pandas_options))
+            for start in range(0, len(frame), chunk_size):
+                yield frame.iloc[start:start + chunk_size]
+        return
+    for records in chunks:
+        yield apply_dtype_backend(pd.DataFrame.from_records(records), read_options.get('dtype_backend', 'numpy'))
+
+# Default maximum size of the cache of the parsed Excel files
+default_file_cache_size = '1GB'
+
+# Function that returns the cache settings of a file-based datasource, from its cache key (true, or
+# a dictionary with the cache path, by default <base_path>/.cache, and its max_size). Returns None
+# when the datasource is not cached
+def get_file_cache_settings(config, section_name: str):
+    """
+    Get the File cache settings of a datasource
+    :param config: Configuration
+    :param section_name: Section Name
+    :return: Cache settings ({'path': cache directory, 'max_size': bytes}) or None
+    """
+    datasource = (config.get('datasources') or {}).get(section_name) or {}
+    cache = datasource.get('cache')
+    if cache == None or cache == False:
+        return None
+    if not isinstance(cache, dict):
+        cache = {}
+    if cache.get('enabled', True) == False:
+        return None
+    if pa == None:
+        logging.warning("pyarrow is not installed, the " + section_name + " datasource is not cached")
+        return None
+    default_path = os.path.join(str((config.get('paths') or {}).get('base_path') or '.'), '.cache')
+    return {
+        'path': str(cache.get('path', default_path)),
+        'max_size': parse_size(cache.get('max_size', default_file_cache_size)),
+    }
+
+# Function that returns the read mode of a raw file datasource (see fileio.file_read_modes)
+def get_file_read_mode(read_options):
+    """
+    Get the Read mode of a raw file datasource
+    :param read_options: Datasource read options
+    :return: Read mode (text, mmap or lines)
+    """
+    read_mode = str(read_options.get('read_mode', 'text')).lower().strip()
+    if read_mode not in fio.file_read_modes:
+        raise ValueError("Invalid file read mode: " + read_mode)
+    return read_mode
+
+# Filter operators that can be pushed down to the columnar readers (row group pruning). ne and
+# not in are not pushed down, as they match missing values in pandas but not in Arrow
+pushdown_filter_operators = {
+    'eq': '==',
+    'gt': '>',
+    'ge': '>=',
+    'lt': '<',
+    'le': '<=',
+    'in': 'in',
+}
+
+# Function that returns the filters (column, operator, value) of a filter step that can be pushed
+# down to the reader: the predicates of its and groups (or groups cannot be pushed down)
+def get_filter_pushdown(parameters):
+    """
+    Get the pushdown Filters of a Filter step
+    :param parameters: Filter step parameters
+    :return: List of (column, operator, value) filters
+    """
+    filters = []
+    if str(parameters.get('filter_logic', 'and')).lower().strip() != 'and':
+        return filters
+    filter_parameters = parameters.get('filter_parameters') or []
+    if isinstance(filter_parameters, dict):
+        filter_parameters = list(filter_parameters.values())
+    for filter_parameter in filter_parameters:
+        if filter_parameter.get('filter_parameters') != None:
+            filters.extend(get_filter_pushdown(filter_parameter))
+            continue
+        operator = str(filter_parameter.get('filter_parameter_operator')).lower().strip()
+        value = filter_parameter.get('filter_parameter_value')
+        if operator not in pushdown_filter_operators or value is None:
+            continue
+        if operator == 'in' and (not isinstance(value, list) or None in value):
+            continue
+        filters.append((filter_parameter.get('filter_parameter_name'), pushdown_filter_operators[operator], value))
+    return filters
+
+# Function that returns the columns a transform step reads (None if they cannot be known) and
+# True if the step output only has columns derived from them (e.g. aggregate and pivot)
+def get_step_columns(transform_type: str, parameters):
+    """
+    Get the Columns used by a Transform step
+    :param transform_type: Transform type
+    :param parameters: Transform step parameters
+    :return: (list of columns or None, True if the step projects its input)
+    """
+    if transform_type == 'filter':
+        if parameters.get('filter_expression') != None:
+            return None, False
+        columns = []
+        groups = [parameters]
+        while len(groups) > 0:
+            filter_parameters = groups.pop().get('filter_parameters') or []
+            if isinstance(filter_parameters, dict):
+                filter_parameters = list(filter_parameters.values())
+            for filter_parameter in filter_parameters:
+                if filter_parameter.get('filter_parameters') != None:
+                    groups.append(filter_parameter)
+                else:
+                    columns.append(filter_parameter.get('filter_parameter_name'))
+        return columns, False
+    elif transform_type == 'sort':
+        return [column for column, ascending in get_sort_keys(parameters.get('sort_parameters') or {})], False
+    elif transform_type == 'limit':
+        return [], False
+    elif transform_type == 'join':
+        join_parameters = parameters.get('join_parameters') or {}
+        keys = join_parameters.get('join_left_keys', join_parameters.get('join_keys'))
+        if join_parameters.get('join_datasource') == None or keys == None:
+            return None, False
+        return keys if isinstance(keys, list) else [keys], False
+    elif transform_type == 'aggregate':
+        aggregate_parameters = parameters.get('aggregate_parameters') or {}
+        group_by = aggregate_parameters.get('aggregate_group_by')
+        if group_by == None and aggregate_parameters.get('aggregate_parameter') != None:
+            group_by = aggregate_parameters.get('aggregate_parameter').get('aggregate_parameter_group_by')
+        if group_by == None:
+            return None, False
+        columns = group_by if isinstance(group_by, list) else [group_by]
+        return columns + [name for output, name, function in get_aggregations(aggregate_parameters) if name != None], True
+    elif transform_type == 'pivot':
+        pivot_parameter = (parameters.get('pivot_parameters') or {}).get('pivot_parameter') or {}
+        columns = []
+        for key in ['pivot_parameter_index', 'pivot_parameter_name', 'pivot_parameter_values']:
+            value = pivot_parameter.get(key)
+            if value == None:
+                return None, False
+            columns.extend(value if isinstance(value, list) else [value])
+        return columns, True
+    return None, False
+
+# Function that returns what can be pushed down to the reader of the source of a job: the columns
+# referenced by the transform sequence (only when they can all be known and a step, like aggregate,
+# drops all the other columns) and the filters of the filter steps at the start of the sequence
+def get_source_pushdown(config):
+    """
+    Get the Source pushdown of a job
+    :param config: Configuration
+    :return: Dictionary with columns (None for all the columns) and filters
+    """
+    pushdown = { 'columns': None, 'filters': [] }
+    actions = config.get('actions') or {}
+    # Source actions can change the data, so nothing can be pushed down past them
+    if (actions.get('source') or {}).get('type') != None:
+        return pushdown
+    transform_sequence = (actions.get('transform') or {}).get('sequence') or []
+
+    steps = []
+    for transform in transform_sequence:
+        transform_type = str(transform.get('type', '')).lower().strip()
+        steps.append((transform_type, process_config_parameters(config, config.get('paths', {}).get('inp_path'), transform_type, transform.get('parameters')) or {}))
+
+    # Filters of the filter steps at the start of the sequence
+    for transform_type, parameters in steps:
+        if transform_type != 'filter':
+            break
+        pushdown['filters'].extend(get_filter_pushdown(parameters))
+
+    # Columns referenced up to the first step that projects its input
+    columns = []
+    for transform_type, parameters in steps:
+        step_columns, projects = get_step_columns(transform_type, parameters)
+        if step_columns == None:
+            return pushdown
+        columns.extend([column for column in step_columns if column not in columns])
+        if projects:
+            pushdown['columns'] = columns
+            break
+    return pushdown
+
+# Function that returns the columns and filters to push down to the reader of a columnar datasource.
+# Columns and filters in the datasource read_options take precedence over the ones of the transform sequence
+def get_columnar_pushdown(config, section_name: str, read_options):
+    """
+    Get the pushdown of a Columnar datasource
+    :param config: Configuration
+    :param section_name: Section Name
+    :param read_options: Datasource read options
+    :return: Dictionary with columns (None for all the columns) and filters
+    """
+    pushdown = { 'columns': None, 'filters': [] }
+    if section_name == 'source':
+        pushdown = get_source_pushdown(config)
+    if read_options.get('columns') != None:
+        pushdown['columns'] = read_options.get('columns')
+    if read_options.get('filters') != None:
+        pushdown['filters'] = [tuple(item) for item in read_options.get('filters')]
+    return pushdown
+
+# Function that reads columnar files with the pushdown columns and filters. If the filters cannot be
+# applied by the reader (e.g. a value type does not match the column type) the files are read without
+# them (filter steps always run on the data anyway)
+def read_columnar_data(files, datasource_type: str, pushdown):
+    """
+    Read Columnar Data
+    :param files: List of file names
+    :param datasource_type: Datasource Type (parquet or feather)
+    :param pushdown: Dictionary with columns and filters
+    :return: Arrow Table
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read " + str(datasource_type) + " files")
+    try:
+        return fio.read_columnar_files(files, datasource_type, pushdown['columns'], pushdown['filters'])
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+        if len(pushdown['filters']) == 0:
+            raise
+        logging.warning("Cannot push down filters " + str(pushdown['filters']) + " to the reader: " + str(e))
+        return fio.read_columnar_files(files, datasource_type, pushdown['columns'])
+
+# Function that reads columnar files, with the pushdown columns and filters, in chunks of (at most)
+# chunk_size records each. As for read_columnar_data, if the filters cannot be applied by the reader
+# the files are read without them (the filters are bound before the first chunk is read)
+def iter_columnar_data(files, datasource_type: str, chunk_size: int, pushdown):
+    """
+    Read Columnar Data in chunks
+    :param files: List of file names
+    :param datasource_type: Datasource Type (parquet or feather)
+    :param chunk_size: Number of records per chunk
+    :param pushdown: Dictionary with columns and filters
+    :return: Generator of Arrow Tables
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read " + str(datasource_type) + " files")
+    chunks = 0
+    try:
+        for chunk in fio.iter_columnar_chunks(files, datasource_type, chunk_size, pushdown['columns'], pushdown['filters']):
+            chunks += 1
+            yield chunk
+        return
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+        if len(pushdown['filters']) == 0 or chunks > 0:
+            raise
+        logging.warning("Cannot push down filters " + str(pushdown['filters']) + " to the reader: " + str(e))
+    for chunk in fio.iter_columnar_chunks(files, datasource_type, chunk_size, pushdown['columns']):
+        yield chunk
+
+# Function that splits a data object in batches of (at most) batch_size records each
+def iter_data_batches(data, batch_size: int = default_batch_size):
+    """
+    Split the Data in batches
+    :param data: Data (a DataFrame, a list or any other object)
+    :param batch_size: Number of records per batch
+    :return: Generator of data batches
+    """
+    if data is None:
+        return
+    if pa != None and isinstance(data, pa.Table):
+        for start in range(0, data.num_rows, batch_size):
+            yield data.slice(start, batch_size)
+    elif isinstance(data, (pd.DataFrame, list)):
+        for start in range(0, len(data), batch_size):
+            if isinstance(data, pd.DataFrame):
+                yield data.iloc[start:start + batch_size]
+            else:
+                yield data[start:start + batch_size]
+    else:
+        # Objects that have no notion of records are a single batch:
+        yield data
+
+# Function that returns the number of records in a data object (None if the data
+# object has no notion of records)
+def count_records(data):
+    """
+    Count the records in the Data
+    :param data: Data
+    :return: Number of records (or None)
+    """
+    if isinstance(data, (pd.DataFrame, list)):
+        return len(data)
+    if pa != None and isinstance(data, pa.Table):
+        return data.num_rows
+    return None
+
+# Function that adds a number of records to a running total (either can be None)
+def add_record_count(total, count):
+    """
+    Add a number of records to a total
+    :param total: Running total (or None)
+    :param count: Number of records (or None)
+    :return: New total (or None if no count is known)
+    """
+    if count is None:
+        return total
+    if total is None:
+        return count
+    return total + count
+
+# Function that merges a list of data batches back into a single data object
+def concat_data_batches(batches):
+    """
+    Concatenate the data batches
+    :param batches: List of data batches
+    :return: Data
+    """
+    batches = [batch for batch in batches if batch is not None]
+    if len(batches) == 0:
+        return None
+    if all(isinstance(batch, pd.DataFrame) for batch in batches):
+        return pd.concat(batches, ignore_index=True)
+    if pa != None and all(isinstance(batch, pa.Table) for batch in batches):
+        return pa.concat_tables(batches, promote_options='default')
+    if all(isinstance(batch, list) for batch in batches):
+        return [item for batch in batches for item in batch]
+    if all(isinstance(batch, str) for batch in batches):
+        return ''.join(batches)
+    if len(batches) == 1:
+        return batches[0]
+    raise ValueError("Cannot concatenate data batches of type: " + str(set(type(batch).__name__ for batch in batches)))
+
+# Function that converts an Arrow table into a DataFrame with Arrow backed data types (the
+# columns keep pointing to the Arrow buffers, so the data is not copied)
+def arrow_to_dataframe(table):
+    """
+    Convert an Arrow Table to a DataFrame
+    :param table: Arrow Table
+    :return: DataFrame (with Arrow backed data types)
+    """
+    if table is None:
+        return None
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+# Function that converts a data object (a DataFrame, an Arrow table or a list of records) into an
+# Arrow table. DataFrames with Arrow backed data types are converted without copying the data
+def to_arrow_table(data):
+    """
+    Convert the Data to an Arrow Table
+    :param data: Data
+    :return: Arrow Table
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to convert data to Arrow tables")
+    if isinstance(data, pa.Table):
+        return data
+    if isinstance(data, pd.DataFrame):
+        return pa.Table.from_pandas(data, preserve_index=False)
+    if isinstance(data, list):
+        return pa.Table.from_pylist([dict(record) for record in data])
+    raise ValueError("Cannot convert data of type " + type(data).__name__ + " to an Arrow table")
+
+# Function that converts a data object to the data types backend used by the job (see
+# get_dtype_backend). Data objects that are not records (like strings) are returned as they are
+def apply_dtype_backend(data, dtype_backend: str = 'numpy'):
+    """
+    Apply the Data types backend to the Data
+    :param data: Data
+    :param dtype_backend: Data types backend (numpy, numpy_nullable or pyarrow)
+    :return: Data
+    """
+    if pa != None and isinstance(data, pa.Table):
+        if dtype_backend == 'pyarrow':
+            return arrow_to_dataframe(data)
+        data = data.to_pandas(ignore_metadata=True)
+    if dtype_backend == 'numpy':
+        return data
+    if isinstance(data, list) and len(data) > 0 and all(isinstance(record, dict) for record in data):
+        if dtype_backend == 'pyarrow':
+            return arrow_to_dataframe(to_arrow_table(data))
+        data = pd.DataFrame.from_records(data)
+    if isinstance(data, pd.DataFrame):
+        if dtype_backend == 'pyarrow' and all(isinstance(dtype, pd.ArrowDtype) for dtype in data.dtypes):
+            return data
+        return data.convert_dtypes(dtype_backend=dtype_backend)
+    return data
+
 # Function that reads a generic data file:
 def read_data_from_file(filename: str = 'data.txt'):
     """
@@ -276,7 +1001,7 @@ def read_data_from_file(filename: str = 'data.txt'):
     try:
         if debug_level > 0:
             print("Reading data from raw data file: " + filename + " ... ")
-        with open(filename, 'r') as file:
+        with fio.open_file(filename, 'rt') as file:
             data = file.read()
         return data
     except Exception as e:
@@ -307,6 +1032,50 @@ def read_data_from_api(config, section_name):
         logging.error(err_msg[0].format(traceback.format_exc()))
         sys.exit(1)
 
+# Function that takes microETL config and a section name and returns the query (and its parameters)
+# to run against a database
+def prepare_db_query(config, inp_path, section_name: str = 'source'):
+    """
+    Prepare the query to run against a database
+    :param config: Configuration
+    :param inp_path: Input Data Path
+    :param section_name: Section Name
+    :return: Query and Query Parameters
+    """
+    # Get the query to run
+    query = config.get('actions').get(section_name).get('template')
+    if query == None or query == '':
+        query = config.get('actions').get(section_name).get('query')
+    else:
+        query = read_sql_query(os.path.join(inp_path, query))
+
+    if query == None or query == '':
+        raise ValueError("Invalid query: '" + str(query) + "' for section: " + section_name + ". template cannot be empty!")
+
+    # Get the query parameters
+    query_params = config.get('actions').get(section_name).get('query_params')
+    if query_params == None or query_params == '':
+        query_params = config.get('actions').get(section_name).get('query_parameters')
+    if query_params == None or query_params == '':
+        query_params = config.get('actions').get(section_name).get('parameters')
+    if query_params == None or query_params == '':
+        query_params = config.get('actions').get(section_name).get('params')
+
+    if debug_level > 1:
+        print("-- Query params (in prepare_db_query): ")
+        print(query_params)
+        print("--")
+
+    # Process query and parameters
+    query, query_params = replace_sql_parameters(config, inp_path, query, section_name, query_params)
+
+    if debug_level > 1:
+        print("-- Query processed (in prepare_db_query): ")
+        print(query)
+        print("--")
+
+    return query, query_params
+
 # Function that takes microETL config, a datasource type and returns data from a database
 # and uses dbc to connect to the database and execute queries
 def get_data_from_db(config, inp_path, datasource_type: str = 'postgres', section_name: str = 'source'):
@@ -324,41 +1093,12 @@ def get_data_from_db(config, inp_path, datasource_type: str = 'postgres', sectio
         if ds_type == 'sql':
             raise ValueError(datasource_type + " is not a valid datasource type")
         
-        # Get the query to run
-        query = config.get('actions').get(section_name).get('template')
-        if query == None or query == '':
-            query = config.get('actions').get(section_name).get('query')
-        else:
-            query = read_sql_query(os.path.join(inp_path, query))
-
-        if query == None or query == '':
-            raise ValueError("Invalid query: '" + str(query) + "' for section: " + section_name + ". template cannot be empty!")
-
-        # Get the query parameters
-        query_params = config.get('actions').get(section_name).get('query_params')
-        if query_params == None or query_params == '':
-            query_params = config.get('actions').get(section_name).get('query_parameters')
-        if query_params == None or query_params == '':
-            query_params = config.get('actions').get(section_name).get('parameters')
-        if query_params == None or query_params == '':
-            query_params = config.get('actions').get(section_name).get('params')
-
-        if debug_level > 1:
-            print("-- Query params (in read_data_from_db): ")
-            print(query_params)
-            print("--")
-
-        # Process query and parameters
-        query, query_params = replace_sql_parameters(config, inp_path, query, section_name, query_params)
-
-        if debug_level > 1:
-            print("-- Query processed (in read_data_from_db): ")
-            print(query)
-            print("--")
+        # Get the query to run and its parameters
+        query, query_params = prepare_db_query(config, inp_path, section_name)
         
         if query != None and query != '':
             # Get the database connection
-            conn = dbc.get_db_connection(config, section_name)
+            conn = acquire_db_connection(config, section_name)
 
             # Get the Cursor
             cur = dbc.get_db_cursor(conn, ds_type)
@@ -374,6 +1114,8 @@ def get_data_from_db(config, inp_path, datasource_type: str = 'postgres', sectio
             # Execute the query
             if action_type == 'sql_to_dataframe':
                 data = dbc.execute_db_query_return_dataframe(conn, cur, query, ds_type, query_params)
+            elif action_type == 'sql_to_arrow':
+                data = arrow_to_dataframe(dbc.execute_db_query_return_arrow(conn, cur, query, ds_type, query_params))
             elif action_type == 'sql_to_results':
                 data = dbc.execute_db_query_return_results(conn, cur, query, ds_type, query_params)
             elif action_type == 'sql_to_json':
@@ -384,8 +1126,8 @@ def get_data_from_db(config, inp_path, datasource_type: str = 'postgres', sectio
             # Close the cursor
             dbc.close_db_cursor(cur, ds_type)
 
-            # Close the connection
-            dbc.close_db_connection(conn, ds_type)
+            # Close the connection (unless it is pooled)
+            release_db_connection(config, conn, ds_type)
 
             return data
         else:
@@ -395,6 +1137,83 @@ def get_data_from_db(config, inp_path, datasource_type: str = 'postgres', sectio
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Function that takes microETL config, a datasource type and yields data from a database
+# as DataFrames of (at most) batch_size records each
+def get_data_batches_from_db(config, inp_path, datasource_type: str = 'postgres', section_name: str = 'source', batch_size: int = default_batch_size, arrow: bool = False):
+    """
+    Read data from a database in batches
+    :param config: Configuration
+    :param inp_path: Input Data Path
+    :param datasource_type: Datasource Type
+    :param section_name: Section Name
+    :param batch_size: Number of records per batch
+    :param arrow: True to fetch the batches as Arrow tables (returned as Arrow backed DataFrames)
+    :return: Generator of DataFrames
+    """
+    # Get the datasource type
+    ds_type = datasource_type.lower().strip()
+    if ds_type == 'sql':
+        raise ValueError(datasource_type + " is not a valid datasource type")
+
+    # Get the query to run and its parameters
+    query, query_params = prepare_db_query(config, inp_path, section_name)
+
+    # Get the database connection and the Cursor
+    conn = acquire_db_connection(config, section_name)
+    cur = dbc.get_db_cursor(conn, ds_type)
+    try:
+        if arrow:
+            for batch in dbc.execute_db_query_return_arrow_batches(conn, cur, query, ds_type, query_params, batch_size):
+                yield arrow_to_dataframe(batch)
+        else:
+            for batch in dbc.execute_db_query_return_batches(conn, cur, query, ds_type, query_params, batch_size):
+                yield batch
+    finally:
+        # Close the cursor and the connection (unless it is pooled)
+        dbc.close_db_cursor(cur, ds_type)
+        release_db_connection(config, conn, ds_type)
+
+# Function that returns a connection to the database of a datasource. When the job configuration has
+# a connection pool (connection_pool, e.g. in watch mode) the connection is opened once and reused by
+# all the runs of the job, until close_connection_pool is called
+def acquire_db_connection(config, section_name: str = 'source'):
+    """
+    Acquire a Database connection
+    :param config: Configuration
+    :param section_name: Section Name
+    :return: Database Connection Object
+    """
+    pool = config.get('connection_pool')
+    if pool == None:
+        return dbc.get_db_connection(config, section_name)
+    if pool.get(section_name) == None:
+        pool[section_name] = dbc.get_db_connection(config, section_name)
+    return pool.get(section_name)
+
+# Function that releases a database connection (see acquire_db_connection): pooled connections are
+# kept open, all the others are closed
+def release_db_connection(config, conn, ds_type: str):
+    """
+    Release a Database connection
+    :param config: Configuration
+    :param conn: Database Connection Object
+    :param ds_type: Datasource Type
+    :return: None
+    """
+    if config.get('connection_pool') == None or conn not in config.get('connection_pool').values():
+        dbc.close_db_connection(conn, ds_type)
+
+# Function that closes the pooled connections of a job (see acquire_db_connection)
+def close_connection_pool(config):
+    """
+    Close the Connection pool of a job
+    :param config: Configuration
+    :return: None
+    """
+    for section_name, conn in (config.pop('connection_pool', None) or {}).items():
+        datasource = (config.get('datasources') or {}).get(section_name) or {}
+        dbc.close_db_connection(conn, datasource.get('type') or datasource.get('db_type'))
+
 # Function to read an SQL Query file and return the Query
 def read_sql_query(sql_query_file):
     """
@@ -446,7 +1265,7 @@ def replace_sql_parameters(config, inp_path, sql_query, section_name, parameters
             print("--")
 
         if parameters is None or parameters == []:
-            return sql_query
+            return sql_query, None
 
         # Create a dictionary of parameters
         pyval_prefix = 'pyval('
@@ -493,6 +1312,38 @@ def replace_sql_parameters(config, inp_path, sql_query, section_name, parameters
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Regular expressions of a single template expression and of the numbers it can be converted to
+single_expression_re = re.compile(r'\s*\{\{((?!\}\}).)*\}\}\s*', re.DOTALL)
+int_value_re = re.compile(r'[-+]?(0|[1-9][0-9]*)')
+float_value_re = re.compile(r'[-+]?(0|[1-9][0-9]*)(\.[0-9]+([eE][-+]?[0-9]+)?|[eE][-+]?[0-9]+)')
+
+# Function that renders the (string) values of the actions parameters as Jinja2 templates.
+# Only the strings that contain a template are rendered, so all the other values keep their type.
+# A rendered value stays a string, unless the whole value is a single expression that renders
+# to an int or a float (e.g. '{{ LIMIT }}' or '{{ LIMIT | int }}')
+def render_config_parameters(parameters, variables):
+    """
+    Render the Configuration Parameters
+    :param parameters: Parameters (a string, a list or a dictionary)
+    :param variables: Variables to render the templates with
+    :return: Rendered Parameters
+    """
+    if isinstance(parameters, str):
+        if '{{' in parameters or '{%' in parameters:
+            rendered = params_env.from_string(parameters).render(variables)
+            if single_expression_re.fullmatch(parameters):
+                if int_value_re.fullmatch(rendered.strip()):
+                    return int(rendered)
+                if float_value_re.fullmatch(rendered.strip()):
+                    return float(rendered)
+            return rendered
+        return parameters
+    if isinstance(parameters, dict):
+        return {key: render_config_parameters(value, variables) for key, value in parameters.items()}
+    if isinstance(parameters, list):
+        return [render_config_parameters(value, variables) for value in parameters]
+    return parameters
+
 # Function that takes a configuration and a dictionary of parameters and returns a configuration with the parameters replaced or added
 def process_config_parameters(config, inp_path, section_name, parameters):
     """
@@ -505,21 +1356,23 @@ def process_config_parameters(config, inp_path, section_name, parameters):
     try:
         tmp_pars = parameters
         if parameters != None:
-            # Loop through the parameters
-            for parameter in parameters:
-                if parameter.get('name').lower().strip() == 'parameters_file' or parameter.get('name').lower().strip() == 'file':
-                    if parameter.get('value') != None:
-                        par_filename = os.path.join(inp_path,  parameter['value']) 
-                        with open(par_filename, 'r') as par_file:
-                            par_data = yaml.safe_load(par_file)
-                            parameters.update(par_data)
-        
-            # Create a Jinja2 Environment
-            env = Environment(undefined=Undefined)
-            # Create a Jinja2 Template
-            template = env.from_string(str(parameters))
-            # Render the Template
-            tmp_pars = yaml.safe_load(template.render(os.environ))
+            # Add the parameters from the parameters files (if any)
+            if isinstance(parameters, list):
+                for parameter in parameters:
+                    if not isinstance(parameter, dict) or parameter.get('name') == None:
+                        continue
+                    if parameter.get('name').lower().strip() == 'parameters_file' or parameter.get('name').lower().strip() == 'file':
+                        if parameter.get('value') != None:
+                            par_filename = os.path.join(str(inp_path or ''), parameter['value'])
+                            with open(par_filename, 'r') as par_file:
+                                par_data = yaml.safe_load(par_file)
+                            if isinstance(par_data, dict):
+                                par_data = [{'name': key, 'value': value} for key, value in par_data.items()]
+                            if isinstance(par_data, list):
+                                tmp_pars = tmp_pars + par_data
+
+            # Render the parameters templates
+            tmp_pars = render_config_parameters(tmp_pars, os.environ)
 
         if debug_level > 1:
             print("-- Processed parameters (in process_config_parameters): ")
@@ -532,6 +1385,106 @@ def process_config_parameters(config, inp_path, section_name, parameters):
         logging.error(err_msg[0].format(traceback.format_exc()))
         return parameters
 
+# Function that returns the data it receives (used for actions that do not change the data)
+def pass_through(data):
+    """
+    Return the Data unchanged
+    :param data: Data
+    :return: Data
+    """
+    return data
+
+# Function that reads the JSON Schema of a dsl/jq action (if any)
+def read_action_schema(action):
+    """
+    Read the JSON Schema of an action
+    :param action: Action (a specific section of the job config)
+    :return: JSON Schema (or None)
+    """
+    json_schema = read_file(os.path.join(process_pyexpr(action.get("schema_path", '')), action.get("schema", '')))
+    if json_schema != None and json_schema.strip() != '':
+        return json.loads(json_schema)
+    return None
+
+# Source action types of the database datasources: their query runs when the datasource is read (see
+# get_data_from_db and get_data_batches_from_db), so their step does not change the data
+db_source_action_types = ['sql_to_dataframe', 'sql_to_arrow', 'sql_to_results', 'sql_to_json']
+
+# Function that takes a configuration and an action and returns a function that processes a data unit
+# according to the action. Everything that does not depend on the data (the parameters, SQL files,
+# DSL/jq templates and JSON schemas) is resolved here, once, so the returned function can be called
+# many times (for example once per batch) without parsing anything again
+def compile_step(config, inp_path, sect_name, action):
+    """
+    Compile an Action into a step function
+    :param config: Configuration
+    :param inp_path: Input Path
+    :param sect_name: Section Name (within the action) of the config where to find the parameters
+    :param action: Action (a specific section of the job config)
+    :return: Function that takes the Data and returns the Processed Data
+    """
+    # Get the Action Type
+    if action == None or action.get('type') == None:
+        return pass_through
+    action_type = action.get('type').lower().strip()
+    if action_type in db_source_action_types:
+        return pass_through
+
+    # Get the Action Parameters
+    parameters = process_config_parameters(config, inp_path, sect_name, action.get('parameters'))
+
+    # Compile the Action
+    if action_type == 'filter':
+        return compile_filter(parameters)
+    elif action_type == 'aggregate':
+        return compile_aggregate(parameters)
+    elif action_type == 'sort':
+        return compile_sort(parameters)
+    elif action_type == 'limit':
+        limit_value = get_limit_value(parameters)
+        return lambda data: data.head(limit_value)
+    elif action_type == 'pivot':
+        return functools.partial(pivot_data, parameters=parameters)
+    elif action_type == 'join':
+        return compile_join(config, parameters)
+    elif action_type == 'write':
+        def write_step(data):
+            # In a pipeline run, the data is written to the writers of the run (see get_run_writer)
+            writer = get_run_writer(config, action.get('location'))
+            if writer != None:
+                write_destination_batch(writer, data)
+            else:
+                write_data_to_ds(config, action.get('location'), data, parameters)
+            return data
+        return write_step
+    elif action_type == 'read':
+        return lambda data: read_data_from_ds(config, action.get('location'), sect_name)
+    elif action_type == 'sql':
+        query, query_params = replace_sql_parameters(config, inp_path, read_sql_query(parameters.get('sql_query_file')), sect_name, parameters)
+        return lambda data: read_data_from_db(config, query, query_params)
+    elif action_type == 'dsl':
+        mapping = parse_dsl_mapping(read_file(os.path.join(process_pyexpr(action.get("template_path", '')), action.get("template"))))
+        json_schema = read_action_schema(action)
+        return lambda data: transform_data_json_to_json(data, mapping, json_schema)
+    elif action_type == 'jq':
+        mapping = read_file(os.path.join(process_pyexpr(action.get("template_path", '')), action.get("template")))
+        if mapping != None:
+            mapping = pyjq.compile(mapping)
+        json_schema = read_action_schema(action)
+        return lambda data: transform_data_json_to_json_pyjq(data, mapping, json_schema)
+    elif action_type == 'print':
+        def print_step(data):
+            print("-- Data (in process_data):")
+            print(data)
+            print("--")
+            return data
+        return print_step
+    elif action_type == 'api':
+        return lambda data: read_data_from_api(config, parameters.get('input_data_path'))
+    else:
+        logging.error(err_msg[14] + "Invalid action type: " + str(action_type))
+        return pass_through
+
 # Function that takes a configuration and a data unit and processes it according to the configuration
 def process_data(config, inp_path, sect_name, action, data):
     """
@@ -544,56 +1497,173 @@ def process_data(config, inp_path, sect_name, action, data):
     :return: Processed Data
     """
     try:
-        # Get the Actions
-        #actions = config.get('actions').get(sect_name)
-        # Get the Action Type
-        action_type = action.get('type').lower().strip()
-        if action_type == None:
-            return data
-        
-        # Get the Action Parameters
-        parameters = action.get('parameters')
-        # Get the Action Parameters
-        parameters = process_config_parameters(config, inp_path, sect_name, parameters)
-
-        # Process the Action
-        if action_type == 'filter':
-            data = filter_data(data, parameters)
-        elif action_type == 'aggregate':
-            data = aggregate_data(data, parameters)
-        elif action_type == 'sort':
-            data = sort_data(data, parameters)
-        elif action_type == 'pivot':
-            data = pivot_data(data, parameters)
-        elif action_type == 'join':
-            data = join_data(data, parameters)
-        elif action_type == 'write':
-            write_data_to_ds(config, action.get('location'), data, parameters)
-        elif action_type == 'read':
-            data = read_data_from_ds(config, action.get('location'), sect_name)
-        elif action_type == 'sql':
-            query, query_params = replace_sql_parameters(config, inp_path, read_sql_query(parameters.get('sql_query_file')), sect_name, parameters)
-            data = read_data_from_db(config, query, query_params)
-        elif action_type == 'dsl':
-            data = transform_data_json_to_json(data, read_file(os.path.join(process_pyexpr(action.get("template_path", '')), action.get("template"))), read_file(os.path.join(process_pyexpr(action.get("schema_path", '')), action.get("schema", ''))))
-        elif action_type == 'jq':
-            data = transform_data_json_to_json_pyjq(data, read_file(os.path.join(process_pyexpr(action.get("template_path", '')), action.get("template"))), read_file(os.path.join(process_pyexpr(action.get("schema_path", '')), action.get("schema", ''))))
-        elif action_type == 'print':
-            print("-- Data (in process_data):")
-            print(data)
-            print("--")
-        elif action_type == 'api':
-            data = read_data_from_api(config, parameters.get('input_data_path'))
-        else:
-            logging.error(err_msg[14] + "Invalid action type: " + str(action_type))
-            return data
-        
-        return data
+        # Compile the Action and process the Data
+        return compile_step(config, inp_path, sect_name, action)(data)
     except Exception as e:
         logging.error(err_msg[12] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Filter operators that DataFrame.eval can evaluate (and so numexpr, when available)
+filter_eval_operators = {
+    'eq': '==',
+    'ne': '!=',
+    'gt': '>',
+    'ge': '>=',
+    'lt': '<',
+    'le': '<=',
+    'in': 'in',
+    'not in': 'not in',
+}
+
+# Function that returns the boolean mask of a single filter predicate
+def filter_predicate_mask(data, name, operator, value):
+    """
+    Evaluate a Filter predicate
+    :param data: Data (a DataFrame)
+    :param name: Column name
+    :param operator: Filter operator
+    :param value: Filter value
+    :return: Boolean mask (numpy array)
+    """
+    column = data[name]
+    if operator == 'eq':
+        mask = column == value
+    elif operator == 'ne':
+        mask = column != value
+    elif operator == 'gt':
+        mask = column > value
+    elif operator == 'ge':
+        mask = column >= value
+    elif operator == 'lt':
+        mask = column < value
+    elif operator == 'le':
+        mask = column <= value
+    elif operator == 'in':
+        mask = column.isin(value)
+    elif operator == 'not in':
+        mask = ~column.isin(value)
+    elif operator == 'contains':
+        mask = column.str.contains(value, na=False)
+    elif operator == 'not contains':
+        mask = ~column.str.contains(value, na=True)
+    elif operator == 'startswith':
+        mask = column.str.startswith(value, na=False)
+    elif operator == 'endswith':
+        mask = column.str.endswith(value, na=False)
+    else:
+        raise ValueError("Invalid filter operator: " + str(operator))
+    # Nullable (and Arrow backed) columns return missing values for missing data,
+    # which do not match the predicate
+    if pd.api.types.is_extension_array_dtype(mask.dtype):
+        return mask.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(mask, dtype=bool)
+
+# Function that compiles a group of filter predicates (the filter_parameters of a filter step, or
+# a nested group) into a list of terms. Each term is a function that takes the data and returns a
+# boolean mask, the group mask is the AND (or the OR) of all its terms
+def compile_filter_group(parameters):
+    """
+    Compile a group of Filter predicates
+    :param parameters: Group parameters (filter_parameters and filter_logic)
+    :return: (group logic, list of terms)
+    """
+    logic = str(parameters.get('filter_logic', 'and')).lower().strip()
+    if logic not in ['and', 'or']:
+        raise ValueError("Invalid filter logic: " + logic)
+
+    filter_parameters = parameters.get('filter_parameters')
+    if filter_parameters == None:
+        filter_parameters = []
+    elif isinstance(filter_parameters, dict):
+        filter_parameters = list(filter_parameters.values())
+
+    terms = []
+    eval_predicates = []
+    for filter_parameter in filter_parameters:
+        if filter_parameter.get('filter_parameters') != None:
+            # Nested group of predicates
+            terms.append(functools.partial(filter_group_mask, *compile_filter_group(filter_parameter)))
+            continue
+        # Get the Filter Parameter Name, Value and Operator
+        filter_parameter_name = filter_parameter.get('filter_parameter_name')
+        filter_parameter_value = filter_parameter.get('filter_parameter_value')
+        filter_parameter_operator = str(filter_parameter.get('filter_parameter_operator')).lower().strip()
+        if numexpr != None and filter_parameter_operator in filter_eval_operators:
+            eval_predicates.append((filter_parameter_name, filter_parameter_operator, filter_parameter_value))
+        else:
+            # Check the operator now rather than on the first batch of data
+            if filter_parameter_operator not in filter_eval_operators and filter_parameter_operator not in ['contains', 'not contains', 'startswith', 'endswith']:
+                raise ValueError("Invalid filter operator: " + filter_parameter_operator)
+            terms.append(functools.partial(filter_predicate_mask, name=filter_parameter_name, operator=filter_parameter_operator, value=filter_parameter_value))
+
+    # All the predicates DataFrame.eval can evaluate are fused in a single expression
+    if len(eval_predicates) > 0:
+        local_dict = {}
+        expressions = []
+        for idx, (name, operator, value) in enumerate(eval_predicates):
+            local_dict['v' + str(idx)] = value
+            expressions.append('(`' + str(name) + '` ' + filter_eval_operators[operator] + ' @v' + str(idx) + ')')
+        expression = (' & ' if logic == 'and' else ' | ').join(expressions)
+        names = [name for name, operator, value in eval_predicates]
+        fallback_terms = [functools.partial(filter_predicate_mask, name=name, operator=operator, value=value) for name, operator, value in eval_predicates]
+        def eval_mask(data):
+            # numexpr cannot evaluate extension (e.g. Arrow backed) columns, so those are
+            # filtered with one mask per predicate
+            if any(pd.api.types.is_extension_array_dtype(data[name].dtype) for name in names):
+                return filter_group_mask(logic, fallback_terms, data)
+            return np.asarray(data.eval(expression, local_dict=local_dict), dtype=bool)
+        terms.append(eval_mask)
+
+    return logic, terms
+
+# Function that returns the boolean mask of a compiled group of filter predicates
+def filter_group_mask(logic, terms, data):
+    """
+    Evaluate a compiled group of Filter predicates
+    :param logic: Group logic (and/or)
+    :param terms: List of terms
+    :param data: Data (a DataFrame)
+    :return: Boolean mask (numpy array, or None if the group is empty)
+    """
+    mask = None
+    for term in terms:
+        term_mask = term(data)
+        if mask is None:
+            mask = term_mask.copy()
+        elif logic == 'and':
+            np.logical_and(mask, term_mask, out=mask)
+        else:
+            np.logical_or(mask, term_mask, out=mask)
+    return mask
+
+# Function that compiles the parameters of a filter step into a function that filters the data.
+# All the predicates (and the optional filter_expression) are combined in a single boolean mask,
+# which is applied to the data once (so no intermediate DataFrames are created)
+def compile_filter(parameters):
+    """
+    Compile a Filter step
+    :param parameters: Parameters
+    :return: Function that takes the Data and returns the Filtered Data
+    """
+    logic, terms = compile_filter_group(parameters)
+    # An expression (in DataFrame.eval syntax) can be used in place of (or together with) the
+    # predicates, in the latter case both the predicates and the expression must be true
+    filter_expression = parameters.get('filter_expression')
+    if filter_expression != None and str(filter_expression).strip() != '':
+        filter_expression = str(filter_expression)
+        if len(terms) > 0:
+            terms = [functools.partial(filter_group_mask, logic, terms)]
+        terms.append(lambda data: np.asarray(data.eval(filter_expression), dtype=bool))
+        logic = 'and'
+
+    def filter_step(data):
+        mask = filter_group_mask(logic, terms, data)
+        if mask is None:
+            return data
+        return data[mask]
+    return filter_step
+
 # Function to filter the Data according to the parameters
 def filter_data(data, parameters):
     """
@@ -603,52 +1673,120 @@ def filter_data(data, parameters):
     :return: Filtered Data
     """
     try:
-        # Get the Filter Parameters
-        filter_parameters = parameters.get('filter_parameters')
-        # Loop through the Filter Parameters
-        for filter_parameter in filter_parameters:
-            # Get the Filter Parameter
-            filter_parameter = filter_parameters.get(filter_parameter)
-            # Get the Filter Parameter Name
-            filter_parameter_name = filter_parameter.get('filter_parameter_name')
-            # Get the Filter Parameter Value
-            filter_parameter_value = filter_parameter.get('filter_parameter_value')
-            # Get the Filter Parameter Operator
-            filter_parameter_operator = filter_parameter.get('filter_parameter_operator')
-            # Filter the Data
-            if filter_parameter_operator == 'eq':
-                data = data[data[filter_parameter_name] == filter_parameter_value]
-            elif filter_parameter_operator == 'ne':
-                data = data[data[filter_parameter_name] != filter_parameter_value]
-            elif filter_parameter_operator == 'gt':
-                data = data[data[filter_parameter_name] > filter_parameter_value]
-            elif filter_parameter_operator == 'ge':
-                data = data[data[filter_parameter_name] >= filter_parameter_value]
-            elif filter_parameter_operator == 'lt':
-                data = data[data[filter_parameter_name] < filter_parameter_value]
-            elif filter_parameter_operator == 'le':
-                data = data[data[filter_parameter_name] <= filter_parameter_value]
-            elif filter_parameter_operator == 'in':
-                data = data[data[filter_parameter_name].isin(filter_parameter_value)]
-            elif filter_parameter_operator == 'not in':
-                data = data[~data[filter_parameter_name].isin(filter_parameter_value)]
-            elif filter_parameter_operator == 'contains':
-                data = data[data[filter_parameter_name].str.contains(filter_parameter_value)]
-            elif filter_parameter_operator == 'not contains':
-                data = data[~data[filter_parameter_name].str.contains(filter_parameter_value)]
-            elif filter_parameter_operator == 'startswith':
-                data = data[data[filter_parameter_name].str.startswith(filter_parameter_value)]
-            elif filter_parameter_operator == 'endswith':
-                data = data[data[filter_parameter_name].str.endswith(filter_parameter_value)]
-            else:
-                logging.error(err_msg[15] + "Invalid filter operator: " + filter_parameter_operator)
-                sys.exit(1)
-        return data
+        # Compile the Filter Parameters and filter the Data
+        return compile_filter(parameters)(data)
     except Exception as e:
         logging.error(err_msg[11] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
     
+# Aggregate functions supported by the aggregate action (name used in the job
+# configuration -> function passed to pandas named aggregations)
+aggregate_functions = {
+    'count': 'count',
+    'size': 'size',
+    'sum': 'sum',
+    'mean': 'mean',
+    'median': 'median',
+    'min': 'min',
+    'max': 'max',
+    'std': 'std',
+    'var': 'var',
+    'first': 'first',
+    'last': 'last',
+    'nunique': 'nunique',
+    'unique': 'unique',
+    'list': list,
+}
+
+# Function that returns the list of aggregations of an aggregate step, as a list of
+# (output column, input column, aggregate function name)
+def get_aggregations(aggregate_parameters):
+    """
+    Get the Aggregations of an Aggregate step
+    :param aggregate_parameters: Aggregate Parameters
+    :return: List of (output name, column name, function name)
+    """
+    aggregations = []
+    # Legacy form: a single aggregate_parameter (the output column keeps the column name)
+    aggregate_parameter = aggregate_parameters.get('aggregate_parameter')
+    if aggregate_parameter != None:
+        name = aggregate_parameter.get('aggregate_parameter_name')
+        aggregations.append((aggregate_parameter.get('aggregate_output_name', name), name,
+                             str(aggregate_parameter.get('aggregate_parameter_function'))))
+
+    # Multi-metric form: a list (or a dictionary) of aggregations, all computed in the same groupby
+    entries = aggregate_parameters.get('aggregations')
+    if entries == None:
+        entries = []
+    elif isinstance(entries, dict):
+        entries = list(entries.values())
+    for entry in entries:
+        name = entry.get('aggregate_parameter_name')
+        functions = entry.get('aggregate_parameter_function')
+        if not isinstance(functions, list):
+            functions = [functions]
+        for function in functions:
+            function = str(function)
+            # The default output name is <column>_<function> (e.g. amount_sum)
+            default_output = function if name == None else str(name) + '_' + function
+            output = entry.get('aggregate_output_name', default_output)
+            if len(functions) > 1:
+                output = default_output
+            aggregations.append((output, name, function))
+    return aggregations
+
+# Function that compiles the parameters of an aggregate step into a function that aggregates the data.
+# All the aggregations (on one or more columns) are computed in a single groupby pass over the data
+def compile_aggregate(parameters):
+    """
+    Compile an Aggregate step
+    :param parameters: Parameters
+    :return: Function that takes the Data and returns the Aggregated Data
+    """
+    aggregate_parameters = parameters.get('aggregate_parameters')
+    if aggregate_parameters == None:
+        raise ValueError("Missing aggregate_parameters")
+
+    aggregations = get_aggregations(aggregate_parameters)
+    if len(aggregations) == 0:
+        raise ValueError("No aggregations specified")
+
+    # The group by columns can be specified once for the whole step, or (legacy form)
+    # in the aggregate_parameter
+    group_by = aggregate_parameters.get('aggregate_group_by')
+    if group_by == None and aggregate_parameters.get('aggregate_parameter') != None:
+        group_by = aggregate_parameters.get('aggregate_parameter').get('aggregate_parameter_group_by')
+    if group_by == None:
+        raise ValueError("No aggregate group by columns specified")
+    if not isinstance(group_by, list):
+        group_by = [group_by]
+
+    # Categorical group keys (for high-cardinality data) and observed=True (so only the
+    # combinations of categories that appear in the data are returned)
+    categorical = bool(aggregate_parameters.get('aggregate_categorical', False))
+    observed = bool(aggregate_parameters.get('aggregate_observed', True))
+    group_sort = bool(aggregate_parameters.get('aggregate_sort', True))
+
+    named_aggregations = {}
+    for output, name, function in aggregations:
+        if function not in aggregate_functions:
+            raise ValueError("Invalid aggregate function: " + function)
+        if output in named_aggregations or output in group_by:
+            raise ValueError("Duplicate aggregate output column: " + str(output))
+        # size counts the rows of each group, so it does not need a column
+        if name == None:
+            if function != 'size':
+                raise ValueError("Missing aggregate_parameter_name for function: " + function)
+            name = group_by[0]
+        named_aggregations[output] = pd.NamedAgg(column=name, aggfunc=aggregate_functions[function])
+
+    def aggregate_step(data):
+        if categorical:
+            data = data.astype({key: 'category' for key in group_by if not isinstance(data[key].dtype, pd.CategoricalDtype)})
+        return data.groupby(group_by, observed=observed, sort=group_sort).agg(**named_aggregations).reset_index()
+    return aggregate_step
+
 # Function to aggregate the Data according to the parameters
 def aggregate_data(data, parameters):
     """
@@ -658,52 +1796,106 @@ def aggregate_data(data, parameters):
     :return: Aggregated Data
     """
     try:
-        # Get the Aggregate Parameters
-        aggregate_parameters = parameters.get('aggregate_parameters')
-        # Get the Aggregate Parameter
-        aggregate_parameter = aggregate_parameters.get('aggregate_parameter')
-        # Get the Aggregate Parameter Name
-        aggregate_parameter_name = aggregate_parameter.get('aggregate_parameter_name')
-        # Get the Aggregate Parameter Function
-        aggregate_parameter_function = aggregate_parameter.get('aggregate_parameter_function')
-        # Get the Aggregate Parameter Group By
-        aggregate_parameter_group_by = aggregate_parameter.get('aggregate_parameter_group_by')
-        # Aggregate the Data
-        if aggregate_parameter_function == 'count':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].count().reset_index()
-        elif aggregate_parameter_function == 'sum':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].sum().reset_index()
-        elif aggregate_parameter_function == 'mean':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].mean().reset_index()
-        elif aggregate_parameter_function == 'median':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].median().reset_index()
-        elif aggregate_parameter_function == 'min':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].min().reset_index()
-        elif aggregate_parameter_function == 'max':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].max().reset_index()
-        elif aggregate_parameter_function == 'std':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].std().reset_index()
-        elif aggregate_parameter_function == 'var':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].var().reset_index()
-        elif aggregate_parameter_function == 'first':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].first().reset_index()
-        elif aggregate_parameter_function == 'last':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].last().reset_index()
-        elif aggregate_parameter_function == 'nunique':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].nunique().reset_index()
-        elif aggregate_parameter_function == 'unique':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].unique().reset_index()
-        elif aggregate_parameter_function == 'list':
-            data = data.groupby(aggregate_parameter_group_by)[aggregate_parameter_name].apply(list).reset_index()
-        else:
-            logging.error(err_msg[16] + "Invalid aggregate function: " + aggregate_parameter_function)
-            return None
-        return data
+        # Compile the Aggregate Parameters and aggregate the Data
+        return compile_aggregate(parameters)(data)
     except Exception as e:
         logging.error(err_msg[12] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Function that returns the list of sort keys of a sort step, as a list of (column, ascending)
+def get_sort_keys(sort_parameters):
+    """
+    Get the Sort Keys of a Sort step
+    :param sort_parameters: Sort Parameters
+    :return: List of (column name, ascending)
+    """
+    entries = []
+    # Legacy form: a single sort_parameter
+    if sort_parameters.get('sort_parameter') != None:
+        entries.append(sort_parameters.get('sort_parameter'))
+    # Multi-key form: a list (or a dictionary) of sort keys, in order of priority
+    sort_keys = sort_parameters.get('sort_keys')
+    if isinstance(sort_keys, dict):
+        sort_keys = list(sort_keys.values())
+    if sort_keys != None:
+        entries.extend(sort_keys)
+
+    keys = []
+    for entry in entries:
+        sort_order = str(entry.get('sort_parameter_order', 'asc')).lower().strip()
+        if sort_order not in ['asc', 'desc']:
+            raise ValueError("Invalid sort order: " + sort_order)
+        keys.append((entry.get('sort_parameter_name'), sort_order == 'asc'))
+    return keys
+
+# Function that returns the rows that can be in the first top_n rows of the data once sorted
+# on the first sort key. It uses a partial selection (np.partition, O(n)) to find the value
+# of the top_n-th row, then keeps all the rows that are not worse than it (ties included),
+# so the candidates can be sorted, on all the keys, instead of the whole data
+def select_top_n_candidates(data, column, ascending: bool, top_n: int):
+    """
+    Select the Top-N candidate rows
+    :param data: Data
+    :param column: First sort key
+    :param ascending: True if the first sort key is in ascending order
+    :param top_n: Number of rows to return
+    :return: Candidate rows (in their original order)
+    """
+    values = data[column].to_numpy()
+    if values.dtype.kind not in 'iufb':
+        if not pd.api.types.is_numeric_dtype(data[column].dtype):
+            # Not a numeric key, all the rows are candidates
+            return data
+        values = data[column].to_numpy(dtype='float64', na_value=np.nan)
+    valid = values
+    if values.dtype.kind == 'f':
+        # Missing values are sorted last, so they are candidates only when there are not
+        # enough valid values to fill top_n rows
+        valid = values[~np.isnan(values)]
+    if len(valid) <= top_n:
+        return data
+    if top_n == 0:
+        return data.iloc[0:0]
+    if ascending:
+        threshold = np.partition(valid, top_n - 1)[top_n - 1]
+        return data[values <= threshold]
+    threshold = np.partition(valid, len(valid) - top_n)[len(valid) - top_n]
+    return data[values >= threshold]
+
+# Function that compiles the parameters of a sort step into a function that sorts the data.
+# Sorts are stable (rows with the same keys keep their order) and, when only the first
+# sort_top_n rows are needed, a partial selection is used in place of a full sort
+def compile_sort(parameters):
+    """
+    Compile a Sort step
+    :param parameters: Parameters
+    :return: Function that takes the Data and returns the Sorted Data
+    """
+    sort_parameters = parameters.get('sort_parameters')
+    if sort_parameters == None:
+        raise ValueError("Missing sort_parameters")
+    sort_keys = get_sort_keys(sort_parameters)
+    if len(sort_keys) == 0:
+        raise ValueError("No sort keys specified")
+    columns = [column for column, ascending in sort_keys]
+    ascending = [ascending for column, ascending in sort_keys]
+    sort_kind = 'stable' if bool(sort_parameters.get('sort_stable', True)) else 'quicksort'
+
+    top_n = sort_parameters.get('sort_top_n')
+    if top_n != None:
+        top_n = int(top_n)
+        if top_n < 0:
+            raise ValueError("Invalid sort top_n: " + str(top_n))
+
+    def sort_step(data):
+        if top_n == None:
+            return data.sort_values(by=columns, ascending=ascending, kind=sort_kind)
+        if top_n < len(data):
+            data = select_top_n_candidates(data, columns[0], ascending[0], top_n)
+        return data.sort_values(by=columns, ascending=ascending, kind='stable').head(top_n)
+    return sort_step
+
 # Function to sort the Data according to the parameters
 def sort_data(data, parameters):
     """
@@ -713,28 +1905,30 @@ def sort_data(data, parameters):
     :return: Sorted Data
     """
     try:
-        # Get the Sort Parameters
-        sort_parameters = parameters.get('sort_parameters')
-        # Get the Sort Parameter
-        sort_parameter = sort_parameters.get('sort_parameter')
-        # Get the Sort Parameter Name
-        sort_parameter_name = sort_parameter.get('sort_parameter_name')
-        # Get the Sort Parameter Order
-        sort_parameter_order = sort_parameter.get('sort_parameter_order')
-        # Sort the Data
-        if sort_parameter_order == 'asc':
-            data = data.sort_values(by=[sort_parameter_name], ascending=True)
-        elif sort_parameter_order == 'desc':
-            data = data.sort_values(by=[sort_parameter_name], ascending=False)
-        else:
-            logging.error(err_msg[17] + "Invalid sort order: " + sort_parameter_order)
-            return None
-        return data
+        # Compile the Sort Parameters and sort the Data
+        return compile_sort(parameters)(data)
     except Exception as e:
         logging.error(err_msg[13] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Function that returns the number of rows a limit step keeps
+def get_limit_value(parameters):
+    """
+    Get the Limit value of a Limit step
+    :param parameters: Parameters
+    :return: Number of rows to keep
+    """
+    # Get the Limit Parameters
+    limit_parameters = parameters.get('limit_parameters')
+    # Get the Limit Parameter
+    limit_parameter = limit_parameters.get('limit_parameter')
+    # Get the Limit Parameter Value
+    limit_parameter_value = int(limit_parameter.get('limit_parameter_value'))
+    if limit_parameter_value < 0:
+        raise ValueError("Invalid limit value: " + str(limit_parameter_value))
+    return limit_parameter_value
+
 # Function to limit the Data according to the parameters
 def limit_data(data, parameters):
     """
@@ -744,20 +1938,38 @@ def limit_data(data, parameters):
     :return: Limited Data
     """
     try:
-        # Get the Limit Parameters
-        limit_parameters = parameters.get('limit_parameters')
-        # Get the Limit Parameter
-        limit_parameter = limit_parameters.get('limit_parameter')
-        # Get the Limit Parameter Value
-        limit_parameter_value = limit_parameter.get('limit_parameter_value')
         # Limit the Data
-        data = data.head(limit_parameter_value)
+        data = data.head(get_limit_value(parameters))
         return data
     except Exception as e:
         logging.error(err_msg[14] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
-    
+
+# Function that merges each sort step immediately followed by a limit step into a single
+# sort step that only returns the first rows (so the data is not fully sorted)
+def fuse_sort_limit_steps(transform_sequence):
+    """
+    Fuse the sort + limit steps of a Transform sequence
+    :param transform_sequence: Transform sequence
+    :return: Transform sequence with the sort + limit steps fused
+    """
+    fused_sequence = []
+    for transform in transform_sequence:
+        previous = fused_sequence[-1] if len(fused_sequence) > 0 else {}
+        if str(previous.get('type', '')).lower().strip() == 'sort' and str(transform.get('type', '')).lower().strip() == 'limit':
+            sort_parameters = (previous.get('parameters') or {}).get('sort_parameters')
+            limit_parameter = ((transform.get('parameters') or {}).get('limit_parameters') or {}).get('limit_parameter') or {}
+            if sort_parameters != None and sort_parameters.get('sort_top_n') == None and limit_parameter.get('limit_parameter_value') != None:
+                # Copy the sort step, so the job configuration is not changed
+                fused = dict(previous)
+                fused['parameters'] = dict(previous.get('parameters'))
+                fused['parameters']['sort_parameters'] = dict(sort_parameters, sort_top_n=limit_parameter.get('limit_parameter_value'))
+                fused_sequence[-1] = fused
+                continue
+        fused_sequence.append(transform)
+    return fused_sequence
+
 # Function that pivot data according to the parameters
 def pivot_data(data, parameters):
     """
@@ -785,30 +1997,248 @@ def pivot_data(data, parameters):
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Function that converts a size (a number of bytes or a string like '512MB') into a number of bytes
+def parse_size(size):
+    """
+    Parse a Size
+    :param size: Size (number of bytes, or a string with a KB/MB/GB/TB unit)
+    :return: Number of bytes
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.match(r'^\s*([0-9.]+)\s*([KMGT]?)i?B?\s*$', str(size), re.IGNORECASE)
+    if match == None:
+        raise ValueError("Invalid size: " + str(size))
+    units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    return int(float(match.group(1)) * units[match.group(2).upper()])
+
+# Function that returns the partition number of each record of the data, hashing its join keys
+# (numeric keys are hashed as floats so, for example, 1 and 1.0 land in the same partition)
+def hash_partition_numbers(data, keys, partitions: int):
+    """
+    Get the Hash Partition numbers of the Data
+    :param data: Data
+    :param keys: Join keys
+    :param partitions: Number of partitions
+    :return: Array with the partition number of each record
+    """
+    key_columns = {}
+    for idx, key in enumerate(keys):
+        column = data[key]
+        if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+            column = column.astype('float64')
+        else:
+            column = column.astype(str)
+        key_columns[idx] = column.to_numpy()
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(key_columns), index=False).to_numpy()
+    return hashes % np.uint64(partitions)
+
+# Function that splits the data in hash partitions on its join keys
+def hash_partition_data(data, keys, partitions: int):
+    """
+    Hash Partition the Data
+    :param data: Data
+    :param keys: Join keys
+    :param partitions: Number of partitions
+    :return: Dictionary of partition number -> Data
+    """
+    partition_numbers = hash_partition_numbers(data, keys, partitions)
+    return {int(partition): data[partition_numbers == partition] for partition in np.unique(partition_numbers)}
+
+# Function that loads the right side (aka the build side) of a join from its datasource, once. The
+# build side is kept in memory, indexed on its join keys, when it fits in the memory budget (broadcast
+# strategy), otherwise (or when the partitioned strategy is requested) it is split in hash partitions
+# which are spilled to disk (in tmp_path) if they do not fit in the memory budget
+def load_join_build_side(config, join_parameters, right_keys):
+    """
+    Load the Build side of a Join
+    :param config: Configuration
+    :param join_parameters: Join Parameters
+    :param right_keys: Join keys of the build side
+    :return: Build side (a dictionary with the strategy and the indexed data or partitions)
+    """
+    # The build side is read as the source of a copy of the job configuration:
+    join_config = dict(config)
+    join_config['datasources'] = dict(config.get('datasources') or {}, source=join_parameters.get('join_datasource'))
+    join_config['actions'] = dict(config.get('actions') or {}, source=join_parameters.get('join_source'))
+    join_config['paths'] = dict(config.get('paths') or {})
+    if join_parameters.get('join_inp_path') != None:
+        join_config['paths']['inp_path'] = process_pyexpr(join_parameters.get('join_inp_path'))
+    datasource = join_parameters.get('join_datasource')
+    ds_type = str(datasource.get('type', datasource.get('db_type', 'file')))
+
+    strategy = str(join_parameters.get('join_strategy', 'auto')).lower().strip()
+    if strategy not in ['auto', 'broadcast', 'partitioned']:
+        raise ValueError("Invalid join strategy: " + strategy)
+    memory_budget = parse_size(join_parameters.get('join_memory_budget', '512MB'))
+    partitions = int(join_parameters.get('join_partitions', 16))
+    batch_size = int(join_parameters.get('join_batch_size', default_batch_size))
+
+    batches = []
+    memory_used = 0
+    spill_dir = None
+    spilled_files = {}
+    for batch in read_data_batches_from_ds(join_config, ds_type, 'source', batch_size):
+        if batch is None:
+            continue
+        if not isinstance(batch, pd.DataFrame):
+            batch = pd.DataFrame(batch)
+        batches.append(batch)
+        memory_used += int(batch.memory_usage(deep=True).sum())
+        if memory_used > memory_budget and strategy != 'broadcast':
+            # Over the memory budget: spill the collected batches to disk, one file per partition
+            if spill_dir == None:
+                os.makedirs(tmp_path, exist_ok=True)
+                spill_dir = tempfile.TemporaryDirectory(prefix='microetl_join_', dir=tmp_path)
+                logging.info("Join build side exceeds the memory budget, spilling partitions to: " + spill_dir.name)
+            for partition, partition_data in hash_partition_data(pd.concat(batches, ignore_index=True), right_keys, partitions).items():
+                files = spilled_files.setdefault(partition, [])
+                files.append(os.path.join(spill_dir.name, 'part_' + str(partition) + '_' + str(len(files)) + '.pkl'))
+                partition_data.to_pickle(files[-1])
+            batches = []
+            memory_used = 0
+
+    right = pd.concat(batches, ignore_index=True) if len(batches) > 0 else pd.DataFrame(columns=right_keys)
+    if spill_dir == None and strategy != 'partitioned':
+        return { 'strategy': 'broadcast', 'data': right.set_index(right_keys) }
+
+    # Partitioned build side, either in memory or spilled to disk:
+    build_side = { 'strategy': 'partitioned', 'partitions': partitions, 'schema': right.iloc[0:0].set_index(right_keys),
+                   'spill_dir': spill_dir, 'spilled_files': spilled_files, 'data': {},
+                   'cache': {}, 'cache_size': 0, 'memory_budget': memory_budget }
+    for partition, partition_data in hash_partition_data(right, right_keys, partitions).items():
+        if spill_dir != None:
+            files = spilled_files.setdefault(partition, [])
+            files.append(os.path.join(spill_dir.name, 'part_' + str(partition) + '_' + str(len(files)) + '.pkl'))
+            partition_data.to_pickle(files[-1])
+        else:
+            build_side['data'][partition] = partition_data.set_index(right_keys)
+    if spill_dir != None and len(spilled_files) > 0:
+        first_partition = spilled_files[min(spilled_files)]
+        build_side['schema'] = pd.read_pickle(first_partition[0]).iloc[0:0].set_index(right_keys)
+    return build_side
+
+# Function that returns a partition of the build side of a join (indexed on its join keys). Spilled
+# partitions are kept in memory once loaded, so the next batches do not read them again: the least
+# recently used ones are dropped when the loaded partitions exceed the memory budget of the join
+def get_join_build_partition(build_side, partition: int, right_keys):
+    """
+    Get a Partition of the Build side of a Join
+    :param build_side: Build side (see load_join_build_side)
+    :param partition: Partition number
+    :param right_keys: Join keys of the build side
+    :return: Partition Data (indexed on the join keys)
+    """
+    if partition in build_side.get('data'):
+        return build_side.get('data').get(partition)
+    files = build_side.get('spilled_files').get(partition)
+    if files == None:
+        return build_side.get('schema')
+    cache = build_side.get('cache')
+    if partition in cache:
+        # Move the partition to the end of the cache (the most recently used)
+        partition_data, size = cache.pop(partition)
+        cache[partition] = (partition_data, size)
+        return partition_data
+    partition_data = pd.concat([pd.read_pickle(filename) for filename in files], ignore_index=True).set_index(right_keys)
+    size = int(partition_data.memory_usage(deep=True).sum())
+    while len(cache) > 0 and build_side['cache_size'] + size > build_side.get('memory_budget'):
+        _, evicted_size = cache.pop(next(iter(cache)))
+        build_side['cache_size'] -= evicted_size
+    cache[partition] = (partition_data, size)
+    build_side['cache_size'] += size
+    return partition_data
+
+# Function that compiles the parameters of a join step into a function that joins the data with
+# another datasource (loaded once, when the step is compiled)
+def compile_join(config, parameters):
+    """
+    Compile a Join step
+    :param config: Configuration
+    :param parameters: Parameters
+    :return: Function that takes the Data and returns the Joined Data
+    """
+    join_parameters = parameters.get('join_parameters')
+    if join_parameters == None:
+        raise ValueError("Missing join_parameters")
+
+    # Legacy form: the right side of the join is a literal in the join_parameter
+    join_parameter = join_parameters.get('join_parameter')
+    if join_parameter != None and join_parameters.get('join_datasource') == None:
+        return lambda data: data.join(join_parameter.get('join_parameter_values'), on=join_parameter.get('join_parameter_index'),
+                                      how=join_parameter.get('join_parameter_name'))
+
+    if join_parameters.get('join_datasource') == None:
+        raise ValueError("Missing join_datasource")
+    left_keys = join_parameters.get('join_left_keys', join_parameters.get('join_keys'))
+    right_keys = join_parameters.get('join_right_keys', join_parameters.get('join_keys'))
+    if left_keys == None or right_keys == None:
+        raise ValueError("No join keys specified")
+    if not isinstance(left_keys, list):
+        left_keys = [left_keys]
+    if not isinstance(right_keys, list):
+        right_keys = [right_keys]
+    if len(left_keys) != len(right_keys):
+        raise ValueError("The left and right join keys must have the same length")
+    how = str(join_parameters.get('join_how', 'left')).lower().strip()
+    if how not in ['left', 'inner', 'right', 'outer']:
+        raise ValueError("Invalid join type: " + how)
+    suffixes = join_parameters.get('join_suffixes', ['', '_right'])
+
+    build_side = load_join_build_side(config, join_parameters, right_keys)
+
+    def join_partition(data, right):
+        return data.join(right, on=left_keys, how=how, lsuffix=suffixes[0], rsuffix=suffixes[1])
+
+    def join_step(data):
+        # The records are numbered so their original order can be restored after the join
+        data = data.reset_index(drop=True)
+        if build_side.get('strategy') == 'broadcast':
+            return restore_join_order(join_partition(data, build_side.get('data')))
+        # Partitioned join: the data is split with the same hash partitioning of the build side,
+        # and each partition is joined on its own
+        partition_numbers = hash_partition_numbers(data, left_keys, build_side.get('partitions'))
+        results = []
+        for partition in range(0, build_side.get('partitions')):
+            selected = partition_numbers == partition
+            # Left and inner joins of partitions with no records do not need the build side partition
+            if not selected.any() and how in ['left', 'inner']:
+                continue
+            right = get_join_build_partition(build_side, partition, right_keys)
+            if not selected.any() and len(right) == 0:
+                continue
+            results.append(join_partition(data[selected], right))
+        if len(results) == 0:
+            return join_partition(data.iloc[0:0], build_side.get('schema'))
+        return restore_join_order(pd.concat(results))
+    return join_step
+
+# Function that restores the original order of the records after a join (the index of the joined
+# data holds the original position of each record, records of the other datasource with no match
+# have no position and go last)
+def restore_join_order(joined):
+    """
+    Restore the original order of the joined Data
+    :param joined: Joined Data
+    :return: Joined Data in the original order
+    """
+    positions = joined.index.to_numpy(dtype='float64', na_value=np.inf)
+    return joined.iloc[np.argsort(positions, kind='stable')].reset_index(drop=True)
+
 # Function that joins data according to the parameters
-def join_data(data, parameters):
+def join_data(data, parameters, config=None):
     """
     Join the Data
     :param data: Data
     :param parameters: Parameters
+    :param config: Configuration (used to read the datasource to join with)
     :return: Joined Data
     """
     try:
-        # Get the Join Parameters
-        join_parameters = parameters.get('join_parameters')
-        # Get the Join Parameter
-        join_parameter = join_parameters.get('join_parameter')
-        # Get the Join Parameter Name
-        join_parameter_name = join_parameter.get('join_parameter_name')
-        # Get the Join Parameter Values
-        join_parameter_values = join_parameter.get('join_parameter_values')
-        # Get the Join Parameter Index
-        join_parameter_index = join_parameter.get('join_parameter_index')
-        # Join the Data
-        data = data.join(join_parameter_values, on=join_parameter_index, how=join_parameter_name)
-        return data
+        # Compile the Join Parameters and join the Data
+        return compile_join(config if config != None else {}, parameters)(data)
     except Exception as e:
-        logging.error(err_msg[15] + str(e))
+        logging.error(err_msg[9] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
@@ -838,32 +2268,160 @@ def transform_data(config, data, section_name: str ="transform"):
     :return: Transformed Data
     """
     try:
-        # Get the Transform Section
+        # Get the Transform section
         transform_section = config.get('actions').get(section_name)
         # Get the Transform sequence
         transform_sequence = transform_section.get('sequence')
 
-        # Loop through the Transform sequence
-        for transform in transform_sequence:
-            if debug_level > 1:
-              print(yaml.dump(transform))
-            # Get subsection
-            #transform_step = transform.get('step')
-            # Get the Transform name
-            transform_type: str = transform.get("type").lower().strip()
-            # Process the Data
-            data = process_data(config, transform.get('inp_path'), transform_type, transform, data)
-            # Check if the data is empty
-            if data == None:
-                logging.error(err_msg[0].format("Empty data after transform: " + transform_type))
-                return None
-            
-        return data
+        # Run the Transform sequence
+        return run_transform_steps(config, transform_sequence, data)
     except Exception as e:
         logging.error(err_msg[0].format(str(e)))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return data
 
+# Function that runs a list of transform steps (from a transform sequence) on the data
+def run_transform_steps(config, transform_steps, data):
+    """
+    Run the Transform steps
+    :param config: Configuration
+    :param transform_steps: List of Transform steps
+    :param data: Data
+    :return: Transformed Data (None if a step returned no data)
+    """
+    return run_compiled_steps(compile_transform_sequence(config, transform_steps), data)
+
+# Function that compiles a transform sequence into a list of steps, each one with its
+# (pre-bound) step function
+def compile_transform_sequence(config, transform_sequence):
+    """
+    Compile a Transform sequence
+    :param config: Configuration
+    :param transform_sequence: Transform sequence
+    :return: List of compiled steps (id, name, type, blocking and run function)
+    """
+    steps = []
+    if transform_sequence == None:
+        return steps
+    for idx, transform in enumerate(fuse_sort_limit_steps(transform_sequence)):
+        if debug_level > 1:
+          print(yaml.dump(transform))
+        # Get the Transform name
+        transform_type: str = transform.get("type").lower().strip()
+        # Steps are identified by their position in the sequence (names are optional, and need not be unique)
+        step_id = str(idx + 1) + ':' + transform_type
+        steps.append({
+            'id': step_id,
+            'name': str(transform.get('step', step_id)),
+            'type': transform_type,
+            'blocking': is_blocking_step(transform),
+            'run': compile_step(config, transform.get('inp_path'), transform_type, transform),
+        })
+    return steps
+
+# Function that runs a list of compiled steps on the data
+def run_compiled_steps(steps, data, profile=None):
+    """
+    Run the compiled steps
+    :param steps: List of compiled steps
+    :param data: Data
+    :param profile: Profile where to record the steps measurements (None to not profile them)
+    :return: Transformed Data (None if a step returned no data)
+    """
+    for step in steps:
+        # Process the Data
+        try:
+            data = prof.profile_call(profile, step['name'], 'destination' if step['type'] == 'write' else 'transform', step['run'], data, step.get('id'))
+        except Exception as e:
+            logging.error(err_msg[12] + str(e))
+            logging.error(err_msg[0].format(traceback.format_exc()))
+            data = None
+        # Check if the data is empty
+        if data is None:
+            logging.error(err_msg[0].format("Empty data after transform: " + step['type']))
+            return None
+
+    return data
+
+# Function that returns True if a transform step needs the whole dataset
+# to produce its output (and so it cannot run on a single batch)
+def is_blocking_step(transform):
+    """
+    Check if a Transform step is blocking
+    :param transform: Transform step
+    :return: True if the step is blocking
+    """
+    if transform.get('blocking') != None:
+        return bool(transform.get('blocking'))
+    transform_type = str(transform.get('type', '')).lower().strip()
+    if transform_type == 'join':
+        # Right and outer joins return the unmatched records of the other datasource once,
+        # so they need the whole dataset
+        join_parameters = (transform.get('parameters') or {}).get('join_parameters') or {}
+        return str(join_parameters.get('join_how', 'left')).lower().strip() in ['right', 'outer']
+    return transform_type in blocking_actions
+
+# Function that splits a transform sequence (or a list of compiled steps) in two parts: the steps
+# that can run on each batch and the steps from the first blocking step onwards
+def split_transform_sequence(transform_sequence):
+    """
+    Split a Transform sequence at the first blocking step
+    :param transform_sequence: Transform sequence (or list of compiled steps)
+    :return: (streaming steps, blocking steps)
+    """
+    if transform_sequence == None:
+        return [], []
+    for idx, transform in enumerate(transform_sequence):
+        if is_blocking_step(transform):
+            return transform_sequence[:idx], transform_sequence[idx:]
+    return transform_sequence, []
+
+# Function that returns the execution mode and batch size of a job
+def get_execution_mode(config):
+    """
+    Get the Execution mode of a job
+    :param config: Configuration
+    :return: (execution mode, batch size)
+    """
+    execution = config.get('execution')
+    if execution == None:
+        return 'batch', default_batch_size
+    mode = str(execution.get('mode', 'batch')).lower().strip()
+    if mode not in ['batch', 'streaming']:
+        raise ValueError("Invalid execution mode: " + mode)
+    batch_size = int(execution.get('batch_size', default_batch_size))
+    if batch_size <= 0:
+        raise ValueError("Invalid batch size: " + str(batch_size))
+    return mode, batch_size
+
+# Function that returns True if the runs of a job must be profiled (see microetl/profiler.py)
+def is_profiling_enabled(config):
+    """
+    Check if a job must be profiled
+    :param config: Configuration
+    :return: True if the job runs must be profiled
+    """
+    execution = config.get('execution')
+    if execution == None:
+        return False
+    return bool(execution.get('profile', False))
+
+# Function that returns the data types backend of a job
+def get_dtype_backend(config):
+    """
+    Get the Data types backend of a job
+    :param config: Configuration
+    :return: Data types backend (numpy, numpy_nullable or pyarrow)
+    """
+    execution = config.get('execution')
+    if execution == None:
+        return 'numpy'
+    dtype_backend = str(execution.get('dtype_backend', 'numpy')).lower().strip()
+    if dtype_backend not in dtype_backends:
+        raise ValueError("Invalid dtype backend: " + dtype_backend)
+    if dtype_backend == 'pyarrow' and pa is None:
+        raise ImportError("The pyarrow dtype backend requires the pyarrow library")
+    return dtype_backend
 
 # Function that writes data to a datasource according to the provided MicroETL configuration
 def write_data_to_ds(config, out_path, data, parameters):
@@ -875,31 +2433,260 @@ def write_data_to_ds(config, out_path, data, parameters):
     :return: None
     """
     try:
-        # Get the Write Parameters
-        write_parameters = config.get('datasources').get('destination') 
-        # Get the Write Parameter
-        write_parameter = write_parameters.get('write_parameter')
-        # Get the Write Parameter Name
-        write_parameter_name = write_parameter.get('write_parameter_name')
-        # Get the Write Parameter Value
-        write_parameter_value = write_parameter.get('write_parameter_value')
-        # Get the Write Parameter Type
-        write_parameter_type = write_parameter.get('write_parameter_type')
-        # Write the Data
-        if write_parameter_type == 'file':
-            #write_data_to_file(config, data, write_parameter_value)
-            do_nothing()
-        elif write_parameter_type == 'db':
-            #write_data_to_db(config, data, write_parameter_value)
-            do_nothing()
-        else:
-            logging.error(err_msg[18] + "Invalid write type: " + write_parameter_type)
-            return None
+        # File destinations (CSV, NDJSON, Parquet and Feather)
+        destination = config.get('datasources').get('destination') or {}
+        destination_type = str(destination.get('type', '')).lower().strip()
+        if destination_type in fio.writer_formats:
+            return write_data_to_file_destination(config, out_path, data)
+        # Database destinations that can be bulk loaded
+        if get_db_destination(config) != None:
+            return write_data_to_db_destination(config, data)
+        raise ValueError("Invalid destination: a file destination type (" + ', '.join(fio.writer_formats) +
+                         ") or a db_type that can be bulk loaded (" + ', '.join(dbc.db_loader_types) + ") is required")
     except Exception as e:
         logging.error(err_msg[19] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return None
 
+# Function that returns the file name of a file destination: file_name (by default data.<type>) in the
+# output path. The {job} and {timestamp} placeholders of the file name are replaced with the job name
+# and the current (UTC) time, so each run can write a new file. When the configuration asks for unique
+# file names (see etleng_prepare_watch_job), a {timestamp} is added to the file names that have none
+def get_destination_file(config, out_path=None):
+    """
+    Get the File name of a file destination
+    :param config: Configuration
+    :param out_path: Output Path (the job output path if None)
+    :return: File name
+    """
+    destination = (config.get('datasources') or {}).get('destination') or {}
+    destination_type = str(destination.get('type')).lower().strip()
+    if out_path == None:
+        out_path = config.get('paths').get('out_path')
+    file_name = str(process_pyexpr(str(destination.get('file_name', 'data.' + destination_type))))
+    if config.get('unique_file_names', False) and '{timestamp}' not in file_name:
+        file_dir, base_name = os.path.split(file_name)
+        name, dot, extension = base_name.partition('.')
+        file_name = os.path.join(file_dir, name + '_{timestamp}' + dot + extension)
+    # Only the {job} and {timestamp} placeholders are replaced, all the other braces are kept as they are
+    job = os.path.splitext(os.path.basename(str(config.get('job_name', 'job'))))[0]
+    file_name = file_name.replace('{job}', job)
+    if '{timestamp}' in file_name:
+        file_name = file_name.replace('{timestamp}', datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S%f'))
+    return os.path.join(out_path, file_name)
+
+# Function that returns the database destination of a job: a destination with a db_type that can be bulk
+# loaded (see dbconn.interface.db_loader_types) and a table (for Neo4j, a Cypher template in its
+# write_options). Returns None for all the other destinations
+def get_db_destination(config):
+    """
+    Get the Database destination
+    :param config: Configuration
+    :return: Destination datasource (or None)
+    """
+    destination = (config.get('datasources') or {}).get('destination') or {}
+    db_type = str(destination.get('db_type', '')).lower().strip()
+    if db_type not in dbc.db_loader_types:
+        return None
+    if destination.get('table') == None and (db_type != 'neo4j' or (destination.get('write_options') or {}).get('cypher') == None):
+        return None
+    return destination
+
+# Function that opens the writer of a destination: file destinations are written batch by batch (see
+# write_destination_batch) to a temporary file that replaces the destination file when the writer is
+# closed (see fileio.open_writer), database destinations are bulk loaded in a single transaction that
+# is committed when the writer is closed (see dbconn.interface.open_db_loader). Returns None when the
+# destination has no writer
+def open_destination_writer(config, out_path=None):
+    """
+    Open the Writer of a destination
+    :param config: Configuration
+    :param out_path: Output Path (the job output path if None)
+    :return: Writer (or None)
+    """
+    destination = (config.get('datasources') or {}).get('destination') or {}
+    destination_type = str(destination.get('type', '')).lower().strip()
+    if destination_type in fio.writer_formats:
+        return fio.open_writer(get_destination_file(config, out_path), destination_type, destination.get('write_options'))
+    if get_db_destination(config) == None:
+        return None
+    db_type = str(destination.get('db_type')).lower().strip()
+    conn = acquire_db_connection(config, 'destination')
+    try:
+        # Neo4j destinations write to a database (the default database when it is not set)
+        table = (destination.get('table') or destination.get('database')) if db_type == 'neo4j' else destination.get('table')
+        if table != None:
+            table = str(process_pyexpr(str(table)))
+        loader = dbc.open_db_loader(conn, db_type, table, destination.get('write_options'))
+    except Exception:
+        release_db_connection(config, conn, db_type)
+        raise
+    return {'format': 'db', 'db_type': db_type, 'conn': conn, 'loader': loader, 'config': config}
+
+# Function that writes a batch of data to the writer of a destination
+def write_destination_batch(writer, data):
+    """
+    Write a Batch of data to a destination
+    :param writer: Writer (see open_destination_writer)
+    :param data: Data
+    :return: Number of records written
+    """
+    start_time = time.perf_counter()
+    if writer.get('format') == 'db':
+        rows = dbc.load_db_batch(writer.get('loader'), data)
+    else:
+        if writer.get('format') in fio.columnar_formats:
+            data = to_arrow_table(data)
+        rows = fio.write_batch(writer, data)
+    writer['write_time'] = writer.get('write_time', 0.0) + time.perf_counter() - start_time
+    writer['rows_written'] = add_record_count(writer.get('rows_written', 0), rows)
+    return rows
+
+# Function that returns the write statistics of a destination writer: records written, seconds spent
+# writing them (including closing the writer) and throughput (records per second)
+def get_write_stats(writer, write_time: float):
+    """
+    Get the Write statistics of a destination
+    :param writer: Writer (see open_destination_writer)
+    :param write_time: Seconds spent writing
+    :return: Dictionary with rows_written, write_time and write_throughput
+    """
+    rows = writer.get('rows_written', 0)
+    throughput = None
+    if rows != None and write_time > 0:
+        throughput = round(rows / write_time, 1)
+    return {'rows_written': rows, 'write_time': round(write_time, 6), 'write_throughput': throughput}
+
+# Function that closes the writer of a destination, committing (or, when commit is False, discarding)
+# what was written, and returns the run statistics of the destination (output_file for files,
+# output_table and rows_loaded for databases, and the write statistics, see get_write_stats)
+def close_destination_writer(writer, commit: bool = True):
+    """
+    Close the Writer of a destination
+    :param writer: Writer (see open_destination_writer)
+    :param commit: True to commit the written data, False to discard it
+    :return: Dictionary with the destination run statistics
+    """
+    start_time = time.perf_counter()
+    if writer.get('format') != 'db':
+        output_file = fio.close_writer(writer, commit)
+        if not commit:
+            return {}
+        stats = {'output_file': output_file}
+    else:
+        try:
+            rows = dbc.close_db_loader(writer.get('loader'), commit)
+        finally:
+            release_db_connection(writer.get('config'), writer.get('conn'), writer.get('db_type'))
+        if not commit:
+            return {}
+        stats = {'output_table': writer.get('loader').get('table'), 'rows_loaded': rows}
+    stats.update(get_write_stats(writer, writer.get('write_time', 0.0) + time.perf_counter() - start_time))
+    return stats
+
+# Function that discards what was written to a destination after a failed run (errors while discarding
+# are only logged, so they do not hide the error of the run)
+def discard_destination_writer(writer):
+    """
+    Discard the Writer of a destination
+    :param writer: Writer (see open_destination_writer)
+    :return: None
+    """
+    try:
+        close_destination_writer(writer, False)
+    except Exception as e:
+        logging.error(err_msg[14] + str(e))
+
+# Function that opens the writers of a pipeline run: the destination writer (see open_destination_writer),
+# which the write steps without a location write to, and the writers of the write steps with a location
+# (opened when the step first runs, see get_run_writer). Returns the destination writer (or None)
+def open_run_writers(config):
+    """
+    Open the Writers of a run
+    :param config: Configuration
+    :return: Destination writer (or None)
+    """
+    writer = open_destination_writer(config)
+    config['run_writers'] = {None: writer}
+    return writer
+
+# Function that returns the writer of a run that a write step writes to: the destination writer for the
+# steps without a location, a writer of the destination in the location (opened once per run) otherwise.
+# Returns None outside of a pipeline run, or when the destination has no writer
+def get_run_writer(config, location=None):
+    """
+    Get a Writer of the run
+    :param config: Configuration
+    :param location: Output path of the write step (None for the destination output path)
+    :return: Writer (or None)
+    """
+    writers = config.get('run_writers')
+    if writers == None:
+        return None
+    if location not in writers:
+        writers[location] = open_destination_writer(config, str(process_pyexpr(str(location))))
+    return writers.get(location)
+
+# Function that closes the writers of a run, committing (or, when commit is False, discarding) what was
+# written, and returns the run statistics of the destination writer (see close_destination_writer)
+def close_run_writers(config, commit: bool = True):
+    """
+    Close the Writers of a run
+    :param config: Configuration
+    :param commit: True to commit the written data, False to discard it
+    :return: Dictionary with the destination run statistics
+    """
+    writers = config.get('run_writers') or {}
+    stats = {}
+    # Writers are removed once closed, so after an error the others can still be discarded
+    for location in list(writers):
+        writer = writers.pop(location)
+        if writer == None:
+            continue
+        if commit:
+            writer_stats = close_destination_writer(writer)
+            if location == None:
+                stats = writer_stats
+        else:
+            discard_destination_writer(writer)
+    config.pop('run_writers', None)
+    return stats
+
+# Function that writes the data to a file destination (CSV, NDJSON, Parquet or Feather) in the output
+# path, and returns the file name (see get_destination_file)
+def write_data_to_file_destination(config, out_path, data):
+    """
+    Write the Data to a File destination
+    :param config: Configuration
+    :param out_path: Output Path (the job output path if None)
+    :param data: Data
+    :return: File name
+    """
+    writer = open_destination_writer(config, out_path)
+    try:
+        write_destination_batch(writer, data)
+    except Exception:
+        fio.close_writer(writer, False)
+        raise
+    return fio.close_writer(writer)
+
+# Function that bulk loads the data to a database destination (see open_destination_writer), and returns
+# the number of records loaded
+def write_data_to_db_destination(config, data):
+    """
+    Write the Data to a Database destination
+    :param config: Configuration
+    :param data: Data
+    :return: Number of records loaded
+    """
+    writer = open_destination_writer(config)
+    try:
+        write_destination_batch(writer, data)
+    except Exception:
+        close_destination_writer(writer, False)
+        raise
+    return close_destination_writer(writer).get('rows_loaded')
+
 # Function to read the Data from a Database
 # and return a DataFrame
 def read_data_from_db(config, sql_query, sql_params=None):
@@ -987,6 +2774,31 @@ def transform_data_old_to_new(data, old_json_schema, json_schema):
         logging.error(err_msg[0].format(traceback.format_exc()))
         sys.exit(1)
 
+# Function that parses a DSL mapping (as read from a text file) into a jsonbender mapping
+def parse_dsl_mapping(mapping):
+    """
+    Parse a DSL mapping
+    :param mapping: Mapping (a DSL text or an already parsed mapping)
+    :return: Parsed mapping
+    """
+    # Paolo's note: this is a micro parser for the DSL
+    #               when using DSL from a text file!
+    if not isinstance(mapping, str):
+        return mapping
+    processed_map = {}
+    pattern = r"^.*[\'|\"]{1}(?P<key>[a-zA-Z0-9]+)[\'|\"]{1}\s*[\:]{1}\s*(?P<value>.*)\s*[,]{1}\s*$"
+    line = ''
+    for char in mapping:
+        if char == '\n':
+            if line.strip() != '':
+                matches = re.match(pattern, line, flags=re.I|re.M|re.U)
+                if matches:
+                    processed_map[matches.group("key")] = eval(matches.group("value"))
+            line = ''
+        else:
+            line += char
+    return processed_map
+
 # Function that transform the data from JSON format to JSON format using jsonbender 
 # and return the transformed Data as a JSON object
 def transform_data_json_to_json(data, mapping, json_schema = None):
@@ -998,24 +2810,8 @@ def transform_data_json_to_json(data, mapping, json_schema = None):
     :return: Transformed Data
     """
     try:
-        # Process the mapping. 
-        # Paolo's note: this is a micro parser for the DSL
-        #               when using DSL from a text file!
-        if isinstance(mapping, str):
-            processed_map = {}
-            pattern = r"^.*[\'|\"]{1}(?P<key>[a-zA-Z0-9]+)[\'|\"]{1}\s*[\:]{1}\s*(?P<value>.*)\s*[,]{1}\s*$"
-            line = ''
-            for char in mapping:
-                if char == '\n':
-                    if line.strip() != '':
-                        matches = re.match(pattern, line, flags=re.I|re.M|re.U)
-                        if matches:
-                            processed_map[matches.group("key")] = eval(matches.group("value"))
-                    line = ''
-                else:
-                    line += char
-        else:
-            processed_map = mapping
+        # Process the mapping (when using DSL from a text file)
+        processed_map = parse_dsl_mapping(mapping)
 
         # Remap the data:    
         new_data = bend(processed_map, data)
@@ -1054,8 +2850,11 @@ def transform_data_json_to_json_pyjq(data, mapping, json_schema):
         data_json = json.loads( tmp_data )
         print(json.dumps(data_json, indent=4))
 
-        # Transform the data
-        new_data = pyjq.all(mapping, data_json)
+        # Transform the data (the mapping can be a jq script or an already compiled one)
+        if isinstance(mapping, str):
+            new_data = pyjq.all(mapping, data_json)
+        else:
+            new_data = mapping.all(data_json)
 
         # Validate the data if a JSON Schema is provided
         if json_schema != None and new_data != None:
@@ -1172,8 +2971,15 @@ def write_data_to_json(data, json_file):
     :return: None
     """
     try:
-        # Write the Data to a JSON file
-        with open(json_file, 'w') as json_data:
+        # Write the Data to a JSON file (DataFrames and Arrow tables are serialised by pandas,
+        # column by column, instead of being converted to a list of dictionaries first)
+        if pa != None and isinstance(data, pa.Table):
+            data = arrow_to_dataframe(data)
+        # Files with a compression extension (e.g. data.json.gz) are compressed on the fly
+        if isinstance(data, pd.DataFrame):
+            data.to_json(json_file, orient='records', indent=4, date_format='iso', compression=fio.get_compression(json_file, False))
+            return
+        with fio.open_file(json_file, 'wt') as json_data:
             json.dump(data, json_data, indent=4)
     except Exception as e:
         logging.error(err_msg[12] + str(e))
@@ -1235,6 +3041,68 @@ def etleng_df_to_json(df, json_schema_file):
         logging.error(err_msg[0].format(traceback.format_exc()))
         sys.exit(1)
 
+# Function that returns the source and destination datasource types of a job
+def get_pipeline_datasources(config):
+    """
+    Get the Source and Destination datasource types
+    :param config: Job configuration
+    :return: (source datasource type, destination datasource type)
+    """
+    inp_path: str = config.get('paths').get('inp_path')
+    out_path: str = config.get('paths').get('out_path')
+    src_ds: str = ''
+    src_ds = str(config.get('datasources').get('source').get('type' , ''))
+    if src_ds == '':
+        src_ds = str(config.get('datasources').get('source').get('db_type' , ''))
+    if src_ds == '' and inp_path != '':
+        src_ds = 'file'
+    if src_ds == '' and inp_path == '':
+        raise ValueError('No source data type specified in the configuration file')
+    
+    dst_ds: str = ''
+    dst_ds = str(config.get('datasources').get('destination').get('type' , ''))
+    if dst_ds == '':
+        dst_ds = str(config.get('datasources').get('destination').get('db_type' , ''))
+    if dst_ds == '' and out_path != '':
+        dst_ds = 'file'
+    if dst_ds == '' and out_path == '':
+        raise ValueError('No destination data type specified in the configuration file')
+
+    return src_ds, dst_ds
+
+# Function that compiles a job configuration into an execution plan. The plan holds the
+# compiled source action and transform steps (with their parameters, SQL files, DSL/jq
+# templates and schemas already resolved), so it can be executed many times (for example
+# on every scheduled run) without parsing the job configuration again
+def etleng_compile_pipeline(config):
+    """
+    Compile the ETL Pipeline
+    :param config: Job configuration
+    :return: Execution plan
+    """
+    src_ds, dst_ds = get_pipeline_datasources(config)
+    exec_mode, batch_size = get_execution_mode(config)
+
+    transform_sequence = []
+    if config.get("actions").get("transform") != None:
+        transform_sequence = config.get("actions").get("transform").get("sequence")
+
+    plan = {
+        'config': config,
+        'source_type': src_ds,
+        'destination_type': dst_ds,
+        'mode': exec_mode,
+        'batch_size': batch_size,
+        'dtype_backend': get_dtype_backend(config),
+        'profile': is_profiling_enabled(config),
+        'source_step': compile_step(config, config.get('paths').get('inp_path'), 'source', config.get('actions').get('source')),
+        'steps': compile_transform_sequence(config, transform_sequence),
+        # Sequences with a write step (to the destination) write the data themselves
+        'write_step': any(str(transform.get('type', '')).lower().strip() == 'write' and transform.get('location') == None
+                          for transform in transform_sequence or []),
+    }
+    return plan
+
 # Function that runs the ETL pipeline
 def etleng_run_pipeline(config):
     """
@@ -1244,29 +3112,65 @@ def etleng_run_pipeline(config):
     """
     
     try:
-        # Process configuration file
-        inp_path: str = config.get('paths').get('inp_path')
-        out_path: str = config.get('paths').get('out_path')
-        src_ds: str = ''
-        src_ds = str(config.get('datasources').get('source').get('type' , ''))
-        if src_ds == '':
-            src_ds = str(config.get('datasources').get('source').get('db_type' , ''))
-        if src_ds == '' and inp_path != '':
-            src_ds = 'file'
-        if src_ds == '' and inp_path == '':
-            raise ValueError('No source data type specified in the configuration file')
-        
-        dst_ds: str = ''
-        dst_ds = str(config.get('datasources').get('destination').get('type' , ''))
-        if dst_ds == '':
-            dst_ds = str(config.get('datasources').get('destination').get('db_type' , ''))
-        if dst_ds == '' and out_path != '':
-            dst_ds = 'file'
-        if dst_ds == '' and out_path == '':
-            raise ValueError('No destination data type specified in the configuration file')
+        # Compile and run the pipeline
+        return etleng_run_plan(etleng_compile_pipeline(config))
+    except Exception as e:
+        logging.error(err_msg[14] + str(e))
+        logging.error(err_msg[0].format(traceback.format_exc()))
+        return False
+
+# Function that runs an execution plan (see etleng_compile_pipeline)
+def etleng_run_plan(plan):
+    """
+    Run an Execution Plan
+    :param plan: Execution plan
+    :return: True if the pipeline completed successfully
+    """
+    profile = None
+    if plan.get('profile'):
+        profile = prof.new_profile(plan.get('config').get('job_name', 'job'))
+    plan.get('config').pop('incremental_state', None)
+
+    # In streaming mode, source data flows through the pipeline one batch at the time:
+    if plan.get('mode') == 'streaming':
+        result = etleng_run_plan_streaming(plan, profile)
+    else:
+        result = etleng_run_plan_batch(plan, profile)
+
+    # The incremental ingestion manifests are committed only after a successful run:
+    if result:
+        result = commit_incremental_state(plan.get('config'))
+    else:
+        plan.get('config').pop('incremental_state', None)
 
+    if profile != None:
+        finish_run_profile(plan.get('config'), profile, 'ok' if result else 'failed')
+    return result
+
+# Function that runs an execution plan in batch mode: the whole source is read in memory
+# and then transformed
+def etleng_run_plan_batch(plan, profile=None):
+    """
+    Run an Execution Plan in batch mode
+    :param plan: Execution plan
+    :param profile: Profile where to record the pipeline measurements (None to not profile it)
+    :return: True if the pipeline completed successfully
+    """
+    config = plan.get('config')
+    try:
         # Read the Data from the Source
-        data = read_data_from_ds(config, str(src_ds), "source")
+        data = prof.profile_call(profile, 'source', 'source',
+                                 lambda _: read_data_from_ds(config, str(plan.get('source_type')), "source", plan.get('source_step')), None)
+        # An incremental run that found no new files has nothing to transform or write
+        if no_incremental_files(config, 'source'):
+            logging.info("No new or changed files to read, nothing to do")
+            config['run_stats'] = { 'rows_in': 0, 'rows_out': 0 }
+            return True
+        data = apply_dtype_backend(data, plan.get('dtype_backend', 'numpy'))
+        config['run_stats'] = { 'rows_in': count_records(data), 'rows_out': None }
+        # Destinations are written at the end of the run (file destinations are replaced atomically,
+        # database destinations are committed once), or by the write steps of the sequence
+        writer = open_run_writers(config)
         if debug_level > 0:
             print("-- Data from source (in etleng_run_pipeline):")
             print(data)
@@ -1274,11 +3178,19 @@ def etleng_run_pipeline(config):
 
         # Transform the Data to the new format:
         if config.get("actions").get("transform") != None:
-            data = transform_data(config, data, "transform")
+            data = run_compiled_steps(plan.get('steps'), data, profile)
+            if data is None:
+                raise ValueError("No data after transforming the source data")
             if debug_level > 0:
                 print("-- Data from transform (in etleng_run_pipeline):")
                 print(data)
                 print("--")
+        config['run_stats']['rows_out'] = count_records(data)
+
+        # Write the Data to the destination
+        if writer != None and not plan.get('write_step'):
+            prof.profile_call(profile, 'destination', 'destination', lambda batch: write_destination_batch(writer, batch), data)
+        config['run_stats'].update(close_run_writers(config))
 
         # if config['old_json_schema'] != '':
         #     data = transform_data_old_to_new(data, old_json_schema, json_schema)
@@ -1291,10 +3203,146 @@ def etleng_run_pipeline(config):
         # write_data_to_json(data, json_file)
         return True
     except Exception as e:
+        close_run_writers(config, False)
+        logging.error(err_msg[14] + str(e))
+        logging.error(err_msg[0].format(traceback.format_exc()))
+        return False
+
+# Function that completes the profile of a run: the report is stored in the job configuration
+# (run_profile) and written, as JSON, in the execution.profile_path directory (by default the
+# logs directory in the job base path)
+def finish_run_profile(config, profile, status: str = 'ok'):
+    """
+    Finish the Profile of a run
+    :param config: Job configuration
+    :param profile: Profile
+    :param status: Status of the run
+    :return: Profile report
+    """
+    report = prof.finish_profile(profile, status)
+    config['run_profile'] = report
+    report_path = (config.get('execution') or {}).get('profile_path')
+    if report_path == None:
+        report_path = os.path.join(str((config.get('paths') or {}).get('base_path', base_path)), 'logs')
+    config['run_profile_report'] = prof.write_profile_report(report, process_pyexpr(report_path))
+    return report
+
+# Function that runs an execution plan in streaming mode: the source produces batches of
+# batch_size records and each batch flows through the transform sequence until the first
+# blocking step (if any). Blocking steps (and all the steps after them) run once on the
+# collected batches.
+def etleng_run_plan_streaming(plan, profile=None):
+    """
+    Run an Execution Plan in streaming mode
+    :param plan: Execution plan
+    :param profile: Profile where to record the pipeline measurements (None to not profile it)
+    :return: True if the pipeline completed successfully
+    """
+    config = plan.get('config')
+    try:
+        # Split the Transform steps at the first blocking step
+        streaming_steps, blocking_steps = split_transform_sequence(plan.get('steps'))
+        if len(blocking_steps) > 0:
+            logging.info("Streaming pipeline: batches will be collected before blocking step: " + blocking_steps[0].get('name'))
+
+        # Read, and transform, the Data one batch at the time
+        run_stats = { 'rows_in': 0, 'rows_out': 0, 'batches': 0 }
+        config['run_stats'] = run_stats
+        collected_batches = []
+        batch_no = 0
+        # Destinations are written batch by batch (files are replaced, and loads committed, at the end of the
+        # run), by the run or by the write steps of the sequence
+        writer = open_run_writers(config)
+        if plan.get('write_step'):
+            writer = None
+        source_batches = read_data_batches_from_ds(config, str(plan.get('source_type')), "source", plan.get('batch_size'), plan.get('source_step'))
+        for batch in prof.profile_iter(profile, 'source', 'source', source_batches):
+            batch_no += 1
+            run_stats['batches'] = batch_no
+            run_stats['rows_in'] = add_record_count(run_stats['rows_in'], count_records(batch))
+            batch = run_compiled_steps(streaming_steps, apply_dtype_backend(batch, plan.get('dtype_backend', 'numpy')), profile)
+            if batch is None:
+                raise ValueError("No data after transforming batch: " + str(batch_no))
+            if debug_level > 1:
+                print("-- Batch " + str(batch_no) + " from transform (in etleng_run_plan_streaming):")
+                print(batch)
+                print("--")
+            if len(blocking_steps) > 0:
+                collected_batches.append(batch)
+            else:
+                run_stats['rows_out'] = add_record_count(run_stats['rows_out'], count_records(batch))
+                if writer != None:
+                    prof.profile_call(profile, 'destination', 'destination', lambda data: write_destination_batch(writer, data), batch)
+
+        # Run the blocking steps on the whole dataset
+        if len(blocking_steps) > 0:
+            data = prof.profile_call(profile, 'collect batches', 'transform', concat_data_batches, collected_batches)
+            data = run_compiled_steps(blocking_steps, data, profile)
+            if data is None:
+                raise ValueError("No data after the blocking steps")
+            run_stats['rows_out'] = count_records(data)
+            if writer != None:
+                prof.profile_call(profile, 'destination', 'destination', lambda batch: write_destination_batch(writer, batch), data)
+            if debug_level > 0:
+                print("-- Data from transform (in etleng_run_plan_streaming):")
+                print(data)
+                print("--")
+
+        run_stats.update(close_run_writers(config))
+
+        if debug_level > 0:
+            print("-- Processed " + str(batch_no) + " batches (in etleng_run_plan_streaming)")
+        return True
+    except Exception as e:
+        close_run_writers(config, False)
         logging.error(err_msg[14] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return False
 
+# Function that loads a pipeline configuration file and returns the job configuration
+# (with the paths the pipeline will use)
+def etleng_load_job_config(config_file, base_path: str, cfg_path: str, inp_path: str, out_path: str):
+    """
+    Load a Job Configuration File
+    :param config_file: Configuration File
+    :param base_path: Base Path
+    :param cfg_path: Configuration Path
+    :param inp_path: Input Data path (if any)
+    :param out_path: Output Data path (if any)
+    :return: Job Configuration
+    """
+    if debug_level > 0:
+        print('Loading config file: ' + config_file)
+
+    # Add the !include constructor to the yaml loader
+    # which will use for base_path the parent path to the directory that contains 
+    # the jobs configuration file
+    YamlIncludeConstructor.add_to_loader_class(loader_class=yaml.FullLoader, base_dir=base_path)
+
+    # Read the Configuration File
+    config = read_config_file(os.path.join(cfg_path, config_file))
+    # Check if the input path is provided in the configuration file
+    if config.get('datasources').get('source').get('local_input_data') != None:
+        inp_path = str(config.get('datasources').get('source').get('local_input_data'))
+    # Check if the output path is provided in the configuration file
+    if config.get('datasources').get('destination').get('local_output_data') != None:
+        out_path = str(config.get('datasources').get('destination').get('local_output_data'))
+
+    paths = {
+            "base_path": base_path,
+            "cfg_path": cfg_path,
+            "inp_path": inp_path,
+            "out_path": out_path
+    }
+
+    config["paths"] = paths
+    config["job_name"] = config_file
+
+    if debug_level > 1:
+        print(yaml.dump(config, default_flow_style=False))
+
+    return config
+
 # Function that loads a pipeline configuration file and run the ETL pipeline
 def etleng_run_pipeline_from_config(config_file, base_path: str, cfg_path: str, inp_path: str, out_path: str):
     """
@@ -1306,39 +3354,204 @@ def etleng_run_pipeline_from_config(config_file, base_path: str, cfg_path: str,
     :return: None
     """
     try:
-        if debug_level > 0:
-            print('Loading config file: ' + config_file)
-
-        # Add the !include constructor to the yaml loader
-        # which will use for base_path the parent path to the directory that contains 
-        # the jobs configuration file
-        YamlIncludeConstructor.add_to_loader_class(loader_class=yaml.FullLoader, base_dir=base_path)
-
-        # Read the Configuration File
-        config = read_config_file(os.path.join(cfg_path, config_file))
-        # Check if the input path is provided in the configuration file
-        if config.get('datasources').get('source').get('local_input_data') != None:
-            inp_path = str(config.get('datasources').get('source').get('local_input_data'))
-        # Check if the output path is provided in the configuration file
-        if config.get('datasources').get('destination').get('local_output_data') != None:
-            out_path = str(config.get('datasources').get('destination').get('local_output_data'))
-
-        paths = {
-                "base_path": base_path,
-                "cfg_path": cfg_path,
-                "inp_path": inp_path,
-                "out_path": out_path
-        }
-
-        config["paths"] = paths
-
-        if debug_level > 1:
-            print(yaml.dump(config, default_flow_style=False))
+        # Load the job configuration
+        config = etleng_load_job_config(config_file, base_path, cfg_path, inp_path, out_path)
 
         # Run the ETL Pipeline
         return etleng_run_pipeline(config)
 
     except Exception as e:
-        logging.error(err_msg[15] + str(e))
+        logging.error(err_msg[14] + str(e))
         logging.error(err_msg[0].format(traceback.format_exc()))
         return False
+
+# Function that runs a single job (a pipeline configuration file) and returns a summary of the run.
+# Failures are isolated: both exceptions and sys.exit() calls (used by core and dbconn on fatal
+# errors) are reported as a failed job instead of terminating the caller. This is the function
+# the CLI runs (also in its worker processes)
+def etleng_run_job(config_file, base_path: str, cfg_path: str, inp_path: str, out_path: str, profile: bool = False):
+    """
+    Run a Job and return its summary
+    :param config_file: Configuration File
+    :param base_path: Base Path
+    :param cfg_path: Configuration Path
+    :param inp_path: Input Data path (if any)
+    :param out_path: Output Data path (if any)
+    :param profile: True to profile the job run (regardless of its execution.profile setting)
+    :return: Job summary (job, status, wall_time, rows_in, rows_out, write_throughput, error and, if profiled, profile)
+    """
+    summary = {
+        'job': config_file,
+        'status': 'failed',
+        'wall_time': 0.0,
+        'rows_in': None,
+        'rows_out': None,
+        'write_throughput': None,
+        'error': None,
+    }
+    start_time = time.perf_counter()
+    try:
+        config = etleng_load_job_config(config_file, base_path, cfg_path, inp_path, out_path)
+        if profile:
+            if config.get('execution') == None:
+                config['execution'] = {}
+            config['execution']['profile'] = True
+        if etleng_run_pipeline(config):
+            summary['status'] = 'ok'
+        else:
+            summary['error'] = 'pipeline failed'
+        run_stats = config.get('run_stats', {})
+        summary['rows_in'] = run_stats.get('rows_in')
+        summary['rows_out'] = run_stats.get('rows_out')
+        summary['write_throughput'] = run_stats.get('write_throughput')
+        if config.get('run_profile') != None:
+            summary['profile'] = config.get('run_profile')
+            summary['profile_report'] = config.get('run_profile_report')
+    except SystemExit as e:
+        summary['error'] = 'job exited with code: ' + str(e.code)
+    except Exception as e:
+        logging.error(err_msg[14] + str(e))
+        logging.error(err_msg[0].format(traceback.format_exc()))
+        summary['error'] = str(e)
+    summary['wall_time'] = time.perf_counter() - start_time
+    return summary
+
+# Function that prepares a job for the watch mode (see etleng_watch_jobs): the job configuration
+# is loaded and compiled once, and its database connections are pooled, so every micro-batch runs
+# on a warm pipeline. Returns None for the jobs that cannot be watched (e.g. database sources)
+def etleng_prepare_watch_job(config_file, base_path: str, cfg_path: str, inp_path: str, out_path: str, profile: bool = False):
+    """
+    Prepare a Job for the watch mode
+    :param config_file: Configuration File
+    :param base_path: Base Path
+    :param cfg_path: Configuration Path
+    :param inp_path: Input Data path (if any)
+    :param out_path: Output Data path (if any)
+    :param profile: True to profile the job runs
+    :return: Watched job (a dictionary with job, config, plan and watch state) or None
+    """
+    try:
+        config = etleng_load_job_config(config_file, base_path, cfg_path, inp_path, out_path)
+        if profile:
+            if config.get('execution') == None:
+                config['execution'] = {}
+            config['execution']['profile'] = True
+        src_ds = get_pipeline_datasources(config)[0].lower().strip()
+        if src_ds not in file_datasource_types:
+            logging.warning("Job " + str(config_file) + " does not read files (source type: " + src_ds + "), it cannot be watched")
+            return None
+        files_settings = fio.get_files_settings(config.get('datasources').get('source') or {}, src_ds)
+        recursive = files_settings['recursive'] or get_partitioning(config, 'source') != None
+        config['connection_pool'] = {}
+        # Every micro-batch runs the same plan: file destinations get a new file per micro-batch, so
+        # a micro-batch never replaces the output of the previous ones
+        config['unique_file_names'] = True
+        return {
+            'job': config_file,
+            'config': config,
+            'plan': etleng_compile_pipeline(config),
+            'state': wtc.new_watch_state(config.get('paths').get('inp_path'), files_settings['include'], files_settings['exclude'], recursive),
+        }
+    except (Exception, SystemExit) as e:
+        logging.error(err_msg[14] + "Cannot watch job " + str(config_file) + ": " + str(e))
+        logging.error(err_msg[0].format(traceback.format_exc()))
+        return None
+
+# Function that runs a watched job on a micro-batch of files and returns a summary of the run (see
+# etleng_run_job). The files are marked as processed only when the run succeeds: the files of a failed
+# run are pending again and retried later (see watcher.mark_failed)
+def etleng_run_micro_batch(watch_job, files, settings=None):
+    """
+    Run a watched Job on a Micro-batch of files
+    :param watch_job: Watched job (see etleng_prepare_watch_job)
+    :param files: List of file names
+    :param settings: Watch settings (max_retries and retry_delay, see watcher.default_watch_settings)
+    :return: Run summary (job, status, wall_time, rows_in, rows_out, write_throughput, error, files and, if profiled, profile)
+    """
+    config = watch_job.get('config')
+    summary = {
+        'job': watch_job.get('job'),
+        'status': 'failed',
+        'wall_time': 0.0,
+        'rows_in': None,
+        'rows_out': None,
+        'write_throughput': None,
+        'error': None,
+        'files': len(files),
+    }
+    start_time = time.perf_counter()
+    config['source_files'] = files
+    try:
+        if etleng_run_plan(watch_job.get('plan')):
+            summary['status'] = 'ok'
+        else:
+            summary['error'] = 'pipeline failed'
+        run_stats = config.get('run_stats', {})
+        summary['rows_in'] = run_stats.get('rows_in')
+        summary['rows_out'] = run_stats.get('rows_out')
+        summary['write_throughput'] = run_stats.get('write_throughput')
+        if config.get('run_profile') != None:
+            summary['profile'] = config.get('run_profile')
+            summary['profile_report'] = config.get('run_profile_report')
+    except SystemExit as e:
+        summary['error'] = 'job exited with code: ' + str(e.code)
+    except Exception as e:
+        logging.error(err_msg[14] + str(e))
+        logging.error(err_msg[0].format(traceback.format_exc()))
+        summary['error'] = str(e)
+    finally:
+        config.pop('source_files', None)
+    if summary['status'] == 'ok':
+        wtc.mark_processed(watch_job.get('state'), files)
+    else:
+        settings = dict(wtc.default_watch_settings, **{key: value for key, value in (settings or {}).items() if value != None})
+        logging.error(err_msg[14] + "Micro-batch of job " + str(watch_job.get('job')) + " failed on files: " + ', '.join(files))
+        given_up = wtc.mark_failed(watch_job.get('state'), files, time.monotonic(), int(settings['max_retries']), float(settings['retry_delay']))
+        if len(given_up) > 0:
+            logging.error(err_msg[14] + "Files of job " + str(watch_job.get('job')) + " not retried anymore (until they change): " + ', '.join(given_up))
+    summary['wall_time'] = time.perf_counter() - start_time
+    return summary
+
+# Function that watches the input directories of the jobs and runs each job on the files that arrive,
+# grouped in micro-batches of up to batch_files files (or the files that waited batch_latency seconds).
+# Directories are polled every poll_interval seconds until the process is interrupted (or, if given,
+# for max_polls polls: the last poll runs all the pending files that are not waiting for a retry)
+def etleng_watch_jobs(jobs, base_path: str, cfg_path: str, inp_path: str, out_path: str, settings=None, profile: bool = False, on_result=None, max_polls: int = None):
+    """
+    Watch the Jobs input directories
+    :param jobs: List of Configuration Files
+    :param base_path: Base Path
+    :param cfg_path: Configuration Path
+    :param inp_path: Input Data path (if any)
+    :param out_path: Output Data path (if any)
+    :param settings: Watch settings (poll_interval, batch_files, batch_latency, max_retries and retry_delay, see watcher.default_watch_settings)
+    :param profile: True to profile the job runs
+    :param on_result: Function called with the summary of each micro-batch run
+    :param max_polls: Number of polls (None to watch until interrupted)
+    :return: List of the micro-batch run summaries
+    """
+    settings = dict(wtc.default_watch_settings, **{key: value for key, value in (settings or {}).items() if value != None})
+    watch_jobs = [watch_job for watch_job in [etleng_prepare_watch_job(config_file, base_path, cfg_path, inp_path, out_path, profile) for config_file in jobs] if watch_job != None]
+    results = []
+    polls = 0
+    try:
+        while max_polls == None or polls < max_polls:
+            polls += 1
+            last_poll = max_polls != None and polls == max_polls
+            for watch_job in watch_jobs:
+                wtc.poll_files(watch_job.get('state'), time.monotonic())
+                files = wtc.take_micro_batch(watch_job.get('state'), time.monotonic(), int(settings['batch_files']), float(settings['batch_latency']), last_poll)
+                while len(files) > 0:
+                    result = etleng_run_micro_batch(watch_job, files, settings)
+                    results.append(result)
+                    if on_result != None:
+                        on_result(result)
+                    files = wtc.take_micro_batch(watch_job.get('state'), time.monotonic(), int(settings['batch_files']), float(settings['batch_latency']), last_poll)
+            if not last_poll:
+                time.sleep(float(settings['poll_interval']))
+    except KeyboardInterrupt:
+        logging.info("Watch mode interrupted")
+    finally:
+        for watch_job in watch_jobs:
+            close_connection_pool(watch_job.get('config'))
+    return results
@@ -43,6 +43,15 @@ from . import plugin_mongodb as mongodb
 # Import error messages:
 from . import error_msg as erx
 
+# Import utilities
+from . import utilities as utils
+
+# Database types that can be used as (bulk loaded) destinations (see open_db_loader)
+db_loader_types = ['postgres', 'snowflake', 'elasticsearch', 'mongodb', 'neo4j']
+
+# Database types that support the merge write mode (see utilities.get_write_mode)
+db_merge_types = ['postgres', 'snowflake']
+
 # function that returns a generic connection object to the database (using one of the available plugins)
 # accept db connection parameters as a collection of keyword arguments
 # passed to the function
@@ -63,17 +72,17 @@ def get_db_connection(kwargs, target: str = 'source'):
         if db_type == 'none':
             return None
         elif db_type == 'postgres':
-            return postgres.get_connection(kwargs)
+            return postgres.get_connection(kwargs, target)
         #elif db_type == 'mysql':
         #    return _get_mysql_connection(kwargs)
         elif db_type == 'neo4j':
-            return neo4j.get_connection(kwargs)
+            return neo4j.get_connection(kwargs, target)
         elif db_type == 'elasticsearch':
-            return es.get_connection(kwargs)
+            return es.get_connection(kwargs, target)
         elif db_type == 'mongodb':
-            return mongodb.get_connection(kwargs)
+            return mongodb.get_connection(kwargs, target)
         elif db_type == 'snowflake':
-            return sf.get_connection(kwargs)
+            return sf.get_connection(kwargs, target)
         else:
             logging.error(erx.msg[1])
             sys.exit(1)
@@ -333,4 +342,193 @@ def execute_db_query_return_json(conn, cur, query, db_type, query_params=None):
         logging.error(erx.msg[0].format
                         (traceback.format_exc()))
         sys.exit(1)
-        
\ No newline at end of file
+        
+# Function that runs a query and yields the results as dataframes of (at most) batch_size rows each
+def execute_db_query_return_batches(conn, cur, query, db_type, query_params=None, batch_size: int = 10000):
+    """
+    Execute Database Query and Return Dataframe batches
+    :param conn: Database Connection Object
+    :param cur: Database Cursor Object
+    :param query: Query to execute
+    :param db_type: Database Type
+    :param query_params: Query Parameters
+    :param batch_size: Number of rows per batch
+    :return: Generator of Dataframes
+    """
+    try:
+        if db_type is None:
+            db_type = 'none'
+        db_type = str(db_type).lower().strip(' ')
+        if db_type == 'none':
+            return
+        elif db_type == 'snowflake':
+            yield from sf.exec_query_return_batches(conn, cur, query, query_params, batch_size)
+        elif db_type == 'postgres':
+            yield from postgres.exec_query_return_batches(conn, cur, query, query_params, batch_size)
+        #elif db_type == 'mysql':
+        #    yield from _execute_mysql_query_return_batches(conn, cur, query, query_params, batch_size)
+        elif db_type in ['neo4j', 'mongodb', 'elasticsearch']:
+            # These plugins cannot fetch results incrementally (yet), so we split the whole result
+            df = execute_db_query_return_dataframe(conn, cur, query, db_type, query_params)
+            if df is not None:
+                for start in range(0, len(df), batch_size):
+                    yield df.iloc[start:start + batch_size]
+        else:
+            logging.error(erx.msg[1])
+            sys.exit(1)
+    except Exception as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        sys.exit(1)
+
+# Function that runs a query and returns the results as an Arrow table
+def execute_db_query_return_arrow(conn, cur, query, db_type, query_params=None):
+    """
+    Execute Database Query and Return Arrow Table
+    :param conn: Database Connection Object
+    :param cur: Database Cursor Object
+    :param query: Query to execute
+    :param db_type: Database Type
+    :param query_params: Query Parameters
+    :return: Arrow Table
+    """
+    try:
+        if db_type is None:
+            db_type = 'none'
+        db_type = str(db_type).lower().strip(' ')
+        if db_type == 'none':
+            return None
+        elif db_type == 'snowflake':
+            return sf.exec_query_return_arrow(conn, cur, query, query_params)
+        elif db_type == 'postgres':
+            return postgres.exec_query_return_arrow(conn, cur, query, query_params)
+        #elif db_type == 'mysql':
+        #    return _execute_mysql_query_return_arrow(conn, cur, query, query_params)
+        elif db_type in ['neo4j', 'mongodb', 'elasticsearch']:
+            # These plugins cannot produce Arrow tables (yet), so we convert their dataframe
+            df = execute_db_query_return_dataframe(conn, cur, query, db_type, query_params)
+            if df is None:
+                return None
+            return utils.pa.Table.from_pandas(df, preserve_index=False)
+        else:
+            logging.error(erx.msg[1])
+            sys.exit(1)
+    except Exception as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        sys.exit(1)
+
+# Function that runs a query and yields the results as Arrow tables of (at most) batch_size rows each
+def execute_db_query_return_arrow_batches(conn, cur, query, db_type, query_params=None, batch_size: int = 10000):
+    """
+    Execute Database Query and Return Arrow Table batches
+    :param conn: Database Connection Object
+    :param cur: Database Cursor Object
+    :param query: Query to execute
+    :param db_type: Database Type
+    :param query_params: Query Parameters
+    :param batch_size: Number of rows per batch
+    :return: Generator of Arrow Tables
+    """
+    try:
+        if db_type is None:
+            db_type = 'none'
+        db_type = str(db_type).lower().strip(' ')
+        if db_type == 'none':
+            return
+        elif db_type == 'snowflake':
+            yield from sf.exec_query_return_arrow_batches(conn, cur, query, query_params, batch_size)
+        elif db_type == 'postgres':
+            yield from postgres.exec_query_return_arrow_batches(conn, cur, query, query_params, batch_size)
+        #elif db_type == 'mysql':
+        #    yield from _execute_mysql_query_return_arrow_batches(conn, cur, query, query_params, batch_size)
+        elif db_type in ['neo4j', 'mongodb', 'elasticsearch']:
+            table = execute_db_query_return_arrow(conn, cur, query, db_type, query_params)
+            if table is not None:
+                for start in range(0, table.num_rows, batch_size):
+                    yield table.slice(start, batch_size)
+        else:
+            logging.error(erx.msg[1])
+            sys.exit(1)
+    except Exception as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        sys.exit(1)
+
+# Function that opens a bulk loader of a table (or collection, index, ...) of the database (using one
+# of the available plugins). The loader writes the batches passed to load_db_batch and makes them
+# visible when it is closed (see close_db_loader)
+def open_db_loader(conn, db_type, table, write_options=None):
+    """
+    Open a Database Loader
+    :param conn: Database Connection Object
+    :param db_type: Database Type
+    :param table: Target table name
+    :param write_options: Write options (see the plugin loaders)
+    :return: Loader (a dictionary)
+    """
+    db_type = str(db_type).lower().strip(' ')
+    try:
+        if db_type not in db_loader_types:
+            raise ValueError(erx.msg[1] + ": " + db_type + " (bulk loading is not supported)")
+        if str((write_options or {}).get('write_mode', 'append')).lower().strip() == 'merge' and db_type not in db_merge_types:
+            raise ValueError("The merge write mode is not supported by " + db_type + " destinations")
+        if db_type == 'postgres':
+            loader = postgres.open_copy_loader(conn, table, write_options)
+        elif db_type == 'snowflake':
+            loader = sf.open_stage_loader(conn, table, write_options)
+        elif db_type == 'elasticsearch':
+            loader = es.open_bulk_loader(conn, table, write_options)
+        elif db_type == 'mongodb':
+            loader = mongodb.open_bulk_write_loader(conn, table, write_options)
+        elif db_type == 'neo4j':
+            loader = neo4j.open_unwind_loader(conn, table, write_options)
+        loader['db_type'] = db_type
+        return loader
+    except Exception as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+
+# Function that loads a batch of data (DataFrame or Arrow Table) with a database loader
+def load_db_batch(loader, data):
+    """
+    Load a Batch of data
+    :param loader: Loader (see open_db_loader)
+    :param data: DataFrame or Arrow Table
+    :return: Number of records loaded
+    """
+    if loader.get('db_type') == 'postgres':
+        return postgres.copy_batch(loader, data)
+    elif loader.get('db_type') == 'snowflake':
+        return sf.stage_batch(loader, data)
+    elif loader.get('db_type') == 'elasticsearch':
+        return es.bulk_batch(loader, data)
+    elif loader.get('db_type') == 'mongodb':
+        return mongodb.bulk_write_batch(loader, data)
+    elif loader.get('db_type') == 'neo4j':
+        return neo4j.unwind_batch(loader, data)
+    raise ValueError(erx.msg[1] + ": " + str(loader.get('db_type')))
+
+# Function that closes a database loader, committing (or, when commit is False, discarding) the load
+def close_db_loader(loader, commit: bool = True):
+    """
+    Close a Database Loader
+    :param loader: Loader (see open_db_loader)
+    :param commit: True to commit the load, False to discard it
+    :return: Number of records loaded
+    """
+    if loader.get('db_type') == 'postgres':
+        return postgres.close_copy_loader(loader, commit)
+    elif loader.get('db_type') == 'snowflake':
+        return sf.close_stage_loader(loader, commit)
+    elif loader.get('db_type') == 'elasticsearch':
+        return es.close_bulk_loader(loader, commit)
+    elif loader.get('db_type') == 'mongodb':
+        return mongodb.close_bulk_write_loader(loader, commit)
+    elif loader.get('db_type') == 'neo4j':
+        return neo4j.close_unwind_loader(loader, commit)
+    raise ValueError(erx.msg[1] + ": " + str(loader.get('db_type')))
@@ -37,17 +37,20 @@ def get_connection(kwargs, target: str = 'source'):
         pwd = kwargs.get("datasources").get(target).get('password')
         if pwd == None:
             pwd = str(os.environ.get('ELASTIC_PASSWORD'))
-        if kwargs.get("datasources").get(target).get('cloud_id') != None:
+        usr = kwargs.get("datasources").get(target).get('user')
+        if usr == None:
+            usr = os.environ.get('ELASTIC_USER', 'elastic')
+        if kwargs.get("datasources").get(target).get('cloud_id') == None:
             conn = elasticsearch.Elasticsearch( 
-                hosts=str(kwargs.get("datasources").get(target).get('hosts', '')),
-                basic_auth=("elastic", pwd),
-                ca_certs=str(kwargs.get("datasources").get(target).get('ca_certs', '')),
+                hosts=kwargs.get("datasources").get(target).get('hosts', 'http://localhost:9200'),
+                basic_auth=(usr, pwd),
+                ca_certs=kwargs.get("datasources").get(target).get('ca_certs'),
             )
         else:
             conn = elasticsearch.Elasticsearch( 
                 cloud_id=kwargs.get("datasources").get(target).get('cloud_id'),
-                basic_auth=("elastic", pwd),
-                ca_certs=kwargs.get("datasources").get(target).get('ca_certs', 1),
+                basic_auth=(usr, pwd),
+                ca_certs=kwargs.get("datasources").get(target).get('ca_certs'),
             )
         return conn
     except Exception as e:
@@ -69,36 +72,41 @@ def close_connection(conn):
         logging.error(erx.msg[0].format(traceback.format_exc()))
         sys.exit(1)
 
-# function that returns a generic cursor object to the database using Elasticsearch
+# function that returns a generic cursor object to the database using Elasticsearch. Elasticsearch
+# has no cursors, so the client itself is used to run the queries
 def get_cursor(conn):
     """
     Get Elasticsearch Cursor
     :param conn: Elasticsearch Connection Object
-    :return: Elasticsearch Cursor Object
+    :return: Elasticsearch Cursor Object (the connection)
     """
-    try:
-        # Create a Elasticsearch cursor object
-        cur = conn.cursor()
-        return cur
-    except Exception as e:
-        logging.error(erx.msg[0].format(str(e)))
-        logging.error(erx.msg[0].format
-                        (traceback.format_exc()))
-        sys.exit(1)
+    return conn
 
-# Function to close a Elasticsearch cursor
+# Function to close a Elasticsearch cursor (nothing to close, see get_cursor)
 def close_cursor(cur):
     """
     Close Elasticsearch Cursor
     :param cur: Elasticsearch Cursor Object
     :return: None
     """
-    try:
-        cur.close()
-    except Exception as e:
-        logging.error(erx.msg[0].format(str(e)))
-        logging.error(erx.msg[0].format(traceback.format_exc()))
-        sys.exit(1)
+    return None
+
+# Function that runs a search request: the query is a search request body (a dictionary or a JSON
+# string), the index is taken from the query parameters (or from the index key of the query)
+def search(conn, query, query_params=None):
+    """
+    Run an Elasticsearch Search
+    :param conn: Elasticsearch Connection Object
+    :param query: Search request body (dictionary or JSON string)
+    :param query_params: Query Parameters (index)
+    :return: List of the hits sources
+    """
+    body = json.loads(query) if isinstance(query, str) else dict(query)
+    index = body.pop('index', None)
+    if isinstance(query_params, dict) and query_params.get('index') != None:
+        index = query_params.get('index')
+    response = conn.search(index=index, body=body)
+    return [hit.get('_source') for hit in response['hits']['hits']]
 
 # function that executes a query on the Elasticsearch database
 def exec_query(conn, cur, query, query_params=None):
@@ -111,13 +119,11 @@ def exec_query(conn, cur, query, query_params=None):
     """
     try:
         # Execute the query
-        cur.execute(query, query_params)
-        conn.commit()
+        search(conn, query, query_params)
     except Exception as e:
         logging.error(erx.msg[0].format(str(e)))
         logging.error(erx.msg[0].format
                         (traceback.format_exc()))
-        conn.rollback
         sys.exit(1)
 
 # function that executes a query on the Elasticsearch database and returns the results
@@ -130,17 +136,12 @@ def exec_query_return_results(conn, cur, query, query_params=None):
     :return: Results
     """
     try:
-        # Execute the query
-        cur.execute(query, query_params)
-        conn.commit()
-        # Fetch the results
-        results = cur.fetchall()
-        return results
+        # Execute the query and return the hits
+        return search(conn, query, query_params)
     except Exception as e:
         logging.error(erx.msg[0].format(str(e)))
         logging.error(erx.msg[0].format
                         (traceback.format_exc()))
-        conn.rollback()
         sys.exit(1)
 
 # function that executes a query on the elasticsearch database and returns the results as a dataframe
@@ -153,13 +154,8 @@ def exec_query_return_dataframe(conn, cur, query, query_params=None):
     :return: Dataframe
     """
     try:
-        # Execute the query
-        cur.execute(query, query_params)
-        conn.commit()
-        # Fetch the results as Dataframes
-        df = pd.DataFrame(cur.fetchall())
-        df.columns=[ x.name for x in cur.description ]
-        return df
+        # Execute the query and return the hits as a Dataframe
+        return pd.DataFrame(search(conn, query, query_params))
     except elasticsearch.exceptions.ConnectionError as e:
         logging.error(erx.msg[0].format(str(e)))
         logging.error(erx.msg[0].format
@@ -196,16 +192,8 @@ def exec_query_return_json(conn, cur, query, query_params=None):
     :return: JSON
     """
     try:
-        # Execute the query
-        cur.execute(query, query_params)
-        conn.commit()
-        # Fetch the results
-        results = cur.fetchall()
-        # Convert the results to a JSON object
-        json_data = []
-        for result in results:
-            json_data.append(dict(result))
-        return json_data
+        # Execute the query and return the hits
+        return [dict(result) for result in search(conn, query, query_params)]
     except elasticsearch.exceptions.ConnectionError as e:
         logging.error(erx.msg[0].format(str(e)))
         logging.error(erx.msg[0].format
@@ -231,3 +219,128 @@ def exec_query_return_json(conn, cur, query, query_params=None):
         logging.error(erx.msg[0].format
                         (traceback.format_exc()))
         sys.exit(1)
+
+# Bulk indexing methods of the Elasticsearch loader (see open_bulk_loader)
+# parallel:  elasticsearch.helpers.parallel_bulk, chunks are sent by thread_count threads
+# streaming: elasticsearch.helpers.streaming_bulk, chunks are sent one at the time
+bulk_methods = ['parallel', 'streaming']
+
+# Index settings changed during a load (when tune_index is true) and their values while loading
+bulk_load_settings = {'refresh_interval': '-1', 'number_of_replicas': 0}
+
+# Function that returns the current values of the settings of the indices of an index name (or alias,
+# or pattern) that are changed during a load (None for the settings that use the default value)
+def get_index_settings(conn, index):
+    """
+    Get the Settings of an index
+    :param conn: Elasticsearch Connection Object
+    :param index: Index name
+    :return: Dictionary index -> settings
+    """
+    response = conn.indices.get_settings(index=index, name=['index.' + name for name in bulk_load_settings])
+    response = getattr(response, 'body', response)
+    return {name: {setting: (settings.get('settings') or {}).get('index', {}).get(setting) for setting in bulk_load_settings}
+            for name, settings in response.items()}
+
+# Function that opens a bulk loader of an index. When tune_index is true, the refresh of the index is
+# disabled and its replicas are removed while loading (see close_bulk_loader, that restores them)
+def open_bulk_loader(conn, index, write_options=None):
+    """
+    Open a Bulk Loader
+    :param conn: Elasticsearch Connection Object
+    :param index: Index name
+    :param write_options: Write options (method, chunk_size, thread_count, max_chunk_bytes, id_column
+                          and tune_index)
+    :return: Loader (a dictionary)
+    """
+    write_options = write_options or {}
+    method = str(write_options.get('method', 'parallel')).lower().strip()
+    if method not in bulk_methods:
+        raise ValueError("Invalid bulk method: " + method + " (valid methods: " + ', '.join(bulk_methods) + ")")
+    loader = {
+        'conn': conn,
+        'table': index,
+        'method': method,
+        'chunk_size': int(write_options.get('chunk_size', 500)),
+        'thread_count': int(write_options.get('thread_count', 4)),
+        'max_chunk_bytes': int(write_options.get('max_chunk_bytes', 100 * 1024 * 1024)),
+        'id_column': write_options.get('id_column'),
+        'settings': None,
+        'rows': 0,
+    }
+    try:
+        if write_options.get('tune_index', False):
+            loader['settings'] = get_index_settings(conn, index)
+            conn.indices.put_settings(index=index, settings={'index': bulk_load_settings})
+    except elasticsearch.ApiError as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    return loader
+
+# Function that returns the bulk actions of a batch of data, one document per record (nulls are
+# indexed as missing values)
+def get_bulk_actions(loader, data):
+    """
+    Get the Bulk actions of a batch
+    :param loader: Loader (see open_bulk_loader)
+    :param data: DataFrame or Arrow Table
+    :return: Generator of bulk actions
+    """
+    records = utils.data_to_records(data)
+    id_column = loader.get('id_column')
+    for record in records:
+        action = {'_index': loader.get('table'), '_source': record}
+        if id_column != None:
+            action['_id'] = record.get(id_column)
+        yield action
+
+# Function that indexes a batch of data (DataFrame or Arrow Table) with the bulk helpers, in chunks of
+# (at most) chunk_size documents and max_chunk_bytes bytes
+def bulk_batch(loader, data):
+    """
+    Index a Batch of data
+    :param loader: Loader (see open_bulk_loader)
+    :param data: DataFrame or Arrow Table
+    :return: Number of documents indexed
+    """
+    actions = get_bulk_actions(loader, data)
+    try:
+        if loader.get('method') == 'parallel':
+            results = elasticsearch.helpers.parallel_bulk(loader.get('conn'), actions, thread_count=loader.get('thread_count'),
+                                                          chunk_size=loader.get('chunk_size'), max_chunk_bytes=loader.get('max_chunk_bytes'))
+        else:
+            results = elasticsearch.helpers.streaming_bulk(loader.get('conn'), actions, chunk_size=loader.get('chunk_size'),
+                                                           max_chunk_bytes=loader.get('max_chunk_bytes'))
+        indexed = 0
+        for ok, _ in results:
+            if ok:
+                indexed += 1
+    except (elasticsearch.helpers.BulkIndexError, elasticsearch.ApiError) as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    loader['rows'] += indexed
+    return indexed
+
+# Function that closes a bulk loader: the index settings changed by open_bulk_loader are restored and,
+# when commit is True, the index is refreshed so the documents are searchable. Elasticsearch has no
+# transactions, so the documents indexed by a failed load are not removed
+def close_bulk_loader(loader, commit: bool = True):
+    """
+    Close a Bulk Loader
+    :param loader: Loader (see open_bulk_loader)
+    :param commit: True to refresh the index
+    :return: Number of documents indexed
+    """
+    conn = loader.get('conn')
+    try:
+        for index, settings in (loader.get('settings') or {}).items():
+            conn.indices.put_settings(index=index, settings={'index': settings})
+        if commit:
+            conn.indices.refresh(index=loader.get('table'))
+    except elasticsearch.ApiError as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    return loader.get('rows')
@@ -194,3 +194,86 @@ def exec_query_return_json(conn, cur, query, query_params=None):
         logging.error(erx.msg[0].format
                         (traceback.format_exc()))
         sys.exit(1)
+
+# Default number of documents sent by each insert_many (or bulk_write) request
+default_bulk_write_batch_size = 1000
+
+# Function that returns a collection of the database: collection names can be qualified with the
+# database name (database.collection), otherwise the database of the connection string is used
+def get_collection(conn, collection):
+    """
+    Get a MongoDB Collection
+    :param conn: MongoDB Connection Object
+    :param collection: Collection name (collection or database.collection)
+    :return: MongoDB Collection Object
+    """
+    parts = str(collection).split('.', 1)
+    if len(parts) == 2:
+        return conn[parts[0]][parts[1]]
+    return conn.get_default_database()[parts[0]]
+
+# Function that opens a bulk write loader of a collection. Documents are inserted (insert_many) or, when
+# key_columns are given, upserted by key (bulk_write of UpdateOne with upsert), in unordered requests
+# so the server applies the writes of a request in parallel and a failed document does not stop the others
+def open_bulk_write_loader(conn, collection, write_options=None):
+    """
+    Open a Bulk Write Loader
+    :param conn: MongoDB Connection Object
+    :param collection: Collection name (collection or database.collection)
+    :param write_options: Write options (batch_size and key_columns)
+    :return: Loader (a dictionary)
+    """
+    write_options = write_options or {}
+    key_columns = write_options.get('key_columns') or []
+    if isinstance(key_columns, str):
+        key_columns = [key_columns]
+    return {
+        'conn': conn,
+        'table': collection,
+        'collection': get_collection(conn, collection),
+        'batch_size': int(write_options.get('batch_size', default_bulk_write_batch_size)),
+        'key_columns': list(key_columns),
+        'rows': 0,
+    }
+
+# Function that writes a batch of data: the batch is converted to documents once, and sent in unordered
+# requests of (at most) batch_size documents
+def bulk_write_batch(loader, data):
+    """
+    Write a Batch of data to a collection
+    :param loader: Loader (see open_bulk_write_loader)
+    :param data: DataFrame or Arrow Table
+    :return: Number of documents written
+    """
+    documents = utils.data_to_records(data)
+    collection = loader.get('collection')
+    key_columns = loader.get('key_columns')
+    written = 0
+    try:
+        for start in range(0, len(documents), loader.get('batch_size')):
+            chunk = documents[start:start + loader.get('batch_size')]
+            if len(key_columns) > 0:
+                requests = [pymongo.UpdateOne({key: document.get(key) for key in key_columns}, {'$set': document}, upsert=True)
+                            for document in chunk]
+                result = collection.bulk_write(requests, ordered=False)
+                written += result.matched_count + result.upserted_count
+            else:
+                result = collection.insert_many(chunk, ordered=False)
+                written += len(result.inserted_ids)
+    except pymongo.errors.BulkWriteError as e:
+        logging.error(erx.msg[0].format(str(e.details.get('writeErrors', [])[:10])))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    loader['rows'] += written
+    return written
+
+# Function that closes a bulk write loader. MongoDB writes are not transactional here, so nothing is
+# discarded when commit is False
+def close_bulk_write_loader(loader, commit: bool = True):
+    """
+    Close a Bulk Write Loader
+    :param loader: Loader (see open_bulk_write_loader)
+    :param commit: Unused (the documents are written by bulk_write_batch)
+    :return: Number of documents written
+    """
+    return loader.get('rows')
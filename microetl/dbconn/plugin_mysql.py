@@ -190,4 +190,4 @@ def exec_query_return_json(conn, cur, query, query_params=None):
         logging.error(erx.msg[0].format
                         (traceback.format_exc()))
         conn.rollback()
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
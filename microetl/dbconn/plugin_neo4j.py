@@ -10,6 +10,7 @@ import os
 import sys
 import logging
 import traceback
+import concurrent.futures
 import pandas as pd
 
 import neo4j
@@ -39,13 +40,12 @@ def get_connection(kwargs, target: str = 'source'):
         pwd = kwargs.get("datasources").get(target).get('password')
         if pwd == None:
             pwd = os.environ.get('NEO4j_PASSWORD', 'neo4j')
-        conn = neo4j.connect(
-            host=str(kwargs.get("datasources").get(target).get('host', 'localhost')),
-            port=str(kwargs.get("datasources").get(target).get('port', 7687)),
-            user=usr,
-            password=pwd,
-            database=str(kwargs.get("datasources").get(target).get('database', 'neo4j'))
-        )
+        # The driver manages a pool of connections, the database is selected by each session
+        uri = kwargs.get("datasources").get(target).get('uri')
+        if uri == None:
+            uri = 'neo4j://' + str(kwargs.get("datasources").get(target).get('host', 'localhost')) + ':' + \
+                  str(kwargs.get("datasources").get(target).get('port', 7687))
+        conn = neo4j.GraphDatabase.driver(uri, auth=(usr, pwd))
         return conn
     except neo4j.exceptions.ServiceUnavailable as e:
         logging.error(erx.msg[0].format(str(e)))
@@ -204,3 +204,113 @@ def exec_query_return_json(conn, cur, query, query_params=None):
         logging.error(erx.msg[0].format(str(e)))
         logging.error(erx.msg[0].format(traceback.format_exc()))
         sys.exit(1)
+
+# Default number of records of each UNWIND transaction
+default_unwind_batch_size = 5000
+
+# Default number of concurrent write sessions
+default_unwind_sessions = 4
+
+# Function that returns the Cypher statement of an UNWIND loader: the template runs once per record
+# (as row), so it is prefixed with UNWIND $rows AS row unless it already unwinds the $rows parameter
+def get_unwind_statement(cypher):
+    """
+    Get the UNWIND statement of a Cypher template
+    :param cypher: Cypher template (e.g. MERGE (p:Person {id: row.id}) SET p.name = row.name)
+    :return: Cypher statement
+    """
+    if cypher == None or str(cypher).strip() == '':
+        raise ValueError("A Cypher template (write_options.cypher) is required to write to Neo4j")
+    if str(cypher).lstrip().upper().startswith('UNWIND $ROWS'):
+        return str(cypher)
+    return 'UNWIND $rows AS row\n' + str(cypher)
+
+# Function that opens an UNWIND loader: records are grouped in lists of batch_size rows, and each list
+# is written by one transaction running the Cypher template (one round-trip per batch instead of per
+# record), from up to sessions concurrent write sessions
+def open_unwind_loader(conn, database=None, write_options=None):
+    """
+    Open an UNWIND Loader
+    :param conn: Neo4J Connection Object (driver)
+    :param database: Database name (None for the default database)
+    :param write_options: Write options (cypher, batch_size and sessions)
+    :return: Loader (a dictionary)
+    """
+    write_options = write_options or {}
+    sessions = int(write_options.get('sessions', default_unwind_sessions))
+    return {
+        'conn': conn,
+        'table': database,
+        'cypher': get_unwind_statement(write_options.get('cypher')),
+        'batch_size': int(write_options.get('batch_size', default_unwind_batch_size)),
+        'sessions': sessions,
+        'pool': concurrent.futures.ThreadPoolExecutor(max_workers=sessions),
+        'writes': [],
+        'rows': 0,
+    }
+
+# Function that writes a list of records in a write transaction of its own session (transient errors,
+# e.g. deadlocks between concurrent sessions, are retried by execute_write)
+def write_unwind_rows(loader, rows):
+    """
+    Write a list of records with the UNWIND statement
+    :param loader: Loader (see open_unwind_loader)
+    :param rows: List of records (dictionaries)
+    :return: Number of records written
+    """
+    with loader.get('conn').session(database=loader.get('table')) as session:
+        session.execute_write(lambda tx: tx.run(loader.get('cypher'), rows=rows).consume())
+    return len(rows)
+
+# Function that waits for the write transactions of a loader, until at most max_pending are still
+# running, and raises the first error
+def wait_unwind_writes(loader, max_pending: int = 0):
+    """
+    Wait for the Writes of a loader
+    :param loader: Loader (see open_unwind_loader)
+    :param max_pending: Maximum number of writes left running
+    :return: None
+    """
+    writes = loader.get('writes')
+    while len(writes) > max_pending:
+        loader['rows'] += writes.pop(0).result()
+
+# Function that writes a batch of data (DataFrame or Arrow Table): it is split in lists of batch_size
+# records that are written by the concurrent sessions
+def unwind_batch(loader, data):
+    """
+    Write a Batch of data to Neo4j
+    :param loader: Loader (see open_unwind_loader)
+    :param data: DataFrame or Arrow Table
+    :return: Number of records submitted
+    """
+    records = utils.data_to_records(data)
+    try:
+        for start in range(0, len(records), loader.get('batch_size')):
+            wait_unwind_writes(loader, 2 * loader.get('sessions'))
+            loader.get('writes').append(loader.get('pool').submit(write_unwind_rows, loader, records[start:start + loader.get('batch_size')]))
+    except neo4j.exceptions.Neo4jError as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    return len(records)
+
+# Function that closes an UNWIND loader, waiting for its writes. Each batch is committed by its own
+# transaction, so the batches written before a failure are not rolled back
+def close_unwind_loader(loader, commit: bool = True):
+    """
+    Close an UNWIND Loader
+    :param loader: Loader (see open_unwind_loader)
+    :param commit: False to cancel the writes that did not start yet
+    :return: Number of records written
+    """
+    try:
+        if commit:
+            wait_unwind_writes(loader)
+    except neo4j.exceptions.Neo4jError as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    finally:
+        loader.get('pool').shutdown(wait=True, cancel_futures=not commit)
+    return loader.get('rows')
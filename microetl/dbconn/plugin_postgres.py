@@ -10,6 +10,11 @@ import os
 import sys
 import logging
 import traceback
+import io
+import struct
+import uuid
+import datetime
+import decimal
 import pandas as pd
 import json
 
@@ -325,3 +330,411 @@ def exec_query_return_json(conn, cur, query, query_params=None):
                         (traceback.format_exc()))
         conn.rollback()
         return None
+
+# function that executes a query on the postgres database and yields the results as dataframes
+# of (at most) batch_size rows each. It uses a server-side (named) cursor, so only one batch at
+# the time is transferred to (and kept in) the client memory
+def exec_query_return_batches(conn, cur, query, query_params=None, batch_size: int = 10000):
+    """
+    Execute Postgres Query and Return Dataframe batches
+    :param conn: Postgres Connection Object
+    :param cur: Postgres Cursor Object (unused, a server-side cursor is created on conn)
+    :param query: Query to execute
+    :param query_params: Query Parameters
+    :param batch_size: Number of rows per batch
+    :return: Generator of Dataframes
+    """
+    try:
+        # Create a server-side cursor and execute the query
+        ss_cur = conn.cursor(name='microetl_batches', cursor_factory=psycopg2.extras.DictCursor)
+        ss_cur.itersize = batch_size
+        ss_cur.execute(query, query_params)
+        try:
+            # Fetch the results one batch at the time
+            columns = None
+            rows = ss_cur.fetchmany(batch_size)
+            while len(rows) > 0:
+                if columns is None:
+                    columns = [ x.name for x in ss_cur.description ]
+                yield pd.DataFrame(rows, columns=columns)
+                rows = ss_cur.fetchmany(batch_size)
+        finally:
+            ss_cur.close()
+        conn.commit()
+    except psycopg2.Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        conn.rollback()
+        sys.exit(1)
+
+# function that executes a query on the postgres database and returns the results as an Arrow table
+def exec_query_return_arrow(conn, cur, query, query_params=None):
+    """
+    Execute Postgres Query and Return Arrow Table
+    :param conn: Postgres Connection Object
+    :param cur: Postgres Cursor Object
+    :param query: Query to execute
+    :param query_params: Query Parameters
+    :return: Arrow Table
+    """
+    try:
+        # Execute the query
+        cur.execute(query, query_params)
+        conn.commit()
+        # Fetch the results as an Arrow table
+        return utils.rows_to_arrow_table(cur.fetchall(), [ x.name for x in cur.description ])
+    except psycopg2.Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        conn.rollback()
+        sys.exit(1)
+
+# function that executes a query on the postgres database and yields the results as Arrow tables
+# of (at most) batch_size rows each (using a server-side cursor, like exec_query_return_batches)
+def exec_query_return_arrow_batches(conn, cur, query, query_params=None, batch_size: int = 10000):
+    """
+    Execute Postgres Query and Return Arrow Table batches
+    :param conn: Postgres Connection Object
+    :param cur: Postgres Cursor Object (unused, a server-side cursor is created on conn)
+    :param query: Query to execute
+    :param query_params: Query Parameters
+    :param batch_size: Number of rows per batch
+    :return: Generator of Arrow Tables
+    """
+    try:
+        # Create a server-side cursor and execute the query
+        ss_cur = conn.cursor(name='microetl_arrow_batches')
+        ss_cur.itersize = batch_size
+        ss_cur.execute(query, query_params)
+        try:
+            # Fetch the results one batch at the time
+            columns = None
+            rows = ss_cur.fetchmany(batch_size)
+            while len(rows) > 0:
+                if columns is None:
+                    columns = [ x.name for x in ss_cur.description ]
+                yield utils.rows_to_arrow_table(rows, columns)
+                rows = ss_cur.fetchmany(batch_size)
+        finally:
+            ss_cur.close()
+        conn.commit()
+    except psycopg2.Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        conn.rollback()
+        sys.exit(1)
+
+# COPY formats of the Postgres bulk loader (see open_copy_loader)
+# text:   CSV, encoded by pandas (or pyarrow for Arrow tables) and parsed by the server
+# binary: the Postgres binary COPY format, encoded according to the types of the target table
+copy_formats = ['text', 'binary']
+
+# Default number of rows sent by each COPY statement
+default_copy_batch_size = 10000
+
+# Postgres epoch (dates and timestamps of the binary COPY format are relative to it)
+copy_binary_epoch = datetime.datetime(2000, 1, 1)
+
+# Header and trailer of the binary COPY format
+copy_binary_header = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+copy_binary_trailer = struct.pack('>h', -1)
+
+# Function that returns the SQL identifier of a (optionally schema qualified) table name
+def get_table_identifier(table):
+    """
+    Get the Identifier of a table
+    :param table: Table name (table or schema.table)
+    :return: psycopg2.sql.Identifier
+    """
+    return sql.Identifier(*str(table).split('.'))
+
+# Function that returns the type of each column of a table (as returned by format_type, e.g. bigint)
+def get_table_column_types(cur, table):
+    """
+    Get the Column types of a table
+    :param cur: Postgres Cursor Object
+    :param table: Table name (table or schema.table)
+    :return: Dictionary column name -> type name
+    """
+    table_name = '.'.join('"' + part.replace('"', '""') + '"' for part in str(table).split('.'))
+    cur.execute("SELECT attname, format_type(atttypid, NULL) FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped", (table_name,))
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+# Function that encodes a numeric value of the binary COPY format: number of digits, weight (of the
+# first digit), sign and display scale, followed by the base 10000 digits (4 decimal digits each)
+def encode_copy_binary_numeric(value):
+    """
+    Encode a Numeric value in the binary COPY format
+    :param value: Value (a number or a string)
+    :return: Encoded value (bytes, without its length)
+    """
+    number = value if isinstance(value, decimal.Decimal) else decimal.Decimal(str(value))
+    if number.is_nan():
+        return struct.pack('>hhHh', 0, 0, 0xC000, 0)
+    if number.is_infinite():
+        raise ValueError("Infinite values are not supported by the binary COPY format of numeric columns (use format: text)")
+    sign, digits, exponent = number.as_tuple()
+    decimal_digits = ''.join(str(digit) for digit in digits)
+    if exponent >= 0:
+        int_part, frac_part = decimal_digits + '0' * exponent, ''
+    elif len(decimal_digits) > -exponent:
+        int_part, frac_part = decimal_digits[:exponent], decimal_digits[exponent:]
+    else:
+        int_part, frac_part = '', '0' * (-exponent - len(decimal_digits)) + decimal_digits
+    # The integer and fractional parts are padded to groups of 4 digits around the decimal point
+    int_part = '0' * (-len(int_part) % 4) + int_part
+    frac_part = frac_part + '0' * (-len(frac_part) % 4)
+    all_digits = int_part + frac_part
+    groups = [int(all_digits[start:start + 4]) for start in range(0, len(all_digits), 4)]
+    weight = len(int_part) // 4 - 1
+    while len(groups) > 0 and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while len(groups) > 0 and groups[-1] == 0:
+        groups.pop()
+    if len(groups) == 0:
+        weight, sign = 0, 0
+    return struct.pack('>hhHh', len(groups), weight, 0x4000 if sign else 0, max(0, -exponent)) + \
+           struct.pack('>' + 'h' * len(groups), *groups)
+
+# Function that encodes the value of a column of the binary COPY format, for each supported type
+def encode_copy_binary_value(value, pg_type):
+    """
+    Encode a Value in the binary COPY format
+    :param value: Value (not null)
+    :param pg_type: Postgres type name
+    :return: Encoded value (bytes, without its length)
+    """
+    if pg_type == 'smallint':
+        return struct.pack('>h', int(value))
+    if pg_type == 'integer':
+        return struct.pack('>i', int(value))
+    if pg_type == 'bigint':
+        return struct.pack('>q', int(value))
+    if pg_type == 'real':
+        return struct.pack('>f', float(value))
+    if pg_type == 'double precision':
+        return struct.pack('>d', float(value))
+    if pg_type == 'numeric':
+        return encode_copy_binary_numeric(value)
+    if pg_type == 'boolean':
+        return b'\x01' if value else b'\x00'
+    if pg_type in ['text', 'character varying', 'character', 'name', 'json']:
+        return str(value).encode('utf-8')
+    if pg_type == 'jsonb':
+        return b'\x01' + str(value).encode('utf-8')
+    if pg_type == 'bytea':
+        return bytes(value)
+    if pg_type == 'uuid':
+        return uuid.UUID(str(value)).bytes
+    if pg_type == 'date':
+        return struct.pack('>i', (pd.Timestamp(value).date() - copy_binary_epoch.date()).days)
+    if pg_type in ['timestamp without time zone', 'timestamp with time zone']:
+        value = pd.Timestamp(value)
+        if value.tzinfo != None:
+            value = value.tz_convert('UTC').tz_localize(None)
+        return struct.pack('>q', (value - pd.Timestamp(copy_binary_epoch)) // pd.Timedelta(microseconds=1))
+    raise ValueError("Postgres type not supported by the binary COPY format: " + str(pg_type) + " (use format: text)")
+
+# Function that encodes a batch of rows in the binary COPY format. Values are encoded one column at the
+# time (nulls are written as a -1 length) and then joined row by row
+def encode_copy_binary(data, column_types):
+    """
+    Encode Data in the binary COPY format
+    :param data: DataFrame
+    :param column_types: Dictionary column name -> Postgres type name (see get_table_column_types)
+    :return: Encoded rows (bytes, without header and trailer)
+    """
+    null_field = struct.pack('>i', -1)
+    columns = []
+    for column in data.columns:
+        if column_types.get(column) == None:
+            raise ValueError("Column not found in the target table: " + str(column))
+        fields = []
+        for value in data[column].tolist():
+            if value is None or (not isinstance(value, (str, bytes)) and pd.isna(value)):
+                fields.append(null_field)
+            else:
+                encoded = encode_copy_binary_value(value, column_types.get(column))
+                fields.append(struct.pack('>i', len(encoded)) + encoded)
+        columns.append(fields)
+    row_header = struct.pack('>h', len(columns))
+    return b''.join(row_header + b''.join(fields) for fields in zip(*columns))
+
+# Function that encodes a batch of rows as CSV for a text COPY, and returns it with the null marker
+# of the COPY statement. pandas writes nulls as \N (so empty strings are not loaded as nulls), or as
+# \N followed by a random suffix when \N is a value of the data, while pyarrow quotes all the values
+# (so only unquoted empty fields are nulls)
+def encode_copy_text(data):
+    """
+    Encode Data as CSV for a text COPY
+    :param data: DataFrame or Arrow Table
+    :return: (encoded rows, null marker)
+    """
+    if utils.pa != None and isinstance(data, utils.pa.Table):
+        import pyarrow.csv as pa_csv
+        buffer = io.BytesIO()
+        pa_csv.write_csv(data, buffer, pa_csv.WriteOptions(include_header=False, quoting_style='all_valid'))
+        return buffer.getvalue(), ''
+    null_marker = '\\N'
+    text_columns = [column for column in data.columns if data[column].dtype == object or pd.api.types.is_string_dtype(data[column])]
+    while any((data[column] == null_marker).any() for column in text_columns):
+        # (pandas writes at most 32 characters of na_rep in float columns)
+        null_marker = '\\N' + uuid.uuid4().hex[:16]
+    return data.to_csv(header=False, index=False, na_rep=null_marker).encode('utf-8'), null_marker
+
+# Function that opens a bulk loader of a table. All the batches (see copy_batch) are loaded in the
+# same transaction, either straight into the table or into an UNLOGGED staging table (created like
+# the target table) that is copied into the target table by a single INSERT when the loader is
+# closed (see close_copy_loader), so the target table is written, and committed, once per load.
+# In merge write mode, the batches are loaded in a temporary table (dropped at the end of the
+# transaction) that is merged into the target table by a single INSERT ... ON CONFLICT
+def open_copy_loader(conn, table, write_options=None):
+    """
+    Open a COPY Loader
+    :param conn: Postgres Connection Object
+    :param table: Target table name (table or schema.table)
+    :param write_options: Write options (format, batch_size, staging, write_mode and key_columns)
+    :return: Loader (a dictionary)
+    """
+    write_options = write_options or {}
+    copy_format = str(write_options.get('format', 'text')).lower().strip()
+    if copy_format not in copy_formats:
+        raise ValueError("Invalid COPY format: " + copy_format + " (valid formats: " + ', '.join(copy_formats) + ")")
+    write_mode, key_columns = utils.get_write_mode(write_options)
+    cur = conn.cursor()
+    loader = {
+        'conn': conn,
+        'cur': cur,
+        'table': table,
+        'target': table,
+        'format': copy_format,
+        'batch_size': int(write_options.get('batch_size', default_copy_batch_size)),
+        'write_mode': write_mode,
+        'key_columns': key_columns,
+        'columns': None,
+        'column_types': None,
+        'rows': 0,
+    }
+    try:
+        if write_mode == 'merge':
+            loader['target'] = 'microetl_stage_' + str(os.getpid())
+            cur.execute(sql.SQL("CREATE TEMPORARY TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP").format(
+                        sql.Identifier(loader.get('target')), get_table_identifier(table)))
+        elif write_options.get('staging', False):
+            loader['target'] = str(table) + '_stage_' + str(os.getpid())
+            cur.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+                        get_table_identifier(loader.get('target')), get_table_identifier(table)))
+        if copy_format == 'binary':
+            loader['column_types'] = get_table_column_types(cur, table)
+    except psycopg2.Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        conn.rollback()
+        cur.close()
+        raise
+    return loader
+
+# Function that loads a batch of data (DataFrame or Arrow Table) with one COPY ... FROM STDIN for each
+# batch_size rows. Nothing is committed until the loader is closed
+def copy_batch(loader, data):
+    """
+    Load a Batch of data with COPY
+    :param loader: Loader (see open_copy_loader)
+    :param data: DataFrame or Arrow Table
+    :return: Number of rows loaded
+    """
+    is_arrow = utils.pa != None and isinstance(data, utils.pa.Table)
+    columns = list(data.column_names) if is_arrow else [str(column) for column in data.columns]
+    if loader.get('columns') == None:
+        loader['columns'] = columns
+    elif loader.get('columns') != columns:
+        raise ValueError("The columns of the batch do not match the columns of the load: " + str(columns))
+    rows = data.num_rows if is_arrow else len(data)
+    column_list = sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+    try:
+        for start in range(0, rows, loader.get('batch_size')):
+            chunk = data.slice(start, loader.get('batch_size')) if is_arrow else data.iloc[start:start + loader.get('batch_size')]
+            if loader.get('format') == 'binary':
+                if is_arrow:
+                    chunk = chunk.to_pandas()
+                payload = copy_binary_header + encode_copy_binary(chunk, loader.get('column_types')) + copy_binary_trailer
+                statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT binary)").format(
+                            get_table_identifier(loader.get('target')), column_list)
+            else:
+                payload, null_marker = encode_copy_text(chunk)
+                statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL {})").format(
+                            get_table_identifier(loader.get('target')), column_list, sql.Literal(null_marker))
+            loader.get('cur').copy_expert(statement, io.BytesIO(payload))
+    except psycopg2.Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    loader['rows'] += rows
+    return rows
+
+# Function that returns the statement that merges the temporary table of a loader into its target
+# table: rows with the same key_columns values are updated, the others inserted. When a key appears
+# more than once in the load, its last record is used
+def get_merge_statement(loader):
+    """
+    Get the Merge statement of a loader
+    :param loader: Loader (see open_copy_loader)
+    :return: psycopg2.sql.Composed statement
+    """
+    columns = loader.get('columns')
+    key_columns = loader.get('key_columns')
+    missing = [key for key in key_columns if key not in columns]
+    if len(missing) > 0:
+        raise ValueError("Key columns not found in the data: " + ', '.join(missing))
+    column_list = sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+    key_list = sql.SQL(', ').join(sql.Identifier(key) for key in key_columns)
+    updates = [sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(column), sql.Identifier(column))
+               for column in columns if column not in key_columns]
+    if len(updates) > 0:
+        on_conflict = sql.SQL("DO UPDATE SET ") + sql.SQL(', ').join(updates)
+    else:
+        on_conflict = sql.SQL("DO NOTHING")
+    return sql.SQL("INSERT INTO {} ({}) SELECT DISTINCT ON ({}) {} FROM {} ORDER BY {}, ctid DESC ON CONFLICT ({}) {}").format(
+           get_table_identifier(loader.get('table')), column_list, key_list, column_list,
+           sql.Identifier(loader.get('target')), key_list, key_list, on_conflict)
+
+# Function that closes a bulk loader: the staging table (if any) is copied into the target table and
+# dropped (or, in merge write mode, the temporary table is merged into the target table), and the load
+# is committed (or, when commit is False, rolled back)
+def close_copy_loader(loader, commit: bool = True):
+    """
+    Close a COPY Loader
+    :param loader: Loader (see open_copy_loader)
+    :param commit: True to commit the load, False to roll it back
+    :return: Number of rows loaded
+    """
+    conn = loader.get('conn')
+    cur = loader.get('cur')
+    try:
+        if commit:
+            if loader.get('write_mode') == 'merge':
+                if loader.get('columns') != None:
+                    cur.execute(get_merge_statement(loader))
+            elif loader.get('target') != loader.get('table'):
+                if loader.get('columns') != None:
+                    column_list = sql.SQL(', ').join(sql.Identifier(column) for column in loader.get('columns'))
+                    cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                                get_table_identifier(loader.get('table')), column_list, column_list,
+                                get_table_identifier(loader.get('target'))))
+                cur.execute(sql.SQL("DROP TABLE {}").format(get_table_identifier(loader.get('target'))))
+            conn.commit()
+        else:
+            conn.rollback()
+    except psycopg2.Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return loader.get('rows')
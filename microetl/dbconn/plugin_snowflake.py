@@ -10,6 +10,10 @@ import os
 import sys
 import logging
 import traceback
+import shutil
+import tempfile
+import uuid
+import concurrent.futures
 import pandas as pd
 import json
 
@@ -21,6 +25,12 @@ from snowflake.connector import DatabaseError
 from snowflake.connector import InterfaceError
 from snowflake.connector import Error
 
+# Import the connector pandas tools (if available, they need pyarrow) to load DataFrames with write_pandas
+try:
+    from snowflake.connector.pandas_tools import write_pandas
+except ImportError:
+    write_pandas = None
+
 # Import error messages
 from . import error_msg as erx
 
@@ -342,3 +352,368 @@ def exec_query_return_json(conn, cur, query, query_params=None):
         logging.error(erx.msg[0].format(traceback.format_exc()))
         conn.rollback()
         sys.exit(1)
+
+# function that executes a query on the snowflake database and yields the results as dataframes
+# of (at most) batch_size rows each
+def exec_query_return_batches(conn, cur, query, query_params=None, batch_size: int = 10000):
+    """
+    Execute Snowflake Query and Return Dataframe batches
+    :param conn: Snowflake Connection Object
+    :param cur: Snowflake Cursor Object
+    :param query: Query to execute
+    :param query_params: Query Parameters
+    :param batch_size: Number of rows per batch
+    :return: Generator of Dataframes
+    """
+    try:
+        # Execute the query
+        cur.execute(query, query_params)
+        # Fetch the results one batch at the time
+        columns = [ x.name for x in cur.description ]
+        rows = cur.fetchmany(batch_size)
+        while len(rows) > 0:
+            yield pd.DataFrame(rows, columns=columns)
+            rows = cur.fetchmany(batch_size)
+        conn.commit()
+    except Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        conn.rollback()
+        sys.exit(1)
+
+# function that executes a query on the snowflake database and returns the results as an Arrow table
+# (Snowflake returns its results in Arrow format, so they are not converted row by row)
+def exec_query_return_arrow(conn, cur, query, query_params=None):
+    """
+    Execute Snowflake Query and Return Arrow Table
+    :param conn: Snowflake Connection Object
+    :param cur: Snowflake Cursor Object
+    :param query: Query to execute
+    :param query_params: Query Parameters
+    :return: Arrow Table
+    """
+    try:
+        # Execute the query
+        cur.execute(query, query_params)
+        # Fetch the results as an Arrow table (None when the query returned no rows)
+        table = cur.fetch_arrow_all()
+        if table is None:
+            table = utils.rows_to_arrow_table([], [ x.name for x in cur.description ])
+        conn.commit()
+        return table
+    except Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        conn.rollback()
+        sys.exit(1)
+
+# function that executes a query on the snowflake database and yields the results as Arrow tables
+# (one per result chunk, as returned by Snowflake, re-sliced to at most batch_size rows each)
+def exec_query_return_arrow_batches(conn, cur, query, query_params=None, batch_size: int = 10000):
+    """
+    Execute Snowflake Query and Return Arrow Table batches
+    :param conn: Snowflake Connection Object
+    :param cur: Snowflake Cursor Object
+    :param query: Query to execute
+    :param query_params: Query Parameters
+    :param batch_size: Number of rows per batch
+    :return: Generator of Arrow Tables
+    """
+    try:
+        # Execute the query
+        cur.execute(query, query_params)
+        # Fetch the results one chunk at the time
+        for table in cur.fetch_arrow_batches():
+            for start in range(0, table.num_rows, batch_size):
+                yield table.slice(start, batch_size)
+        conn.commit()
+    except Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format
+                        (traceback.format_exc()))
+        conn.rollback()
+        sys.exit(1)
+
+# Bulk load methods of the Snowflake loader (see open_stage_loader)
+# stage:        batches are written as compressed Parquet (or CSV) files, PUT to a stage in parallel
+#               and loaded by a single COPY INTO when the loader is closed
+# write_pandas: each batch is loaded by the connector write_pandas (its own temporary stage and COPY) in
+#               a temporary table, copied into the table by a single INSERT when the loader is closed
+stage_load_methods = ['stage', 'write_pandas']
+
+# File formats of the staged files
+stage_file_formats = ['parquet', 'csv']
+
+# Default number of rows of each staged file (and of each write_pandas chunk)
+default_stage_batch_size = 100000
+
+# Default number of concurrent PUT operations
+default_stage_parallel = 4
+
+# Column of the temporary table of a merge that records the load order of the rows (see get_merge_statement)
+merge_sequence_column = 'microetl_seq'
+
+# Function that returns a quoted identifier (e.g. a column name, as it is in the data)
+def quote_identifier(name):
+    """
+    Quote an Identifier
+    :param name: Identifier
+    :return: Quoted identifier
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+# Function that returns the stage of a table (its table stage, @[db.][schema.]%table, by default)
+def get_table_stage(table, stage=None):
+    """
+    Get the Stage of a table
+    :param table: Table name (table, schema.table or db.schema.table)
+    :param stage: Stage name (None for the table stage)
+    :return: Stage reference (starting with @)
+    """
+    if stage != None:
+        return stage if str(stage).startswith('@') else '@' + str(stage)
+    parts = str(table).split('.')
+    return '@' + '.'.join(parts[:-1] + ['%' + parts[-1]])
+
+# Function that writes a chunk of data to a local file, ready to be staged: Parquet files are compressed
+# with snappy, CSV files with gzip (nulls are written as \N)
+def write_stage_file(data, filename, file_format: str):
+    """
+    Write a Stage file
+    :param data: DataFrame or Arrow Table
+    :param filename: Local file name
+    :param file_format: File format (parquet or csv)
+    :return: File name
+    """
+    if file_format == 'parquet':
+        if utils.pa == None:
+            raise ImportError("pyarrow is required to stage Parquet files")
+        import pyarrow.parquet as pq
+        if not isinstance(data, utils.pa.Table):
+            data = utils.pa.Table.from_pandas(data, preserve_index=False)
+        pq.write_table(data, filename, compression='snappy')
+    else:
+        if utils.pa != None and isinstance(data, utils.pa.Table):
+            data = data.to_pandas()
+        data.to_csv(filename, header=False, index=False, na_rep='\\N', compression='gzip')
+    return filename
+
+# Function that PUTs a local file to a stage (with its own cursor, so files can be staged concurrently)
+# and removes the local file
+def put_stage_file(conn, filename, stage_path):
+    """
+    PUT a File to a stage
+    :param conn: Snowflake Connection Object
+    :param filename: Local file name
+    :param stage_path: Stage path (stage reference and prefix)
+    :return: None
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("PUT 'file://" + filename.replace('\\', '/') + "' " + stage_path + " AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
+    finally:
+        cur.close()
+        os.remove(filename)
+
+# Function that opens a bulk loader of a table. With the stage method, the batches (see stage_batch)
+# are staged under a prefix unique to the load and the table is written, once, by the COPY INTO run
+# when the loader is closed (see close_stage_loader)
+def open_stage_loader(conn, table, write_options=None):
+    """
+    Open a Stage Loader
+    :param conn: Snowflake Connection Object
+    :param table: Target table name (table, schema.table or db.schema.table)
+    :param write_options: Write options (method, file_format, stage, batch_size, parallel, write_mode
+                          and key_columns)
+    :return: Loader (a dictionary)
+    """
+    write_options = write_options or {}
+    write_mode, key_columns = utils.get_write_mode(write_options)
+    method = str(write_options.get('method', 'stage')).lower().strip()
+    if method not in stage_load_methods:
+        raise ValueError("Invalid Snowflake load method: " + method + " (valid methods: " + ', '.join(stage_load_methods) + ")")
+    file_format = str(write_options.get('file_format', 'parquet')).lower().strip()
+    if file_format not in stage_file_formats:
+        raise ValueError("Invalid stage file format: " + file_format + " (valid formats: " + ', '.join(stage_file_formats) + ")")
+    if method == 'write_pandas' and write_pandas == None:
+        raise ImportError("snowflake-connector-python[pandas] is required to load data with write_pandas")
+    loader = {
+        'conn': conn,
+        'table': table,
+        'target': table,
+        'write_mode': write_mode,
+        'key_columns': key_columns,
+        'method': method,
+        'file_format': file_format,
+        'batch_size': int(write_options.get('batch_size', default_stage_batch_size)),
+        'parallel': int(write_options.get('parallel', default_stage_parallel)),
+        'columns': None,
+        'rows': 0,
+    }
+    if write_mode == 'merge' or method == 'write_pandas':
+        # Merges, and write_pandas loads (committed by the connector batch by batch), are loaded in a
+        # temporary table (in the schema of the connection) that is written to the table only when the
+        # loader is closed. For merges, it has an extra column with the load order of the rows, so the
+        # last record of a key is the one merged. The temporary table is created first, so nothing
+        # is left behind (local directory or PUT threads) when it cannot be created
+        loader['target'] = quote_identifier('microetl_stage_' + str(os.getpid()))
+        cur = conn.cursor()
+        try:
+            cur.execute("CREATE TEMPORARY TABLE " + loader.get('target') + " LIKE " + str(table))
+            if write_mode == 'merge':
+                cur.execute("ALTER TABLE " + loader.get('target') + " ADD COLUMN " + quote_identifier(merge_sequence_column) + " NUMBER")
+        finally:
+            cur.close()
+    if method == 'stage':
+        # The files of a table stage can only be loaded into its table, so merges use the user stage by default
+        stage = write_options.get('stage')
+        if stage == None and write_mode == 'merge':
+            stage = '~'
+        loader['stage_path'] = get_table_stage(table, stage) + '/microetl/' + uuid.uuid4().hex + '/'
+        loader['local_path'] = tempfile.mkdtemp(prefix='microetl_stage_')
+        loader['pool'] = concurrent.futures.ThreadPoolExecutor(max_workers=loader.get('parallel'))
+        loader['puts'] = []
+        loader['files'] = 0
+    return loader
+
+# Function that waits for the PUT operations of a loader, until at most max_pending are still running
+# (so the local files waiting to be staged are bounded), and raises the first PUT error
+def wait_stage_puts(loader, max_pending: int = 0):
+    """
+    Wait for the PUT operations of a loader
+    :param loader: Loader (see open_stage_loader)
+    :param max_pending: Maximum number of PUT operations left running
+    :return: None
+    """
+    puts = loader.get('puts')
+    while len(puts) > max_pending:
+        puts.pop(0).result()
+
+# Function that loads a batch of data (DataFrame or Arrow Table): with the stage method, it is written
+# in files of batch_size rows that are PUT to the stage in the background, with write_pandas it is
+# loaded straight away in the temporary table of the loader
+def stage_batch(loader, data):
+    """
+    Load a Batch of data to Snowflake
+    :param loader: Loader (see open_stage_loader)
+    :param data: DataFrame or Arrow Table
+    :return: Number of rows loaded
+    """
+    is_arrow = utils.pa != None and isinstance(data, utils.pa.Table)
+    columns = list(data.column_names) if is_arrow else [str(column) for column in data.columns]
+    if loader.get('columns') == None:
+        loader['columns'] = columns
+    elif loader.get('columns') != columns:
+        raise ValueError("The columns of the batch do not match the columns of the load: " + str(columns))
+    rows = data.num_rows if is_arrow else len(data)
+    if loader.get('write_mode') == 'merge':
+        sequence = range(loader.get('rows'), loader.get('rows') + rows)
+        if is_arrow:
+            data = data.append_column(merge_sequence_column, utils.pa.array(sequence, type=utils.pa.int64()))
+        else:
+            data = data.assign(**{merge_sequence_column: sequence})
+    try:
+        if loader.get('method') == 'write_pandas':
+            write_pandas(loader.get('conn'), data.to_pandas() if is_arrow else data, loader.get('target').strip('"'),
+                         chunk_size=loader.get('batch_size'), compression='snappy', parallel=loader.get('parallel'))
+        else:
+            extension = '.parquet' if loader.get('file_format') == 'parquet' else '.csv.gz'
+            for start in range(0, rows, loader.get('batch_size')):
+                chunk = data.slice(start, loader.get('batch_size')) if is_arrow else data.iloc[start:start + loader.get('batch_size')]
+                loader['files'] += 1
+                filename = os.path.join(loader.get('local_path'), 'part_' + str(loader.get('files')).zfill(6) + extension)
+                write_stage_file(chunk, filename, loader.get('file_format'))
+                wait_stage_puts(loader, 2 * loader.get('parallel'))
+                loader.get('puts').append(loader.get('pool').submit(put_stage_file, loader.get('conn'), filename, loader.get('stage_path')))
+    except Error as e:
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    loader['rows'] += rows
+    return rows
+
+# Function that returns the COPY INTO statement that loads the staged files of a loader
+def get_copy_into_statement(loader):
+    """
+    Get the COPY INTO statement of a loader
+    :param loader: Loader (see open_stage_loader)
+    :return: COPY INTO statement
+    """
+    if loader.get('file_format') == 'parquet':
+        return ("COPY INTO " + loader.get('target') + " FROM " + loader.get('stage_path') +
+                " FILE_FORMAT = (TYPE = PARQUET) MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE PURGE = TRUE")
+    columns = loader.get('columns') + ([merge_sequence_column] if loader.get('write_mode') == 'merge' else [])
+    return ("COPY INTO " + loader.get('target') + " (" + ', '.join(quote_identifier(column) for column in columns) + ") FROM " + loader.get('stage_path') +
+            " FILE_FORMAT = (TYPE = CSV COMPRESSION = GZIP FIELD_OPTIONALLY_ENCLOSED_BY = '\"' NULL_IF = ('\\\\N')) PURGE = TRUE")
+
+# Function that returns the MERGE statement that merges the temporary table of a loader into its target
+# table: rows with the same key_columns values are updated, the others inserted. When a key appears
+# more than once in the load, its last record is used
+def get_merge_statement(loader):
+    """
+    Get the MERGE statement of a loader
+    :param loader: Loader (see open_stage_loader)
+    :return: MERGE statement
+    """
+    columns = loader.get('columns')
+    key_columns = loader.get('key_columns')
+    missing = [key for key in key_columns if key not in columns]
+    if len(missing) > 0:
+        raise ValueError("Key columns not found in the data: " + ', '.join(missing))
+    statement = ("MERGE INTO " + loader.get('table') + " t USING (SELECT " + ', '.join(quote_identifier(column) for column in columns) +
+                 " FROM " + loader.get('target') + " QUALIFY ROW_NUMBER() OVER (PARTITION BY " + ', '.join(quote_identifier(key) for key in key_columns) +
+                 " ORDER BY " + quote_identifier(merge_sequence_column) + " DESC) = 1) s ON " +
+                 ' AND '.join('t.' + quote_identifier(key) + ' = s.' + quote_identifier(key) for key in key_columns))
+    updates = ['t.' + quote_identifier(column) + ' = s.' + quote_identifier(column) for column in columns if column not in key_columns]
+    if len(updates) > 0:
+        statement += " WHEN MATCHED THEN UPDATE SET " + ', '.join(updates)
+    return statement + (" WHEN NOT MATCHED THEN INSERT (" + ', '.join(quote_identifier(column) for column in columns) + ") VALUES (" +
+                        ', '.join('s.' + quote_identifier(column) for column in columns) + ")")
+
+# Function that closes a bulk loader: with the stage method, once all the files are staged a single
+# COPY INTO loads them into the table (or, when commit is False, they are removed from the stage). The
+# temporary table of a loader (if any) is then merged (in merge write mode) or inserted into the table
+# by a single statement, and dropped
+def close_stage_loader(loader, commit: bool = True):
+    """
+    Close a Stage Loader
+    :param loader: Loader (see open_stage_loader)
+    :param commit: True to load the staged data, False to discard it
+    :return: Number of rows loaded
+    """
+    conn = loader.get('conn')
+    cur = conn.cursor()
+    try:
+        if loader.get('method') == 'stage':
+            try:
+                wait_stage_puts(loader)
+            finally:
+                loader.get('pool').shutdown(wait=True, cancel_futures=True)
+                shutil.rmtree(loader.get('local_path'), ignore_errors=True)
+            if commit and loader.get('files') > 0:
+                cur.execute(get_copy_into_statement(loader))
+        if commit and loader.get('columns') != None:
+            if loader.get('write_mode') == 'merge':
+                cur.execute(get_merge_statement(loader))
+            elif loader.get('target') != loader.get('table'):
+                column_list = ', '.join(quote_identifier(column) for column in loader.get('columns'))
+                cur.execute("INSERT INTO " + loader.get('table') + " (" + column_list + ") SELECT " + column_list + " FROM " + loader.get('target'))
+        if commit:
+            conn.commit()
+    except Exception as e:
+        commit = False
+        logging.error(erx.msg[0].format(str(e)))
+        logging.error(erx.msg[0].format(traceback.format_exc()))
+        raise
+    finally:
+        try:
+            if not commit and loader.get('method') == 'stage':
+                cur.execute("REMOVE " + loader.get('stage_path'))
+            if loader.get('target') != loader.get('table'):
+                cur.execute("DROP TABLE IF EXISTS " + loader.get('target'))
+        except Error as e:
+            logging.error(erx.msg[0].format(str(e)))
+        cur.close()
+    return loader.get('rows')
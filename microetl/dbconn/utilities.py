@@ -12,6 +12,12 @@ import logging
 import traceback
 import configparser
 
+# Import pyarrow library (if available) to return query results as Arrow tables
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 # Import error messages
 from . import error_msg as erx
 
@@ -35,3 +41,54 @@ def strip_dangerous_characters(string, str_type: str = 'username'):
         logging.error(erx.msg[0].format(str(e)))
         logging.error(erx.msg[0].format(traceback.format_exc()))
         return ''
+
+# Function that builds an Arrow table from the rows returned by a DB-API cursor, one column
+# at the time (so no intermediate list of dictionaries or DataFrame is created)
+def rows_to_arrow_table(rows, columns):
+    """
+    Rows to Arrow Table
+    :param rows: List of rows (tuples, lists or DictRow objects)
+    :param columns: List of column names
+    :return: Arrow Table
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to return query results as Arrow tables")
+    if len(rows) == 0:
+        return pa.table({column: pa.array([], type=pa.null()) for column in columns})
+    return pa.table({column: pa.array([row[idx] for row in rows]) for idx, column in enumerate(columns)})
+
+# Function that converts a batch of data (DataFrame or Arrow Table) to a list of records (dictionaries
+# of Python values, with None for the nulls), as expected by the document and graph databases drivers
+def data_to_records(data):
+    """
+    Data to Records
+    :param data: DataFrame or Arrow Table
+    :return: List of dictionaries
+    """
+    if pa is not None and isinstance(data, pa.Table):
+        return data.to_pylist()
+    return data.astype(object).where(data.notna(), None).to_dict('records')
+
+# Write modes of the SQL destinations
+# append: the records are inserted in the table
+# merge:  the records are bulk loaded in a staging table and then merged in the table (updating the
+#         rows with the same key_columns values and inserting the others) by a single statement
+write_modes = ['append', 'merge']
+
+# Function that returns the write mode and key columns of the write options of a destination
+def get_write_mode(write_options):
+    """
+    Get the Write mode
+    :param write_options: Write options (write_mode and key_columns)
+    :return: (write mode, list of key columns)
+    """
+    write_options = write_options or {}
+    write_mode = str(write_options.get('write_mode', 'append')).lower().strip()
+    if write_mode not in write_modes:
+        raise ValueError("Invalid write mode: " + write_mode + " (valid modes: " + ', '.join(write_modes) + ")")
+    key_columns = write_options.get('key_columns') or []
+    if isinstance(key_columns, str):
+        key_columns = [key_columns]
+    if write_mode == 'merge' and len(key_columns) == 0:
+        raise ValueError("The merge write mode requires the key_columns of the table")
+    return write_mode, list(key_columns)
@@ -0,0 +1,1007 @@
+########################################################
+#    Name: ETLEng File I/O
+# Release: 0.0.1
+# Purpose: Discovery and (parallel) reading of the
+#          files of the file-based datasources
+#  Author: Paolo Fabio Zaino
+#   Usage: Check docs/jobs_configuration_via_YAML.md
+########################################################
+
+# Import the required modules:
+import os
+import re
+import io
+import json
+import mmap
+import gzip
+import bz2
+import lzma
+import fnmatch
+import urllib.parse
+import hashlib
+import uuid
+import threading
+import itertools
+import logging
+import functools
+import concurrent.futures
+
+import pandas as pd
+
+# Import pyarrow library (if available) to read and write columnar files (Parquet and Feather)
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Import orjson library (if available) to parse JSON Lines faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Import ijson library (if available) to stream the items of large JSON documents
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Import zstandard library (if available) to read and write zstd compressed files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Default include patterns of the file-based datasource types
+default_include_patterns = {
+    'csv': ['*.csv'],
+    'excel': ['*.xlsx', '*.xls'],
+    'parquet': ['*.parquet', '*.parq'],
+    'feather': ['*.feather', '*.arrow'],
+    'json': ['*.json'],
+    'ndjson': ['*.ndjson', '*.jsonl'],
+}
+
+# Compression codecs of the files (file extension -> codec). Codec names are the ones used by pandas
+compression_extensions = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+# Magic numbers of the compression codecs (used to detect the codec of files without a known extension)
+compression_magic_numbers = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+
+# Datasource types whose files can be compressed as a whole (Parquet, Feather and Excel files are
+# compressed internally)
+compressible_types = ['csv', 'json', 'ndjson', 'file']
+
+# Columnar file formats (datasource type -> pyarrow dataset format)
+columnar_formats = {
+    'parquet': 'parquet',
+    'feather': 'ipc',
+}
+
+# Function that returns the default include patterns of a datasource type (for types whose files
+# can be compressed, the patterns match the compressed files too, e.g. *.csv.gz)
+def get_default_include_patterns(datasource_type: str):
+    """
+    Get the Default include patterns of a datasource type
+    :param datasource_type: Datasource Type
+    :return: List of patterns
+    """
+    patterns = default_include_patterns.get(datasource_type, ['*'])
+    if datasource_type not in compressible_types:
+        return patterns
+    return patterns + [pattern + extension for pattern in patterns for extension in compression_extensions if pattern != '*']
+
+# Function that returns the files settings (the files section) of a datasource
+# definition, with the default values for the missing settings
+def get_files_settings(datasource, datasource_type: str):
+    """
+    Get the Files settings of a datasource
+    :param datasource: Datasource definition (e.g. config['datasources']['source'])
+    :param datasource_type: Datasource Type
+    :return: Files settings (include, exclude, recursive, workers and executor)
+    """
+    files = (datasource or {}).get('files') or {}
+    settings = {
+        'include': files.get('include', get_default_include_patterns(datasource_type)),
+        'exclude': files.get('exclude', []),
+        'recursive': bool(files.get('recursive', False)),
+        'workers': int(files.get('workers', 1)),
+        'executor': str(files.get('executor', 'thread')).lower().strip(),
+    }
+    for key in ['include', 'exclude']:
+        if not isinstance(settings[key], list):
+            settings[key] = [settings[key]]
+    if settings['workers'] < 1:
+        raise ValueError("Invalid number of file workers: " + str(settings['workers']))
+    if settings['executor'] not in ['thread', 'process']:
+        raise ValueError("Invalid file executor: " + settings['executor'])
+    return settings
+
+# Function that returns True if a file matches at least one of the include patterns and none of
+# the exclude patterns (matched against both its relative path and its name)
+def match_file(rel_name, include=None, exclude=None):
+    """
+    Match a File against the include and exclude patterns
+    :param rel_name: File path, relative to the datasource directory
+    :param include: List of include patterns (fnmatch syntax, default all the files)
+    :param exclude: List of exclude patterns (fnmatch syntax)
+    :return: True if the file is included
+    """
+    rel_name = rel_name.replace(os.sep, '/')
+    file_name = rel_name.rsplit('/', 1)[-1]
+    if include == None or len(include) == 0:
+        include = ['*']
+    return any(fnmatch.fnmatch(rel_name, pattern) or fnmatch.fnmatch(file_name, pattern) for pattern in include) and \
+        not any(fnmatch.fnmatch(rel_name, pattern) or fnmatch.fnmatch(file_name, pattern) for pattern in exclude or [])
+
+# Function that returns the (sorted) list of the files in a directory that match at least one of
+# the include patterns and none of the exclude patterns. Patterns are matched against the path
+# of the file relative to the directory (so they can contain sub-directories when recursive)
+def discover_files(path, include=None, exclude=None, recursive: bool = False):
+    """
+    Discover the Files of a datasource
+    :param path: Directory
+    :param include: List of include patterns (fnmatch syntax, default all the files)
+    :param exclude: List of exclude patterns (fnmatch syntax)
+    :param recursive: True to look for files in the sub-directories too
+    :return: List of file names (full paths)
+    """
+    if include == None or len(include) == 0:
+        include = ['*']
+    if exclude == None:
+        exclude = []
+    files = []
+    for dir_path, dir_names, file_names in os.walk(path):
+        dir_names.sort()
+        for file_name in file_names:
+            full_name = os.path.join(dir_path, file_name)
+            if match_file(os.path.relpath(full_name, path), include, exclude):
+                files.append(full_name)
+        if not recursive:
+            break
+    return sorted(files)
+
+# Value of the hive partitions of the missing (null) values
+hive_null_partition = '__HIVE_DEFAULT_PARTITION__'
+
+# Function that returns the value of a hive partition key (integers are converted to int, all
+# the other values, dates included, are kept as strings)
+def parse_partition_value(value: str):
+    """
+    Parse a Partition value
+    :param value: Partition value (as found in the directory name)
+    :return: Value (None, int or str)
+    """
+    value = urllib.parse.unquote(value)
+    if value == hive_null_partition:
+        return None
+    if re.fullmatch(r'-?[0-9]+', value):
+        return int(value)
+    return value
+
+# Function that returns the partition keys and values (key=value directory names) of a file in a
+# hive-style partitioned directory (e.g. dt=2026-10-01/region=eu/part-0.parquet)
+def get_partition_values(path, filename):
+    """
+    Get the Partition values of a file
+    :param path: Partitioned directory (root)
+    :param filename: File name (full path)
+    :return: Dictionary with the partition values (in directory order)
+    """
+    values = {}
+    rel_dir = os.path.relpath(os.path.dirname(filename), path)
+    for name in rel_dir.replace(os.sep, '/').split('/'):
+        if '=' in name:
+            key, value = name.split('=', 1)
+            values[urllib.parse.unquote(key)] = parse_partition_value(value)
+    return values
+
+# Function that converts the (raw) value of a partition directory to the type of a filter value, so
+# they can be compared (e.g. 05 matches 5 when the filter value is a number). Returns the raw value
+# if it cannot be converted
+def coerce_partition_value(value: str, expected):
+    """
+    Coerce a Partition value to the type of a filter value
+    :param value: Raw partition value (None for the null partition)
+    :param expected: Filter value
+    :return: Partition value
+    """
+    if value is None or expected is None or isinstance(expected, str):
+        return value
+    try:
+        if isinstance(expected, bool):
+            return value.lower() == 'true'
+        if isinstance(expected, int):
+            return int(value)
+        if isinstance(expected, float):
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+# Function that returns False when the (partial) raw partition values of a directory cannot match
+# the filters (column, operator, value). Filters on other columns, and values that cannot be
+# compared with the filter value, never exclude a directory
+def partition_matches(values, filters):
+    """
+    Check if Partition values match the Filters
+    :param values: Raw partition values (strings, None for the null partition)
+    :param filters: List of (column, operator, value) filters, all of them must be true
+    :return: False if the partition cannot contain matching records
+    """
+    for column, operator, expected in filters or []:
+        if column not in values:
+            continue
+        if operator == 'in':
+            if not any(coerce_partition_value(values[column], item) == item for item in expected):
+                return False
+            continue
+        value = coerce_partition_value(values[column], expected)
+        if value is None or expected is None:
+            if operator == '==' and value is not expected:
+                return False
+            continue
+        if type(value) != type(expected) and not (isinstance(value, (int, float)) and isinstance(expected, (int, float))):
+            continue
+        if operator == '==' and not value == expected:
+            return False
+        elif operator == '>' and not value > expected:
+            return False
+        elif operator == '>=' and not value >= expected:
+            return False
+        elif operator == '<' and not value < expected:
+            return False
+        elif operator == '<=' and not value <= expected:
+            return False
+    return True
+
+# Function that returns the (sorted) list of the files of a hive-style partitioned directory that
+# match the include and exclude patterns (see discover_files). Partition directories (key=value)
+# whose values cannot match the filters are pruned, so their files are never listed
+def discover_partitioned_files(path, include=None, exclude=None, filters=None):
+    """
+    Discover the Files of a partitioned datasource
+    :param path: Partitioned directory (root)
+    :param include: List of include patterns (fnmatch syntax, default all the files)
+    :param exclude: List of exclude patterns (fnmatch syntax)
+    :param filters: List of (column, operator, value) filters used to prune the partitions
+    :return: List of file names (full paths)
+    """
+    if include == None or len(include) == 0:
+        include = ['*']
+    if exclude == None:
+        exclude = []
+    files = []
+    directories = [(path, {})]
+    while len(directories) > 0:
+        dir_path, values = directories.pop()
+        with os.scandir(dir_path) as scan:
+            for entry in scan:
+                if entry.is_dir():
+                    dir_values = dict(values)
+                    if '=' in entry.name:
+                        key, value = entry.name.split('=', 1)
+                        value = urllib.parse.unquote(value)
+                        dir_values[urllib.parse.unquote(key)] = None if value == hive_null_partition else value
+                        if not partition_matches(dir_values, filters):
+                            continue
+                    directories.append((entry.path, dir_values))
+                elif entry.is_file():
+                    if match_file(os.path.relpath(entry.path, path), include, exclude):
+                        files.append(entry.path)
+    return sorted(files)
+
+# Function that groups a (sorted) list of files of a partitioned directory by partition
+def group_partition_files(path, files):
+    """
+    Group Files by Partition
+    :param path: Partitioned directory (root)
+    :param files: List of file names
+    :return: List of (partition values, list of file names)
+    """
+    groups = []
+    for filename in files:
+        values = get_partition_values(path, filename)
+        if len(groups) > 0 and groups[-1][0] == values:
+            groups[-1][1].append(filename)
+        else:
+            groups.append((values, [filename]))
+    return groups
+
+# Function that returns the compression codec of a file: from its extension or, when reading a file
+# without a known extension, from its magic number. Returns None for uncompressed files
+def get_compression(filename, detect_content: bool = True):
+    """
+    Get the Compression codec of a file
+    :param filename: File name
+    :param detect_content: True to check the first bytes of existing files without a known extension
+    :return: Codec (gzip, bz2, xz or zstd) or None
+    """
+    extension = os.path.splitext(str(filename))[1].lower()
+    if extension in compression_extensions:
+        return compression_extensions[extension]
+    if detect_content and os.path.isfile(filename):
+        with open(filename, 'rb') as file:
+            header = file.read(8)
+        for magic_number, codec in compression_magic_numbers:
+            if header.startswith(magic_number):
+                return codec
+    return None
+
+# Function that adds the compression codec of a file to the options of a pandas reader or writer
+# (unless the options already set it)
+def with_compression(filename, options=None, detect_content: bool = True):
+    """
+    Add the Compression codec to pandas options
+    :param filename: File name
+    :param options: pandas reader or writer options
+    :param detect_content: True to check the first bytes of files without a known extension
+    :return: Options
+    """
+    options = dict(options or {})
+    if 'compression' not in options:
+        options['compression'] = get_compression(filename, detect_content)
+    return options
+
+# Function that opens a file, compressing or decompressing it on the fly when its codec (see
+# get_compression, or the compression argument) is gzip, bz2, xz or zstd. zstd files are written
+# by a pool of threads (threads = -1 uses one thread per CPU)
+def open_file(filename, mode: str = 'rb', encoding: str = None, compression: str = 'infer', level: int = None, threads: int = -1):
+    """
+    Open a (compressed) File
+    :param filename: File name
+    :param mode: Open mode (r, w, a, x, followed by b or t)
+    :param encoding: Text encoding (text modes only)
+    :param compression: infer (from the file), None, gzip, bz2, xz or zstd
+    :param level: Compression level (None for the codec default)
+    :param threads: Compression threads (zstd only)
+    :return: File object
+    """
+    if compression == 'infer':
+        compression = get_compression(filename, 'r' in mode)
+    if 'b' not in mode and 't' not in mode:
+        mode = mode + 't'
+    if compression == None:
+        return open(filename, mode.replace('t', ''), encoding=encoding)
+    elif compression == 'gzip':
+        return gzip.open(filename, mode, compresslevel=level if level != None else 9, encoding=encoding)
+    elif compression == 'bz2':
+        return bz2.open(filename, mode, compresslevel=level if level != None else 9, encoding=encoding)
+    elif compression == 'xz':
+        return lzma.open(filename, mode, preset=level, encoding=encoding)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstandard is required to read and write zstd files: " + str(filename))
+        if 'r' in mode:
+            # zstd readers do not support readline, so they are buffered
+            file = io.BufferedReader(zstandard.open(filename, 'rb'))
+            return file if 'b' in mode else io.TextIOWrapper(file, encoding=encoding)
+        compressor = zstandard.ZstdCompressor(level=level if level != None else 3, threads=threads)
+        return zstandard.open(filename, mode, cctx=compressor, encoding=encoding)
+    raise ValueError("Invalid compression codec: " + str(compression))
+
+# Function that reads a CSV file (read_options are passed to pandas.read_csv, so usecols and dtype
+# are pushed down to the parser, and only the requested columns are parsed)
+def read_csv_file(filename, read_options=None):
+    """
+    Read a CSV File
+    :param filename: File name
+    :param read_options: pandas.read_csv options (usecols, dtype, sep, etc.)
+    :return: DataFrame
+    """
+    return pd.read_csv(filename, **with_compression(filename, read_options))
+
+# Function that reads an Excel file (read_options are passed to pandas.read_excel)
+def read_excel_file(filename, read_options=None, cache=None):
+    """
+    Read an Excel File
+    :param filename: File name
+    :param read_options: pandas.read_excel options (sheet_name, usecols, dtype, etc.)
+    :param cache: Cache settings (see read_cached_file), None to always parse the file
+    :return: DataFrame
+    """
+    if cache is not None and pa is not None:
+        return read_cached_file(filename, functools.partial(pd.read_excel, **(read_options or {})), read_options, cache)
+    return pd.read_excel(filename, **(read_options or {}))
+
+# Function that returns the cache key of a parsed file: it changes when the file (path, size or
+# modification time) or the options used to parse it (e.g. sheet_name and usecols) change
+def get_cache_key(filename, read_options=None):
+    """
+    Get the Cache key of a file
+    :param filename: File name
+    :param read_options: Parser options
+    :return: Cache key (a hex string)
+    """
+    stat = os.stat(filename)
+    key = {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'options': read_options or {}}
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+# Function that removes the least recently used entries of a cache directory until its size is
+# at most max_size bytes (the modification time of an entry is its last use, see read_cached_file)
+def evict_cache_entries(cache_path, max_size: int):
+    """
+    Evict Cache entries
+    :param cache_path: Cache directory
+    :param max_size: Maximum size of the cache (bytes)
+    :return: List of the removed entries
+    """
+    entries = []
+    with os.scandir(cache_path) as scan:
+        for entry in scan:
+            if entry.is_file() and entry.name.endswith('.parquet'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    entries.sort()
+    total_size = sum(entry[1] for entry in entries)
+    removed = []
+    for _, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+    return removed
+
+# Function that reads a file through an on-disk cache of its parsed data (stored as Parquet): the
+# file is parsed only when the cache has no entry for its current key (see get_cache_key), and the
+# cache is then trimmed to its maximum size, evicting the least recently used entries first
+def read_cached_file(filename, reader, read_options, cache):
+    """
+    Read a File through the cache
+    :param filename: File name
+    :param reader: Function that takes the file name and returns a DataFrame
+    :param read_options: Parser options (part of the cache key)
+    :param cache: Cache settings ({'path': cache directory, 'max_size': maximum size in bytes})
+    :return: DataFrame
+    """
+    cache_file = os.path.join(cache.get('path'), get_cache_key(filename, read_options) + '.parquet')
+    try:
+        data = pq.read_table(cache_file).to_pandas()
+        os.utime(cache_file)
+        return data
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning("Invalid cache entry " + cache_file + " for " + str(filename) + ": " + str(e))
+
+    data = reader(filename)
+    if not isinstance(data, pd.DataFrame):
+        return data
+    # The entry is written to a temporary file first, so readers never see a partial entry
+    tmp_file = cache_file + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+    try:
+        os.makedirs(cache.get('path'), exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(data), tmp_file)
+        os.replace(tmp_file, cache_file)
+        evict_cache_entries(cache.get('path'), cache.get('max_size'))
+    except Exception as e:
+        # Data that cannot be stored in Parquet (e.g. columns with mixed types) is not cached
+        logging.warning("Cannot cache " + str(filename) + ": " + str(e))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return data
+
+# Function that reads a list of files with the reader function, concurrently when workers > 1
+# (threads by default, or processes for parsers that hold the GIL), and returns the results in
+# the same order as the files
+def read_files(files, reader, workers: int = 1, executor: str = 'thread'):
+    """
+    Read a list of Files
+    :param files: List of file names
+    :param reader: Function that takes a file name and returns its data
+    :param workers: Number of concurrent readers
+    :param executor: thread or process
+    :return: List of data (one per file)
+    """
+    if workers <= 1 or len(files) <= 1:
+        return [reader(filename) for filename in files]
+    pool_class = concurrent.futures.ThreadPoolExecutor
+    if executor == 'process':
+        pool_class = concurrent.futures.ProcessPoolExecutor
+    with pool_class(max_workers=min(workers, len(files))) as pool:
+        return list(pool.map(reader, files))
+
+# Function that returns the reader function of a file-based datasource type
+def get_file_reader(datasource_type: str, read_options=None, cache=None):
+    """
+    Get the File reader of a datasource type
+    :param datasource_type: Datasource Type (csv or excel)
+    :param read_options: Reader options
+    :param cache: Cache settings of the parsed files (Excel only, see read_cached_file)
+    :return: Function that takes a file name and returns its data
+    """
+    if datasource_type == 'csv':
+        return functools.partial(read_csv_file, read_options=read_options)
+    elif datasource_type == 'excel':
+        return functools.partial(read_excel_file, read_options=read_options, cache=cache)
+    raise ValueError("Invalid file datasource type: " + str(datasource_type))
+
+# Function that yields the records of a list of CSV files in chunks of (at most) chunk_size
+# records each, one file after the other (a streamed union of the files)
+def iter_csv_chunks(files, chunk_size: int, read_options=None):
+    """
+    Read CSV Files in chunks
+    :param files: List of file names
+    :param chunk_size: Number of records per chunk
+    :param read_options: pandas.read_csv options
+    :return: Generator of DataFrames
+    """
+    for filename in files:
+        with pd.read_csv(filename, chunksize=chunk_size, **with_compression(filename, read_options)) as reader:
+            for chunk in reader:
+                yield chunk
+
+# Function that returns a pyarrow dataset over a list of columnar (Parquet or Feather) files
+def open_columnar_dataset(files, datasource_type: str):
+    """
+    Open a Columnar dataset
+    :param files: List of file names
+    :param datasource_type: Datasource Type (parquet or feather)
+    :return: pyarrow Dataset
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read " + str(datasource_type) + " files")
+    if datasource_type not in columnar_formats:
+        raise ValueError("Invalid columnar datasource type: " + str(datasource_type))
+    return pads.dataset(files, format=columnar_formats[datasource_type])
+
+# Function that returns the columns of a dataset to read: the requested columns that exist in the
+# dataset (in the dataset order), or None to read all the columns
+def get_dataset_columns(dataset, columns=None):
+    """
+    Get the Columns of a dataset to read
+    :param dataset: pyarrow Dataset
+    :param columns: List of requested columns (None for all the columns)
+    :return: List of columns (or None)
+    """
+    if columns == None:
+        return None
+    return [name for name in dataset.schema.names if name in columns]
+
+# Function that converts a list of filters (column, operator, value) into a pyarrow expression
+def filters_to_expression(filters):
+    """
+    Convert Filters to an Arrow expression
+    :param filters: List of (column, operator, value) filters, all of them must be true
+    :return: pyarrow Expression (None if there are no filters)
+    """
+    if filters == None or len(filters) == 0:
+        return None
+    return pq.filters_to_expression(filters)
+
+# Function that reads a list of columnar (Parquet or Feather) files as a single Arrow table. Only the
+# requested columns are read, and (for Parquet) the row groups whose statistics cannot match the
+# filters are skipped without being read
+def read_columnar_files(files, datasource_type: str, columns=None, filters=None):
+    """
+    Read Columnar Files
+    :param files: List of file names
+    :param datasource_type: Datasource Type (parquet or feather)
+    :param columns: List of columns to read (None for all the columns)
+    :param filters: List of (column, operator, value) filters
+    :return: Arrow Table
+    """
+    dataset = open_columnar_dataset(files, datasource_type)
+    return dataset.to_table(columns=get_dataset_columns(dataset, columns), filter=filters_to_expression(filters))
+
+# Function that yields the records of a list of columnar (Parquet or Feather) files as Arrow tables
+# of (at most) chunk_size records each, with the same column and row group pruning of read_columnar_files
+def iter_columnar_chunks(files, datasource_type: str, chunk_size: int, columns=None, filters=None):
+    """
+    Read Columnar Files in chunks
+    :param files: List of file names
+    :param datasource_type: Datasource Type (parquet or feather)
+    :param chunk_size: Number of records per chunk
+    :param columns: List of columns to read (None for all the columns)
+    :param filters: List of (column, operator, value) filters
+    :return: Generator of Arrow Tables
+    """
+    dataset = open_columnar_dataset(files, datasource_type)
+    for batch in dataset.to_batches(columns=get_dataset_columns(dataset, columns), filter=filters_to_expression(filters), batch_size=chunk_size):
+        if batch.num_rows > 0:
+            yield pa.Table.from_batches([batch])
+
+# Function that writes an Arrow table to a columnar (Parquet or Feather) file (see open_writer for
+# the write options: compression, compression_level and, Parquet only, row_group_size)
+def write_columnar_file(table, filename, datasource_type: str, write_options=None):
+    """
+    Write a Columnar File
+    :param table: Arrow Table
+    :param filename: File name
+    :param datasource_type: Datasource Type (parquet or feather)
+    :param write_options: Write options (compression, compression_level and row_group_size)
+    :return: File name
+    """
+    if datasource_type not in columnar_formats:
+        raise ValueError("Invalid columnar datasource type: " + str(datasource_type))
+    writer = open_writer(filename, datasource_type, write_options)
+    try:
+        write_batch(writer, table)
+    except Exception:
+        close_writer(writer, False)
+        raise
+    return close_writer(writer)
+
+# File formats of the writers (see open_writer)
+writer_formats = ['csv', 'ndjson', 'parquet', 'feather']
+
+# Default size of the write buffer of the text (CSV and NDJSON) writers
+default_write_buffer_size = 8 * 1024 * 1024
+
+# Write options of the writers that are not passed to pandas.DataFrame.to_csv
+writer_options = ['buffer_size', 'compression', 'compression_level', 'row_group_size']
+
+# Function that opens a file writer. Data is written batch by batch (see write_batch) to a temporary
+# file in the same directory, which replaces the file only when the writer is closed (see close_writer),
+# so readers never see a partial file. Text formats (CSV and NDJSON) are written through a buffer of
+# buffer_size bytes and compressed on the fly according to the file extension (e.g. data.csv.gz).
+# Columnar formats use compression (e.g. snappy, zstd, lz4, gzip or none), compression_level and,
+# for Parquet, row_group_size. The other write options of CSV files are passed to DataFrame.to_csv
+def open_writer(filename, file_format: str, write_options=None):
+    """
+    Open a File writer
+    :param filename: File name
+    :param file_format: File format (csv, ndjson, parquet or feather)
+    :param write_options: Write options
+    :return: Writer (a dictionary)
+    """
+    if file_format not in writer_formats:
+        raise ValueError("Invalid writer file format: " + str(file_format))
+    if file_format in columnar_formats and pa is None:
+        raise ImportError("pyarrow is required to write " + str(file_format) + " files")
+    write_options = dict(write_options or {})
+    directory, name = os.path.split(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    writer = {
+        'filename': filename,
+        # The temporary file name is unique, so many writers of the same file never share it
+        'tmp_filename': os.path.join(directory, '.' + name + '.' + uuid.uuid4().hex + '.tmp'),
+        'format': file_format,
+        'options': write_options,
+        'file': None,
+        'table_writer': None,
+        'rows': 0,
+        'batches': 0,
+    }
+    if file_format in ['csv', 'ndjson']:
+        # Each batch is serialised and then written at once (compressed files get the whole batch too)
+        compression = get_compression(filename, False)
+        if compression != None:
+            writer['file'] = open_file(writer['tmp_filename'], 'wb', compression=compression, level=write_options.get('compression_level'))
+        else:
+            writer['file'] = open(writer['tmp_filename'], 'wb', buffering=int(write_options.get('buffer_size', default_write_buffer_size)))
+    return writer
+
+# Function that returns the compression of a columnar writer (pyarrow names)
+def get_writer_compression(writer):
+    """
+    Get the Compression of a columnar writer
+    :param writer: Writer
+    :return: Compression codec name (or None for the format default)
+    """
+    compression = writer.get('options').get('compression')
+    if compression != None and str(compression).lower() in ['none', 'uncompressed']:
+        return 'none' if writer.get('format') == 'parquet' else 'uncompressed'
+    if compression == None and writer.get('format') == 'parquet':
+        return 'snappy'
+    if compression == None and writer.get('format') == 'feather':
+        return 'lz4'
+    return compression
+
+# Function that writes a batch of data (a DataFrame, an Arrow table or a list of records) to a writer
+def write_batch(writer, data):
+    """
+    Write a Batch of data
+    :param writer: Writer (see open_writer)
+    :param data: Data
+    :return: Number of records written
+    """
+    if data is None:
+        return 0
+    options = writer.get('options')
+    file_format = writer.get('format')
+    if file_format in columnar_formats:
+        if isinstance(data, pd.DataFrame):
+            table = pa.Table.from_pandas(data, preserve_index=False)
+        elif isinstance(data, list):
+            table = pa.Table.from_pylist(data)
+        else:
+            table = data
+        if writer.get('table_writer') == None:
+            writer['schema'] = table.schema
+            compression = get_writer_compression(writer)
+            if file_format == 'parquet':
+                writer['table_writer'] = pq.ParquetWriter(writer.get('tmp_filename'), table.schema, compression=compression,
+                                                          compression_level=options.get('compression_level'))
+            else:
+                codec = None if compression == 'uncompressed' else pa.Codec(compression, options.get('compression_level'))
+                writer['table_writer'] = pa.ipc.new_file(writer.get('tmp_filename'), table.schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+        elif table.schema != writer.get('schema'):
+            table = table.select(writer.get('schema').names).cast(writer.get('schema'))
+        if file_format == 'parquet':
+            writer.get('table_writer').write_table(table, row_group_size=options.get('row_group_size'))
+        else:
+            writer.get('table_writer').write_table(table)
+        rows = table.num_rows
+    else:
+        if pa is not None and isinstance(data, pa.Table):
+            data = data.to_pandas()
+        if file_format == 'csv':
+            if not isinstance(data, pd.DataFrame):
+                data = pd.DataFrame.from_records(data)
+            csv_options = {key: value for key, value in options.items() if key not in writer_options}
+            csv_options.setdefault('index', False)
+            if writer.get('batches') > 0:
+                csv_options['header'] = False
+            content = data.to_csv(**csv_options)
+        elif isinstance(data, pd.DataFrame):
+            content = data.to_json(orient='records', lines=True, date_format='iso') if len(data) > 0 else ''
+        else:
+            content = ''.join(json.dumps(record, default=str) + '\n' for record in data)
+        writer.get('file').write(content.encode(options.get('encoding', 'utf-8')))
+        rows = len(data)
+    writer['rows'] += rows
+    writer['batches'] += 1
+    return rows
+
+# Function that closes a writer: the temporary file replaces the file when commit is True (the data is
+# flushed to disk first), otherwise it is removed
+def close_writer(writer, commit: bool = True):
+    """
+    Close a File writer
+    :param writer: Writer (see open_writer)
+    :param commit: True to replace the file with the written data, False to discard it
+    :return: File name (None when the data is discarded)
+    """
+    try:
+        if writer.get('file') != None:
+            writer.get('file').close()
+        elif writer.get('table_writer') != None:
+            writer.get('table_writer').close()
+        elif commit and writer.get('format') in columnar_formats:
+            # No batch was written: columnar files get an empty table (without columns)
+            write_batch(writer, pa.table({}))
+            writer.get('table_writer').close()
+        if commit:
+            with open(writer.get('tmp_filename'), 'rb') as file:
+                os.fsync(file.fileno())
+            os.replace(writer.get('tmp_filename'), writer.get('filename'))
+            return writer.get('filename')
+        return None
+    finally:
+        if os.path.exists(writer.get('tmp_filename')):
+            os.remove(writer.get('tmp_filename'))
+
+# Read modes of the raw file datasource:
+# text:  the content of all the files as a single string
+# mmap:  a list of read-only memory-mapped buffers (one per file), pages are loaded on access
+# lines: a lazy iterator over the lines of all the files (one file open at the time)
+file_read_modes = ['text', 'mmap', 'lines']
+
+# Function that reads the content of a list of text files as a single string. The contents are
+# joined once, so every byte is copied once (instead of once per file as with repeated +=)
+def read_text_files(files, encoding: str = 'utf-8', transform=None):
+    """
+    Read Text Files
+    :param files: List of file names
+    :param encoding: Files encoding
+    :param transform: Optional function applied to the content of each file
+    :return: Content of the files (a string)
+    """
+    contents = []
+    for filename in files:
+        with open_file(filename, 'rt', encoding) as file:
+            content = file.read()
+        if transform != None:
+            content = transform(content)
+        if content != None and content != '':
+            contents.append(str(content))
+    return ''.join(contents)
+
+# Function that returns a read-only memory map of a file (the operating system loads its pages
+# only when they are accessed, and they are shared with the page cache, so nothing is copied).
+# Compressed files cannot be mapped, so their decompressed content is returned instead
+def map_file(filename):
+    """
+    Memory-map a File
+    :param filename: File name
+    :return: mmap object (bytes for empty and compressed files, which cannot be mapped)
+    """
+    if get_compression(filename) != None:
+        with open_file(filename, 'rb') as file:
+            return file.read()
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+# Function that returns the memory maps of a list of files
+def map_files(files):
+    """
+    Memory-map a list of Files
+    :param files: List of file names
+    :return: List of mmap objects (one per file)
+    """
+    return [map_file(filename) for filename in files]
+
+# Function that yields the lines of a list of text files, one file after the other. Only one file
+# is open at the time and only one line at the time is held in memory
+def iter_file_lines(files, encoding: str = 'utf-8', keep_newlines: bool = False):
+    """
+    Iterate over the Lines of a list of Files
+    :param files: List of file names
+    :param encoding: Files encoding
+    :param keep_newlines: True to keep the line terminators
+    :return: Generator of lines
+    """
+    for filename in files:
+        with open_file(filename, 'rt', encoding) as file:
+            for line in file:
+                yield line if keep_newlines else line.rstrip('\r\n')
+
+# Function that yields lists of (at most) chunk_size items of an iterator
+def iter_chunks(iterator, chunk_size: int):
+    """
+    Split an Iterator in chunks
+    :param iterator: Iterator
+    :param chunk_size: Number of items per chunk
+    :return: Generator of lists
+    """
+    iterator = iter(iterator)
+    chunk = list(itertools.islice(iterator, chunk_size))
+    while len(chunk) > 0:
+        yield chunk
+        chunk = list(itertools.islice(iterator, chunk_size))
+
+# Function that returns the function used to parse JSON values (orjson when available, unless
+# the standard library parser is requested)
+def get_json_parser(parser: str = 'auto'):
+    """
+    Get the JSON parser
+    :param parser: auto, orjson or json
+    :return: Function that takes a JSON string (or bytes) and returns its value
+    """
+    parser = str(parser).lower().strip()
+    if parser == 'orjson' or (parser == 'auto' and orjson is not None):
+        if orjson is None:
+            raise ImportError("orjson is required by the orjson JSON parser")
+        return orjson.loads
+    elif parser in ['auto', 'json']:
+        return json.loads
+    raise ValueError("Invalid JSON parser: " + parser)
+
+# Function that yields the records of a list of JSON Lines files in lists of (at most)
+# chunk_size records. The files are read one line at the time, so the memory used depends
+# on the chunk size only
+def iter_ndjson_records(files, chunk_size: int, parser: str = 'auto'):
+    """
+    Read JSON Lines Files in chunks
+    :param files: List of file names
+    :param chunk_size: Number of records per chunk
+    :param parser: JSON parser (see get_json_parser)
+    :return: Generator of lists of records
+    """
+    loads = get_json_parser(parser)
+    for filename in files:
+        chunk = []
+        with open_file(filename, 'rb') as file:
+            for line_number, line in enumerate(file, 1):
+                if line.strip() == b'':
+                    continue
+                try:
+                    chunk.append(loads(line))
+                except ValueError as e:
+                    raise ValueError(filename + ', line ' + str(line_number) + ': ' + str(e))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+# Function that splits a JSON path (e.g. $.data[*] or $['data'][*].items[*]) in its keys
+# (where * stands for all the items of an array)
+def parse_json_path(json_path: str):
+    """
+    Parse a JSON path
+    :param json_path: JSON path (must select the items of an array, so it ends with [*])
+    :return: List of keys
+    """
+    path = str(json_path).strip()
+    if not path.startswith('$'):
+        raise ValueError("Invalid JSON path (it must start with $): " + path)
+    keys = []
+    idx = 1
+    while idx < len(path):
+        if path[idx] == '.':
+            end = idx + 1
+            while end < len(path) and path[end] not in '.[':
+                end += 1
+            keys.append(path[idx + 1:end])
+        elif path.startswith('[*]', idx):
+            end = idx + 3
+            keys.append('*')
+        elif path[idx] == '[' and path[idx + 1:idx + 2] in ['"', "'"]:
+            end = path.find(path[idx + 1] + ']', idx + 2)
+            if end < 0:
+                raise ValueError("Invalid JSON path: " + path)
+            keys.append(path[idx + 2:end])
+            end += 2
+        else:
+            raise ValueError("Invalid JSON path: " + path)
+        if keys[-1] == '':
+            raise ValueError("Invalid JSON path: " + path)
+        idx = end
+    if len(keys) == 0 or keys[-1] != '*':
+        raise ValueError("Invalid JSON path (it must select the items of an array): " + path)
+    return keys
+
+# Function that yields the values found at a (parsed) JSON path in a JSON value
+def walk_json_path(value, keys):
+    """
+    Walk a JSON path
+    :param value: JSON value
+    :param keys: List of keys (see parse_json_path)
+    :return: Generator of values
+    """
+    if len(keys) == 0:
+        yield value
+    elif keys[0] == '*':
+        if isinstance(value, list):
+            for item in value:
+                yield from walk_json_path(item, keys[1:])
+    elif isinstance(value, dict) and keys[0] in value:
+        yield from walk_json_path(value.get(keys[0]), keys[1:])
+
+# Function that yields the items selected by a JSON path in a JSON file. With ijson the document
+# is parsed incrementally and only one item at the time is held in memory; without it the whole
+# document is loaded first
+def iter_json_path_items(filename, json_path: str, parser: str = 'auto'):
+    """
+    Read the Items selected by a JSON path
+    :param filename: File name
+    :param json_path: JSON path (e.g. $.data[*])
+    :param parser: JSON parser used when ijson is not available (see get_json_parser)
+    :return: Generator of items
+    """
+    keys = parse_json_path(json_path)
+    if ijson is not None:
+        prefix = '.'.join(['item' if key == '*' else key for key in keys])
+        with open_file(filename, 'rb') as file:
+            yield from ijson.items(file, prefix, use_float=True)
+    else:
+        logging.warning("ijson is not installed, the JSON file " + str(filename) + " is loaded in memory")
+        with open_file(filename, 'rb') as file:
+            document = get_json_parser(parser)(file.read())
+        yield from walk_json_path(document, keys)
+
+# Function that yields the items selected by a JSON path in a list of JSON files, in lists of
+# (at most) chunk_size items
+def iter_json_records(files, chunk_size: int, json_path: str, parser: str = 'auto'):
+    """
+    Read JSON Files in chunks
+    :param files: List of file names
+    :param chunk_size: Number of records per chunk
+    :param json_path: JSON path of the records (e.g. $.data[*])
+    :param parser: JSON parser used when ijson is not available (see get_json_parser)
+    :return: Generator of lists of records
+    """
+    for filename in files:
+        yield from iter_chunks(iter_json_path_items(filename, json_path, parser), chunk_size)
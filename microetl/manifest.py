@@ -0,0 +1,132 @@
+########################################################
+#    Name: ETLEng Manifest
+# Release: 0.0.1
+# Purpose: Processed-files manifest of the incremental
+#          file ingestion (the state of the files read
+#          by the previous successful runs of a job)
+#  Author: Paolo Fabio Zaino
+#   Usage: Check docs/jobs_configuration_via_YAML.md
+########################################################
+
+# Import the required modules:
+import os
+import json
+import hashlib
+import logging
+import traceback
+
+# Size of the blocks read to compute the content hash of a file
+hash_block_size = 1024 * 1024
+
+# Function that returns the file name of the manifest of a job datasource
+def get_manifest_file(state_path, job_name, section_name: str = 'source'):
+    """
+    Get the Manifest file name
+    :param state_path: Directory of the state store
+    :param job_name: Job name (e.g. the job configuration file name)
+    :param section_name: Datasource section name
+    :return: Manifest file name
+    """
+    job = os.path.splitext(os.path.basename(str(job_name)))[0]
+    return os.path.join(state_path, job + '.' + section_name + '.manifest.json')
+
+# Function that loads a manifest (an empty manifest if the file does not exist yet)
+def load_manifest(filename):
+    """
+    Load a Manifest
+    :param filename: Manifest file name
+    :return: Manifest (a dictionary with the state of each processed file)
+    """
+    if not os.path.exists(filename):
+        return {'version': 1, 'files': {}}
+    with open(filename, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    if not isinstance(manifest.get('files'), dict):
+        raise ValueError("Invalid manifest: " + str(filename))
+    return manifest
+
+# Function that returns the content hash of a file (read one block at the time)
+def get_file_hash(filename, hash_algorithm: str = 'sha256'):
+    """
+    Get the Hash of a file
+    :param filename: File name
+    :param hash_algorithm: hashlib algorithm name
+    :return: Hex digest
+    """
+    file_hash = hashlib.new(hash_algorithm)
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(hash_block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+# Function that returns the state (size, modification time and, if requested, content hash) of a file
+def get_file_state(filename, hash_algorithm: str = None):
+    """
+    Get the State of a file
+    :param filename: File name
+    :param hash_algorithm: hashlib algorithm name (None to not hash the file content)
+    :return: File state (a dictionary)
+    """
+    stat = os.stat(filename)
+    state = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    if hash_algorithm != None:
+        state['hash'] = hash_algorithm + ':' + get_file_hash(filename, hash_algorithm)
+    return state
+
+# Function that selects the new and changed files of a list, comparing them with the manifest.
+# A file is unchanged when its size and modification time did not change or, when a hash algorithm
+# is given, when its content hash did not change (so files that were only touched are skipped)
+def select_changed_files(manifest, files, hash_algorithm: str = None):
+    """
+    Select the Changed files
+    :param manifest: Manifest
+    :param files: List of file names
+    :param hash_algorithm: hashlib algorithm name (None to compare size and modification time only)
+    :return: (list of the new or changed files, states of all the files to store in the manifest)
+    """
+    changed_files = []
+    states = {}
+    for filename in files:
+        key = os.path.abspath(filename)
+        previous = manifest.get('files').get(key)
+        stat = os.stat(filename)
+        state = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if previous != None and previous.get('size') == state['size'] and previous.get('mtime') == state['mtime']:
+            if previous.get('hash') != None:
+                state['hash'] = previous.get('hash')
+            states[key] = state
+            continue
+        if hash_algorithm != None:
+            state = get_file_state(filename, hash_algorithm)
+            if previous != None and previous.get('hash') == state['hash']:
+                states[key] = state
+                continue
+        changed_files.append(filename)
+        states[key] = state
+    return changed_files, states
+
+# Function that stores the states of the processed files in the manifest and writes it (to a
+# temporary file first, so a failed write never leaves a partial manifest). Entries of files that
+# no longer exist are removed
+def commit_manifest(filename, manifest, states):
+    """
+    Commit a Manifest
+    :param filename: Manifest file name
+    :param manifest: Manifest
+    :param states: States of the processed files (see select_changed_files)
+    :return: True if the manifest was written
+    """
+    try:
+        files = {key: value for key, value in manifest.get('files').items() if os.path.exists(key)}
+        files.update(states)
+        manifest['files'] = files
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        tmp_filename = filename + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_filename, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+        os.replace(tmp_filename, filename)
+        return True
+    except Exception as e:
+        logging.error("Error in ETLEng Manifest: " + str(e))
+        logging.error("Error in ETLEng Manifest: {}".format(traceback.format_exc()))
+        return False
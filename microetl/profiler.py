@@ -0,0 +1,286 @@
+########################################################
+#    Name: ETLEng Profiler
+# Release: 0.0.1
+# Purpose: Per-step profiling of the ETL pipelines
+#          (wall time, CPU time, rows, bytes and peak
+#          memory of every stage of a job run)
+#  Author: Paolo Fabio Zaino
+#   Usage: Check docs/jobs_configuration_via_YAML.md
+########################################################
+
+# Import the required modules:
+import os
+import sys
+import json
+import time
+import datetime
+import logging
+import traceback
+
+# resource is not available on every platform (e.g. Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Function that returns a new (empty) profile for a job run
+def new_profile(job):
+    """
+    Create a new Profile
+    :param job: Job name
+    :return: Profile (a dictionary)
+    """
+    return {
+        'job': str(job),
+        'started_at': datetime.datetime.now().isoformat(),
+        'wall_time': 0.0,
+        'cpu_time': 0.0,
+        'peak_memory': None,
+        'steps': [],
+        '_start': (time.perf_counter(), time.process_time()),
+    }
+
+# Function that returns the peak memory (resident set size) of the process, in bytes
+def get_peak_memory():
+    """
+    Get the Peak memory of the process
+    :return: Peak memory in bytes (None if not available)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports ru_maxrss in KB, macOS in bytes
+    if sys.platform != 'darwin':
+        peak = peak * 1024
+    return peak
+
+# Function that returns the number of records in a data object (None if the data
+# object has no notion of records)
+def count_rows(data):
+    """
+    Count the rows in the Data
+    :param data: Data
+    :return: Number of rows (or None)
+    """
+    if data is None:
+        return None
+    if hasattr(data, 'num_rows'):
+        return data.num_rows
+    if isinstance(data, list) or hasattr(data, 'memory_usage'):
+        return len(data)
+    return None
+
+# Function that returns the (shallow) size in bytes of a data object. Strings held in
+# numpy object columns are not included, as measuring them means visiting every value
+def count_bytes(data):
+    """
+    Count the bytes of the Data
+    :param data: Data
+    :return: Size in bytes (or None)
+    """
+    if data is None:
+        return None
+    if hasattr(data, 'nbytes') and hasattr(data, 'num_rows'):
+        return int(data.nbytes)
+    if hasattr(data, 'memory_usage'):
+        return int(data.memory_usage(index=True, deep=False).sum())
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    return None
+
+# Function that returns the record of a step in a profile (creating it if needed). A step that
+# runs many times (e.g. once per batch in streaming mode) has a single record with the totals.
+# Records are identified by the step id (e.g. the position of a transform step in the sequence)
+# or, for steps without an id, by their name and kind
+def get_step_record(profile, name, kind, step_id=None):
+    """
+    Get the Record of a step
+    :param profile: Profile
+    :param name: Step name
+    :param kind: Step kind (source, transform or destination)
+    :param step_id: Step id (None to identify the step by its name and kind)
+    :return: Step record
+    """
+    for record in profile.get('steps'):
+        if step_id != None and record.get('id') == step_id:
+            return record
+        if step_id == None and record.get('id') == None and record.get('name') == name and record.get('kind') == kind:
+            return record
+    record = {
+        'id': step_id,
+        'name': name,
+        'kind': kind,
+        'calls': 0,
+        'wall_time': 0.0,
+        'cpu_time': 0.0,
+        'rows_in': None,
+        'rows_out': None,
+        'bytes_in': None,
+        'bytes_out': None,
+        'peak_memory_delta': None,
+    }
+    profile.get('steps').append(record)
+    return record
+
+# Function that adds a value to a total (either can be None)
+def add_value(total, value):
+    """
+    Add a value to a total
+    :param total: Running total (or None)
+    :param value: Value (or None)
+    :return: New total (or None if no value is known)
+    """
+    if value is None:
+        return total
+    if total is None:
+        return value
+    return total + value
+
+# Function that adds a measurement to the record of a step
+def record_step(profile, name, kind, wall_time, cpu_time, data_in, data_out, peak_memory_delta, step_id=None):
+    """
+    Record a step measurement
+    :param profile: Profile
+    :param name: Step name
+    :param kind: Step kind (source, transform or destination)
+    :param wall_time: Wall time (seconds)
+    :param cpu_time: CPU time (seconds)
+    :param data_in: Data received by the step (None for sources)
+    :param data_out: Data returned by the step
+    :param peak_memory_delta: Increase of the peak memory (bytes)
+    :param step_id: Step id (None to identify the step by its name and kind)
+    :return: Step record
+    """
+    record = get_step_record(profile, name, kind, step_id)
+    record['calls'] += 1
+    record['wall_time'] += wall_time
+    record['cpu_time'] += cpu_time
+    if kind != 'source':
+        record['rows_in'] = add_value(record['rows_in'], count_rows(data_in))
+        record['bytes_in'] = add_value(record['bytes_in'], count_bytes(data_in))
+    record['rows_out'] = add_value(record['rows_out'], count_rows(data_out))
+    record['bytes_out'] = add_value(record['bytes_out'], count_bytes(data_out))
+    record['peak_memory_delta'] = add_value(record['peak_memory_delta'], peak_memory_delta)
+    return record
+
+# Function that calls a step function on the data and records its measurements in the profile
+# (when profile is None the step function is just called)
+def profile_call(profile, name, kind, func, data, step_id=None):
+    """
+    Profile a step call
+    :param profile: Profile (or None)
+    :param name: Step name
+    :param kind: Step kind (source, transform or destination)
+    :param func: Step function (takes the data and returns the processed data)
+    :param data: Data
+    :param step_id: Step id (None to identify the step by its name and kind)
+    :return: Processed Data
+    """
+    if profile is None:
+        return func(data)
+    peak_memory = get_peak_memory()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    result = func(data)
+    wall_time, cpu_time = time.perf_counter() - start_wall, time.process_time() - start_cpu
+    peak_memory_delta = None
+    if peak_memory is not None:
+        peak_memory_delta = get_peak_memory() - peak_memory
+    record_step(profile, name, kind, wall_time, cpu_time, data, result, peak_memory_delta, step_id)
+    return result
+
+# Function that yields the items of an iterable (e.g. the batches produced by a source) and
+# records the time spent producing each of them in the profile
+def profile_iter(profile, name, kind, iterable):
+    """
+    Profile an iterable
+    :param profile: Profile (or None)
+    :param name: Step name
+    :param kind: Step kind (source, transform or destination)
+    :param iterable: Iterable (e.g. a generator of data batches)
+    :return: Generator of the items of the iterable
+    """
+    if profile is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        peak_memory = get_peak_memory()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        wall_time, cpu_time = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        peak_memory_delta = None
+        if peak_memory is not None:
+            peak_memory_delta = get_peak_memory() - peak_memory
+        record_step(profile, name, kind, wall_time, cpu_time, None, item, peak_memory_delta)
+        yield item
+
+# Function that closes a profile (computing the totals of the run) and returns its report
+def finish_profile(profile, status: str = 'ok'):
+    """
+    Finish a Profile
+    :param profile: Profile
+    :param status: Status of the run
+    :return: Profile report (a JSON serialisable dictionary)
+    """
+    start_wall, start_cpu = profile.pop('_start', (time.perf_counter(), time.process_time()))
+    profile['status'] = status
+    profile['wall_time'] = time.perf_counter() - start_wall
+    profile['cpu_time'] = time.process_time() - start_cpu
+    profile['peak_memory'] = get_peak_memory()
+    return profile
+
+# Function that writes a profile report to a JSON file in report_path and returns the file name
+def write_profile_report(profile, report_path):
+    """
+    Write a Profile report
+    :param profile: Profile report (see finish_profile)
+    :param report_path: Directory where to write the report
+    :return: Report file name (None on errors)
+    """
+    try:
+        os.makedirs(report_path, exist_ok=True)
+        job_name = os.path.splitext(os.path.basename(profile.get('job')))[0]
+        timestamp = profile.get('started_at').replace(':', '').replace('-', '').replace('.', '_')
+        report_file = os.path.join(report_path, job_name + '_' + timestamp + '.profile.json')
+        with open(report_file, 'w') as report:
+            json.dump(profile, report, indent=4)
+        return report_file
+    except Exception as e:
+        logging.error("Error in ETLEng Profiler: " + str(e))
+        logging.error("Error in ETLEng Profiler: {}".format(traceback.format_exc()))
+        return None
+
+# Function that formats a profile report as a table (one row per step)
+def format_profile_table(profile):
+    """
+    Format a Profile report as a table
+    :param profile: Profile report (see finish_profile)
+    :return: Table (a string)
+    """
+    def fmt(value, pattern='{}'):
+        return '-' if value is None else pattern.format(value)
+
+    def fmt_bytes(value):
+        if value is None:
+            return '-'
+        if abs(value) < 1024:
+            return str(value) + 'B'
+        for unit in ['KB', 'MB', 'GB']:
+            value = value / 1024
+            if abs(value) < 1024 or unit == 'GB':
+                return '{:.1f}{}'.format(value, unit)
+
+    row = '{:<30} {:<12} {:>6} {:>10} {:>10} {:>12} {:>12} {:>10} {:>10}'
+    lines = ['Profile of job: ' + profile.get('job'),
+             row.format('Step', 'Kind', 'Calls', 'Wall (s)', 'CPU (s)', 'Rows in', 'Rows out', 'Bytes out', 'Peak mem+')]
+    for record in profile.get('steps'):
+        lines.append(row.format(str(record.get('name'))[:30], record.get('kind'), record.get('calls'),
+                                fmt(record.get('wall_time'), '{:.3f}'), fmt(record.get('cpu_time'), '{:.3f}'),
+                                fmt(record.get('rows_in')), fmt(record.get('rows_out')),
+                                fmt_bytes(record.get('bytes_out')), fmt_bytes(record.get('peak_memory_delta'))))
+    lines.append(row.format('Total', '', '', fmt(profile.get('wall_time'), '{:.3f}'), fmt(profile.get('cpu_time'), '{:.3f}'),
+                            '', '', '', fmt_bytes(profile.get('peak_memory'))))
+    return '\n'.join(lines)
@@ -0,0 +1,180 @@
+########################################################
+#    Name: ETLEng Watcher
+# Release: 0.0.1
+# Purpose: Polling of the landing directories of the
+#          file-based jobs and grouping of the newly
+#          arrived files in micro-batches (watch mode)
+#  Author: Paolo Fabio Zaino
+#   Usage: Check docs/ETLEng.md
+########################################################
+
+# Import the required modules:
+import os
+
+import microetl.fileio as fio
+
+# Default watch settings
+default_watch_settings = {
+    'poll_interval': 5.0,    # seconds between two scans of the directories
+    'batch_files': 100,      # maximum number of files in a micro-batch
+    'batch_latency': 30.0,   # maximum seconds a file waits before its micro-batch runs
+    'max_retries': 3,        # times the files of a failed micro-batch are retried
+    'retry_delay': 30.0,     # seconds before the first retry (doubled at each further retry)
+}
+
+# Function that returns a new (empty) watch state of a directory
+def new_watch_state(path, include=None, exclude=None, recursive: bool = False):
+    """
+    Create a new Watch state
+    :param path: Directory to watch
+    :param include: List of include patterns (fnmatch syntax, default all the files)
+    :param exclude: List of exclude patterns (fnmatch syntax)
+    :param recursive: True to watch the sub-directories too
+    :return: Watch state (a dictionary)
+    """
+    return {
+        'path': path,
+        'include': include,
+        'exclude': exclude,
+        'recursive': recursive,
+        'dirs': {},         # directory -> (mtime, files, sub-directories) of the last scan
+        'snapshot': {},     # file -> (size, mtime) of the last scan
+        'pending': {},      # file -> time it was found ready (waiting for its micro-batch)
+        'processed': {},    # file -> (size, mtime) when it was processed
+        'retries': {},      # file -> (failed runs, time of the next retry) of the files of failed micro-batches
+    }
+
+# Function that scans the watched directory and returns the size and modification time of its files.
+# Directories whose modification time did not change since the last scan are not listed again, and
+# their files that were already processed are not checked again (files are expected to be added to
+# the landing directories, e.g. by an atomic rename, and not rewritten in place)
+def scan_files(state):
+    """
+    Scan the Files of a watched directory
+    :param state: Watch state
+    :return: Dictionary with the (size, mtime) of each file
+    """
+    snapshot = {}
+    dirs = {}
+    directories = [state.get('path')]
+    while len(directories) > 0:
+        dir_path = directories.pop()
+        try:
+            dir_mtime = os.stat(dir_path).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        cached = state.get('dirs').get(dir_path)
+        unchanged = cached != None and cached[0] == dir_mtime
+        if unchanged:
+            files, sub_dirs = cached[1], cached[2]
+        else:
+            files, sub_dirs = [], []
+            with os.scandir(dir_path) as scan:
+                for entry in scan:
+                    if entry.is_dir():
+                        sub_dirs.append(entry.path)
+                    elif entry.is_file() and fio.match_file(os.path.relpath(entry.path, state.get('path')), state.get('include'), state.get('exclude')):
+                        files.append(entry.path)
+        dirs[dir_path] = (dir_mtime, files, sub_dirs)
+        for filename in files:
+            previous = state.get('snapshot').get(filename)
+            if unchanged and previous != None and state.get('processed').get(filename) == previous:
+                snapshot[filename] = previous
+                continue
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            snapshot[filename] = (stat.st_size, stat.st_mtime_ns)
+        if state.get('recursive'):
+            directories.extend(sub_dirs)
+    state['dirs'] = dirs
+    return snapshot
+
+# Function that scans the watched directory and adds the new (or changed) files to the pending files.
+# A file is ready only when its size and modification time did not change since the previous scan,
+# so files that are still being written are not picked up
+def poll_files(state, now: float):
+    """
+    Poll the Files of a watched directory
+    :param state: Watch state
+    :param now: Current time (seconds)
+    :return: List of the files that became ready
+    """
+    previous_snapshot = state.get('snapshot')
+    snapshot = scan_files(state)
+    ready = []
+    for filename, file_state in snapshot.items():
+        if filename in state.get('pending') or state.get('processed').get(filename) == file_state:
+            continue
+        if previous_snapshot.get(filename) == file_state:
+            state.get('pending')[filename] = now
+            ready.append(filename)
+    state['snapshot'] = snapshot
+    # Files that were removed are forgotten
+    state['processed'] = {filename: file_state for filename, file_state in state.get('processed').items() if filename in snapshot}
+    state['pending'] = {filename: found for filename, found in state.get('pending').items() if filename in snapshot}
+    state['retries'] = {filename: retry for filename, retry in state.get('retries').items() if filename in state.get('pending')}
+    return ready
+
+# Function that returns the next micro-batch of pending files: up to batch_files files, as soon as
+# there are batch_files pending files or the oldest one waited batch_latency seconds (or flush is True).
+# The files of failed micro-batches are taken again only after their retry time
+def take_micro_batch(state, now: float, batch_files: int, batch_latency: float, flush: bool = False):
+    """
+    Take a Micro-batch of pending files
+    :param state: Watch state
+    :param now: Current time (seconds)
+    :param batch_files: Maximum number of files in a micro-batch
+    :param batch_latency: Maximum seconds a file waits before its micro-batch runs
+    :param flush: True to take the pending files regardless of the batch limits
+    :return: List of files (empty if no micro-batch is ready)
+    """
+    retries = state.get('retries')
+    pending = sorted([item for item in state.get('pending').items() if retries.get(item[0], (0, now))[1] <= now], key=lambda item: (item[1], item[0]))
+    if len(pending) == 0:
+        return []
+    if not flush and len(pending) < batch_files and now - pending[0][1] < batch_latency:
+        return []
+    files = sorted(filename for filename, _ in pending[:batch_files])
+    for filename in files:
+        del state.get('pending')[filename]
+    return files
+
+# Function that marks the files of a micro-batch as processed (with their state when they were
+# taken), so they are picked up again only if they change
+def mark_processed(state, files):
+    """
+    Mark Files as processed
+    :param state: Watch state
+    :param files: List of file names
+    :return: None
+    """
+    for filename in files:
+        state.get('retries').pop(filename, None)
+        if state.get('snapshot').get(filename) != None:
+            state.get('processed')[filename] = state.get('snapshot').get(filename)
+
+# Function that puts the files of a failed micro-batch back in the pending files, to be retried after
+# retry_delay seconds (doubled at each further retry). After max_retries retries the files are marked
+# as processed, so they are read again only if they change
+def mark_failed(state, files, now: float, max_retries: int, retry_delay: float):
+    """
+    Mark Files as failed
+    :param state: Watch state
+    :param files: List of file names
+    :param now: Current time (seconds)
+    :param max_retries: Maximum number of retries of a file
+    :param retry_delay: Seconds before the first retry
+    :return: List of the files that will not be retried
+    """
+    given_up = []
+    for filename in files:
+        failures = state.get('retries').get(filename, (0, now))[0] + 1
+        if failures > max_retries:
+            mark_processed(state, [filename])
+            given_up.append(filename)
+        elif state.get('snapshot').get(filename) != None:
+            state.get('pending')[filename] = now
+            state.get('retries')[filename] = (failures, now + retry_delay * 2 ** (failures - 1))
+    return given_up
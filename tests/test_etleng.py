@@ -14,6 +14,10 @@ import json
 import yaml
 import time
 import traceback
+import tempfile
+import io
+import struct
+from unittest import mock
 
 # Import microetl to test it:
 from microetl import core as metl
@@ -31,6 +35,119 @@ json_schema_file2   = './tests/inp_data/microetl_test_schema_002.json'
 json_schema_file3   = './tests/inp_data/microetl_test_schema_003.json'
 json_schema_file4   = './tests/inp_data/fields_schema.json'
 
+# Build a job configuration (as returned by read_config_file) that reads CSV files from inp_path
+def make_csv_job_config(inp_path, out_path, sequence=None, execution=None):
+    job_config = {
+        'datasources': {
+            'source': { 'type': 'csv' },
+            'destination': { 'type': 'csv' },
+        },
+        'actions': {
+            'source': { 'name': 'read test data' },
+        },
+        'paths': {
+            'base_path': inp_path,
+            'cfg_path': inp_path,
+            'inp_path': inp_path,
+            'out_path': out_path,
+        },
+    }
+    if sequence != None:
+        job_config['actions']['transform'] = { 'sequence': sequence }
+    if execution != None:
+        job_config['execution'] = execution
+    return job_config
+
+# Write a set of CSV files (one per DataFrame) in a directory:
+def write_csv_files(path, dataframes):
+    for idx, df in enumerate(dataframes):
+        df.to_csv(os.path.join(path, 'data_' + str(idx).zfill(3) + '.csv'), index=False)
+
+# Minimal DB-API connection stub that records the statements (and COPY payloads) it receives, used
+# to test the database destinations without a database server:
+class FakeDBCursor:
+    def __init__(self, conn):
+        self.conn = conn
+    def execute(self, statement, params=None):
+        self.conn.statements.append(statement)
+    def fetchall(self):
+        return self.conn.rows
+    def copy_expert(self, statement, file):
+        self.conn.copies.append((statement, file.read()))
+    def close(self):
+        pass
+
+class FakeDBConnection:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.statements = []
+        self.copies = []
+        self.commits = 0
+        self.rollbacks = 0
+    def cursor(self, *args, **kwargs):
+        return FakeDBCursor(self)
+    def commit(self):
+        self.commits += 1
+    def rollback(self):
+        self.rollbacks += 1
+
+# Render a psycopg2 composed statement without a connection (identifiers double quoted), used to
+# check the statements of the Postgres destinations:
+def render_sql(statement):
+    if isinstance(statement, metl.dbc.postgres.sql.Composed):
+        return ''.join(render_sql(part) for part in statement.seq)
+    if isinstance(statement, metl.dbc.postgres.sql.Identifier):
+        return '.'.join('"' + part + '"' for part in statement.strings)
+    if isinstance(statement, metl.dbc.postgres.sql.SQL):
+        return statement.string
+    return str(statement)
+
+# Minimal MongoDB client stub: collections store the documents they receive (upserts replace the
+# document with the same key)
+class FakeMongoCollection:
+    def __init__(self):
+        self.documents = {}
+        self.requests = []
+    def insert_many(self, documents, ordered=True):
+        self.requests.append(('insert_many', len(documents), ordered))
+        for document in documents:
+            self.documents[len(self.documents)] = dict(document)
+        return mock.Mock(inserted_ids=list(range(0, len(documents))))
+    def bulk_write(self, requests, ordered=True):
+        self.requests.append(('bulk_write', len(requests), ordered))
+        matched = 0
+        for request in requests:
+            key = tuple(sorted(request._filter.items()))
+            matched += 1 if key in self.documents else 0
+            self.documents[key] = dict(request._doc['$set'])
+        return mock.Mock(matched_count=matched, upserted_count=len(requests) - matched)
+
+class FakeMongoClient:
+    def __init__(self):
+        self.databases = {}
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, {})
+    def get_default_database(self):
+        return self['default']
+
+# Minimal Neo4j driver stub: the write transactions of its sessions record the statement, database and
+# rows they run
+class FakeNeo4jDriver:
+    def __init__(self):
+        self.transactions = []
+    def session(self, database=None):
+        driver = self
+        class Session:
+            def __enter__(self):
+                return self
+            def __exit__(self, *args):
+                return False
+            def execute_write(self, work):
+                tx = mock.Mock()
+                tx.run = lambda statement, rows=None: driver.transactions.append((statement, database, rows)) or mock.Mock()
+                return work(tx)
+        return Session()
+
 # Write a test class for the microetl.py module:
 class TestMicroETL(unittest.TestCase):
     # setUpClass method to create a microetl object to test the microetl class methods and attributes
@@ -201,3 +318,907 @@ class TestMicroETL(unittest.TestCase):
         # Assert that JSON data object is valid against the schema:
 #        assert metl.validate_data(data_object, schema) == True
 
+    # test the streaming mode reads the source in batches of batch_size records:
+    @classmethod
+    def test_ETL008_read_data_batches_from_ds(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(0, 5)}), pd.DataFrame({'id': range(5, 8)})])
+            job_config = make_csv_job_config(tmp_dir, tmp_dir)
+            batches = list(metl.read_data_batches_from_ds(job_config, 'csv', 'source', 2))
+            assert [len(batch) for batch in batches] == [2, 2, 1, 2, 1]
+            assert list(metl.concat_data_batches(batches)['id']) == list(range(0, 8))
+        # Database source actions run their query when the source is read, so their step passes the batches through:
+        assert metl.compile_step({}, None, 'source', {'name': 'query', 'type': 'SQL_to_DataFrame'}) is metl.pass_through
+
+    # test that transform sequences are split at the first blocking step:
+    @classmethod
+    def test_ETL009_split_transform_sequence(cls):
+        sequence = [{'type': 'filter'}, {'type': 'print'}, {'type': 'Sort'}, {'type': 'filter'}]
+        streaming_steps, blocking_steps = metl.split_transform_sequence(sequence)
+        assert streaming_steps == sequence[:2]
+        assert blocking_steps == sequence[2:]
+        # A step can also be explicitly marked as blocking:
+        streaming_steps, blocking_steps = metl.split_transform_sequence([{'type': 'print', 'blocking': True}])
+        assert streaming_steps == [] and len(blocking_steps) == 1
+
+    # test the ETL pipeline in streaming mode:
+    @classmethod
+    def test_ETL010_run_pipeline_streaming(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(0, 5)})])
+            job_config = make_csv_job_config(tmp_dir, tmp_dir,
+                                             sequence=[{'type': 'sort', 'parameters': {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'id', 'sort_parameter_order': 'desc'}}}}],
+                                             execution={'mode': 'streaming', 'batch_size': 2})
+            assert metl.get_execution_mode(job_config) == ('streaming', 2)
+            assert metl.etleng_run_pipeline(job_config) == True
+
+    # test that a job run reports its summary and that fatal errors (sys.exit) are isolated:
+    @classmethod
+    def test_ETL011_run_job_summary(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(0, 5)})])
+            with open(os.path.join(tmp_dir, 'job.yml'), 'w') as job_file:
+                yaml.dump({k: v for k, v in make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming'}).items() if k != 'paths'}, job_file)
+            summary = metl.etleng_run_job('job.yml', tmp_dir, tmp_dir, tmp_dir, tmp_dir)
+            assert summary['status'] == 'ok'
+            assert summary['rows_in'] == 5
+            # A missing job file makes read_config_file call sys.exit(1):
+            summary = metl.etleng_run_job('missing.yml', tmp_dir, tmp_dir, tmp_dir, tmp_dir)
+            assert summary['status'] == 'failed'
+            assert summary['wall_time'] >= 0
+
+    # test that a job is compiled once into an execution plan that can be executed many times:
+    @classmethod
+    def test_ETL012_compile_pipeline(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(0, 5)})])
+            with open(os.path.join(tmp_dir, 'mapping.dsl'), 'w') as dsl_file:
+                dsl_file.write("{\n    'fullName': S('customer', 'first_name') + K(' ') + S('customer', 'last_name'),\n}\n")
+            # The DSL template is parsed at compile time, so the step can run many times:
+            step = metl.compile_step({}, tmp_dir, 'dsl', {'type': 'dsl', 'template_path': tmp_dir, 'template': 'mapping.dsl'})
+            data_object = {'customer': {'first_name': 'Giovanni', 'last_name': 'Montoya'}}
+            for _ in range(0, 2):
+                assert step(data_object) == {'fullName': 'Giovanni Montoya'}
+            # And a compiled plan can be executed many times:
+            sequence = [{'step': 'show', 'type': 'print'}]
+            plan = metl.etleng_compile_pipeline(make_csv_job_config(tmp_dir, os.path.join(tmp_dir, 'out'), sequence=sequence, execution={'mode': 'streaming'}))
+            assert plan['mode'] == 'streaming'
+            assert [step['name'] for step in plan['steps']] == ['show']
+            for _ in range(0, 2):
+                assert metl.etleng_run_plan(plan) == True
+                assert plan['config']['run_stats']['rows_in'] == 5
+
+    # test that actions parameters keep their types when rendered:
+    @classmethod
+    def test_ETL013_process_config_parameters(cls):
+        os.environ['MICROETL_TEST_LIMIT'] = '10'
+        parameters = {'limit_parameters': {'limit_parameter': {'limit_parameter_value': '{{ MICROETL_TEST_LIMIT }}', 'enabled': None, 'keys': ['a', 1]}}}
+        processed = metl.process_config_parameters({}, None, 'limit', parameters)
+        assert processed == {'limit_parameters': {'limit_parameter': {'limit_parameter_value': 10, 'enabled': None, 'keys': ['a', 1]}}}
+        # Only a single expression that renders to a number is converted, all the other values stay strings:
+        variables = {'yes_no': 'no', 'on_off': 'ON', 'day': '2024-03-01', 'code': '007', 'pair': 'a: b', 'comment': '#x', 'ratio': '0.5', 'count': '3'}
+        rendered = metl.render_config_parameters({key: '{{ ' + key + ' }}' for key in variables}, variables)
+        assert rendered == {'yes_no': 'no', 'on_off': 'ON', 'day': '2024-03-01', 'code': '007', 'pair': 'a: b', 'comment': '#x', 'ratio': 0.5, 'count': 3}
+        assert metl.render_config_parameters(['{{ code | int }}', 'limit {{ count }}', '{{ count }}{{ count }}', '{{ day }}'], variables) == [7, 'limit 3', '33', '2024-03-01']
+
+    # test that filter predicates (and groups of predicates) are combined in a single mask:
+    @classmethod
+    def test_ETL014_filter_data_fused(cls):
+        data = pd.DataFrame({'amount': [5, 15, 25, 35], 'country': ['IT', 'UK', 'IT', 'FR'], 'name': ['alpha', 'beta', 'gamma', 'delta']})
+        parameters = {
+            'filter_parameters': {
+                'min_amount': {'filter_parameter_name': 'amount', 'filter_parameter_operator': 'gt', 'filter_parameter_value': 10},
+                'country_or_name': {
+                    'filter_logic': 'or',
+                    'filter_parameters': {
+                        'country': {'filter_parameter_name': 'country', 'filter_parameter_operator': 'eq', 'filter_parameter_value': 'IT'},
+                        'name': {'filter_parameter_name': 'name', 'filter_parameter_operator': 'startswith', 'filter_parameter_value': 'd'},
+                    },
+                },
+            },
+        }
+        saved_numexpr = metl.numexpr
+        try:
+            # Fused with DataFrame.eval (when numexpr is available) and with plain numpy masks:
+            for numexpr_module in [saved_numexpr, None]:
+                metl.numexpr = numexpr_module
+                filtered = metl.filter_data(data, parameters)
+                assert list(filtered['name']) == ['gamma', 'delta']
+        finally:
+            metl.numexpr = saved_numexpr
+        # Predicates can be OR-ed and combined with an expression:
+        filtered = metl.filter_data(data, {'filter_logic': 'or', 'filter_parameters': [
+                                                {'filter_parameter_name': 'amount', 'filter_parameter_operator': 'lt', 'filter_parameter_value': 10},
+                                                {'filter_parameter_name': 'country', 'filter_parameter_operator': 'in', 'filter_parameter_value': ['FR']}],
+                                           'filter_expression': 'amount != 35'})
+        assert list(filtered['name']) == ['alpha']
+        # Invalid operators are reported:
+        assert metl.filter_data(data, {'filter_parameters': [{'filter_parameter_name': 'amount', 'filter_parameter_operator': 'xx', 'filter_parameter_value': 1}]}) is None
+
+    # test that several aggregations (on several columns) are computed in a single aggregate step:
+    @classmethod
+    def test_ETL015_aggregate_data_multi_metric(cls):
+        data = pd.DataFrame({'country': ['IT', 'UK', 'IT', 'FR', 'IT'], 'city': ['Rome', 'London', 'Rome', 'Paris', 'Milan'],
+                             'amount': [10, 20, 30, 40, 50], 'qty': [1, 2, 3, 4, 5]})
+        parameters = {
+            'aggregate_parameters': {
+                'aggregate_group_by': ['country', 'city'],
+                'aggregate_categorical': True,
+                'aggregations': [
+                    {'aggregate_parameter_name': 'amount', 'aggregate_parameter_function': ['sum', 'max']},
+                    {'aggregate_parameter_name': 'qty', 'aggregate_parameter_function': 'mean', 'aggregate_output_name': 'avg_qty'},
+                    {'aggregate_parameter_function': 'size', 'aggregate_output_name': 'records'},
+                ],
+            },
+        }
+        aggregated = metl.aggregate_data(data, parameters)
+        assert list(aggregated.columns) == ['country', 'city', 'amount_sum', 'amount_max', 'avg_qty', 'records']
+        # observed=True: only the (country, city) combinations found in the data are returned
+        assert len(aggregated) == 4
+        rome = aggregated[(aggregated['country'] == 'IT') & (aggregated['city'] == 'Rome')].iloc[0]
+        assert rome['amount_sum'] == 40 and rome['amount_max'] == 30 and rome['avg_qty'] == 2 and rome['records'] == 2
+        # The legacy (single aggregate_parameter) form still works:
+        legacy = metl.aggregate_data(data, {'aggregate_parameters': {'aggregate_parameter': {
+                    'aggregate_parameter_name': 'amount', 'aggregate_parameter_function': 'sum', 'aggregate_parameter_group_by': 'country'}}})
+        assert list(legacy.columns) == ['country', 'amount'] and list(legacy['amount']) == [40, 90, 20]
+        # Invalid functions are reported:
+        assert metl.aggregate_data(data, {'aggregate_parameters': {'aggregate_group_by': 'country', 'aggregations': [
+                    {'aggregate_parameter_name': 'amount', 'aggregate_parameter_function': 'xx'}]}}) is None
+
+    # test multi-key stable sorts, top-N sorts and the sort + limit fusion:
+    @classmethod
+    def test_ETL016_sort_data_top_n(cls):
+        data = pd.DataFrame({'amount': [5.0, 15.0, np.nan, 15.0, 35.0, 15.0, 1.0], 'name': ['a', 'b', 'c', 'd', 'e', 'f', 'g'],
+                             'country': ['IT', 'UK', 'IT', 'FR', 'IT', 'FR', 'UK']})
+        sort_keys = [{'sort_parameter_name': 'amount', 'sort_parameter_order': 'desc'}, {'sort_parameter_name': 'country', 'sort_parameter_order': 'asc'}]
+        full_sort = metl.sort_data(data, {'sort_parameters': {'sort_keys': sort_keys}})
+        assert list(full_sort['name']) == ['e', 'd', 'f', 'b', 'a', 'g', 'c']
+        # Top-N returns the same rows as a full sort followed by head (ties and missing values included):
+        for top_n in [0, 1, 2, 3, 6, 7, 10]:
+            top = metl.sort_data(data, {'sort_parameters': {'sort_keys': sort_keys, 'sort_top_n': top_n}})
+            assert list(top['name']) == list(full_sort['name'])[:top_n]
+        # Ascending top-N on a single key is stable:
+        top = metl.sort_data(data, {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'amount', 'sort_parameter_order': 'asc'}, 'sort_top_n': 4}})
+        assert list(top['name']) == ['g', 'a', 'b', 'd']
+        # A sort step followed by a limit step is compiled into a single top-N sort step:
+        sequence = [{'type': 'sort', 'parameters': {'sort_parameters': {'sort_keys': sort_keys}}},
+                    {'type': 'limit', 'parameters': {'limit_parameters': {'limit_parameter': {'limit_parameter_value': 2}}}}]
+        steps = metl.compile_transform_sequence({}, sequence)
+        assert [step['type'] for step in steps] == ['sort']
+        assert 'sort_top_n' not in sequence[0]['parameters']['sort_parameters']
+        assert list(metl.run_compiled_steps(steps, data)['name']) == ['e', 'd']
+        # A limit step on its own is a valid action:
+        steps = metl.compile_transform_sequence({}, sequence[1:])
+        assert len(metl.run_compiled_steps(steps, data)) == 2
+
+    # test joins with another datasource (broadcast, partitioned and spilled to disk):
+    @classmethod
+    def test_ETL017_join_data_datasource(cls):
+        facts = pd.DataFrame({'cid': [3, 1, 4, 2, 1], 'amount': [10, 20, 30, 40, 50]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'cid': [1, 2, 3, 5], 'cname': ['a', 'b', 'c', 'e']})])
+            saved_tmp_path = metl.tmp_path
+            metl.tmp_path = os.path.join(tmp_dir, 'tmp_data')
+            try:
+                for strategy, memory_budget in [('broadcast', '1GB'), ('partitioned', '1GB'), ('auto', 1)]:
+                    join_parameters = {'join_datasource': {'type': 'csv'}, 'join_inp_path': tmp_dir, 'join_keys': 'cid', 'join_how': 'left',
+                                       'join_strategy': strategy, 'join_memory_budget': memory_budget, 'join_partitions': 3, 'join_batch_size': 2}
+                    steps = metl.compile_transform_sequence(make_csv_job_config(tmp_dir, tmp_dir), [{'type': 'join', 'parameters': {'join_parameters': join_parameters}}])
+                    joined = metl.run_compiled_steps(steps, facts)
+                    assert list(joined['amount']) == [10, 20, 30, 40, 50]
+                    assert list(joined['cname'].fillna('-')) == ['c', 'a', '-', 'b', 'a']
+                    # Outer joins add the records of the other datasource with no match (last):
+                    joined = metl.join_data(facts, {'join_parameters': dict(join_parameters, join_how='outer')}, make_csv_job_config(tmp_dir, tmp_dir))
+                    assert list(joined['cid']) == [3, 1, 4, 2, 1, 5]
+                # Spilled partitions are read only for the batches that have records in them, and kept in memory:
+                join_parameters = dict(join_parameters, join_how='left', join_strategy='auto', join_memory_budget=1)
+                steps = metl.compile_transform_sequence(make_csv_job_config(tmp_dir, tmp_dir), [{'type': 'join', 'parameters': {'join_parameters': join_parameters}}])
+                with mock.patch.object(metl.pd, 'read_pickle', wraps=metl.pd.read_pickle) as read_pickle:
+                    joined = metl.run_compiled_steps(steps, facts[facts['cid'] == 1])
+                    reads = read_pickle.call_count
+                    for _ in range(0, 3):
+                        joined = metl.run_compiled_steps(steps, facts[facts['cid'] == 1])
+                    assert list(joined['cname']) == ['a', 'a'] and 0 < reads and read_pickle.call_count == reads
+                assert metl.is_blocking_step({'type': 'join', 'parameters': {'join_parameters': {'join_how': 'outer'}}})
+                assert not metl.is_blocking_step({'type': 'join', 'parameters': {'join_parameters': {'join_how': 'inner'}}})
+            finally:
+                metl.tmp_path = saved_tmp_path
+
+    # test the Arrow backed data types (pyarrow dtype backend):
+    @classmethod
+    def test_ETL018_arrow_dtype_backend(cls):
+        if metl.pa is None:
+            raise unittest.SkipTest("pyarrow is not installed")
+        records = [{'id': 1, 'name': 'alpha', 'amount': 1.5}, {'id': 2, 'name': 'beta', 'amount': None}]
+        data = metl.apply_dtype_backend(records, 'pyarrow')
+        assert all(isinstance(dtype, pd.ArrowDtype) for dtype in data.dtypes)
+        assert metl.to_arrow_table(data).column('name').to_pylist() == ['alpha', 'beta']
+        assert metl.apply_dtype_backend(metl.to_arrow_table(data), 'numpy')['id'].dtype == np.int64
+        from microetl.dbconn import utilities as dbutils
+        table = dbutils.rows_to_arrow_table([(1, 'alpha'), (2, None)], ['id', 'name'])
+        assert table.num_rows == 2 and table.column('name').null_count == 1
+        assert metl.count_records(table) == 2 and [batch.num_rows for batch in metl.iter_data_batches(table, 1)] == [1, 1]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(0, 5), 'name': ['a', 'b', 'c', 'd', 'e']})])
+            sequence = [{'type': 'filter', 'parameters': {'filter_parameters': [{'filter_parameter_name': 'id', 'filter_parameter_operator': 'ge', 'filter_parameter_value': 1}]}},
+                        {'type': 'aggregate', 'parameters': {'aggregate_parameters': {'aggregate_group_by': 'name', 'aggregations': [
+                            {'aggregate_parameter_name': 'id', 'aggregate_parameter_function': 'sum'}]}}}]
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, sequence=sequence, execution={'mode': 'streaming', 'batch_size': 2, 'dtype_backend': 'pyarrow'})
+            batches = list(metl.read_data_batches_from_ds(job_config, 'csv', 'source', 2))
+            assert isinstance(batches[0]['name'].dtype, pd.ArrowDtype)
+            plan = metl.etleng_compile_pipeline(job_config)
+            assert plan['dtype_backend'] == 'pyarrow'
+            assert metl.etleng_run_plan(plan) == True
+            assert job_config['run_stats']['rows_in'] == 5 and job_config['run_stats']['rows_out'] == 4
+            # DataFrames are written to JSON files without converting them to dictionaries first:
+            json_file = os.path.join(tmp_dir, 'data.json')
+            metl.write_data_to_json(batches[0], json_file)
+            assert metl.load_json_from_file(json_file) == [{'id': 0, 'name': 'a'}, {'id': 1, 'name': 'b'}]
+
+    # test the profiling report of a pipeline run:
+    @classmethod
+    def test_ETL019_profile_report(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(0, 5)}), pd.DataFrame({'id': range(5, 8)})])
+            sequence = [{'step': 'keep some', 'type': 'filter', 'parameters': {'filter_parameters': [{'filter_parameter_name': 'id', 'filter_parameter_operator': 'lt', 'filter_parameter_value': 6}]}},
+                        {'step': 'sort them', 'type': 'sort', 'parameters': {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'id', 'sort_parameter_order': 'desc'}}}}]
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, sequence=sequence,
+                                             execution={'mode': 'streaming', 'batch_size': 2, 'profile': True, 'profile_path': os.path.join(tmp_dir, 'profiles')})
+            assert metl.etleng_run_pipeline(job_config) == True
+            report = job_config['run_profile']
+            assert report['status'] == 'ok' and report['wall_time'] >= report['steps'][0]['wall_time']
+            steps = {step['name']: step for step in report['steps']}
+            assert steps['source']['calls'] == 5 and steps['source']['rows_out'] == 8
+            assert steps['keep some']['calls'] == 5 and steps['keep some']['rows_in'] == 8 and steps['keep some']['rows_out'] == 6
+            assert steps['sort them']['calls'] == 1 and steps['sort them']['rows_out'] == 6
+            with open(job_config['run_profile_report']) as report_file:
+                assert json.load(report_file)['steps'] == report['steps']
+            assert 'keep some' in metl.prof.format_profile_table(report)
+            # Unnamed steps of the same type have their own records:
+            sequence = [{'type': 'filter', 'parameters': {'filter_parameters': [{'filter_parameter_name': 'id', 'filter_parameter_operator': 'lt', 'filter_parameter_value': 6}]}},
+                        {'type': 'filter', 'parameters': {'filter_parameters': [{'filter_parameter_name': 'id', 'filter_parameter_operator': 'ge', 'filter_parameter_value': 2}]}}]
+            inp_dir = os.path.join(tmp_dir, 'inp')
+            os.makedirs(inp_dir)
+            write_csv_files(inp_dir, [pd.DataFrame({'id': range(0, 5)}), pd.DataFrame({'id': range(5, 8)})])
+            job_config = make_csv_job_config(inp_dir, tmp_dir, sequence=sequence,
+                                             execution={'mode': 'streaming', 'batch_size': 2, 'profile': True, 'profile_path': os.path.join(tmp_dir, 'profiles')})
+            assert metl.etleng_run_pipeline(job_config) == True
+            steps = [(step['id'], step['calls'], step['rows_in'], step['rows_out']) for step in job_config['run_profile']['steps'] if step['kind'] == 'transform']
+            assert steps == [('1:filter', 5, 8, 6), ('2:filter', 5, 6, 4)]
+
+    # test that CSV files are discovered with patterns, read concurrently and concatenated once:
+    @classmethod
+    def test_ETL020_read_csv_files_parallel(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(i * 3, i * 3 + 3), 'name': ['x'] * 3, 'skip': [0.5] * 3}) for i in range(0, 4)])
+            pd.DataFrame({'id': [99], 'name': ['y'], 'skip': [0]}).to_csv(os.path.join(tmp_dir, 'other.csv'), index=False)
+            os.makedirs(os.path.join(tmp_dir, 'sub'))
+            pd.DataFrame({'id': [100], 'name': ['z'], 'skip': [0]}).to_csv(os.path.join(tmp_dir, 'sub', 'data_100.csv'), index=False)
+            job_config = make_csv_job_config(tmp_dir, tmp_dir)
+            for executor in ['thread', 'process']:
+                job_config['datasources']['source'] = {'type': 'csv', 'files': {'include': 'data_*.csv', 'exclude': ['data_002.csv'], 'workers': 3, 'executor': executor},
+                                                       'read_options': {'usecols': ['id', 'name'], 'dtype': {'id': 'int32'}}}
+                data = metl.read_data_from_ds(job_config, 'csv', 'source')
+                assert list(data.columns) == ['id', 'name'] and data['id'].dtype == np.int32
+                assert list(data['id']) == [0, 1, 2, 3, 4, 5, 9, 10, 11]
+            # Sub-directories are scanned only when recursive:
+            job_config['datasources']['source']['files']['recursive'] = True
+            assert list(metl.read_data_from_ds(job_config, 'csv', 'source')['id'])[-1] == 100
+            # In streaming mode, the files are streamed one after the other:
+            batches = list(metl.read_data_batches_from_ds(job_config, 'csv', 'source', 2))
+            assert [len(batch) for batch in batches] == [2, 1, 2, 1, 2, 1, 1]
+            # Batch mode reads all the files:
+            job_config['datasources']['source'] = {'type': 'csv'}
+            assert len(metl.read_data_from_ds(job_config, 'csv', 'source')) == 13
+
+    # test the Parquet and Feather datasources, with column and row group pruning:
+    @classmethod
+    def test_ETL021_columnar_datasources(cls):
+        if metl.pa is None:
+            raise unittest.SkipTest("pyarrow is not installed")
+        data = pd.DataFrame({'id': range(0, 100), 'country': ['IT', 'UK', 'FR', 'DE'] * 25, 'amount': [float(i) for i in range(0, 100)], 'notes': ['n'] * 100})
+        sequence = [{'type': 'filter', 'parameters': {'filter_parameters': [{'filter_parameter_name': 'id', 'filter_parameter_operator': 'ge', 'filter_parameter_value': 60},
+                                                                            {'filter_parameter_name': 'country', 'filter_parameter_operator': 'ne', 'filter_parameter_value': 'DE'}]}},
+                    {'type': 'aggregate', 'parameters': {'aggregate_parameters': {'aggregate_group_by': 'country', 'aggregations': [
+                        {'aggregate_parameter_name': 'amount', 'aggregate_parameter_function': 'sum'}]}}}]
+        for ds_type in ['parquet', 'feather']:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                job_config = make_csv_job_config(tmp_dir, tmp_dir, sequence=sequence)
+                job_config['datasources']['destination'] = {'type': ds_type, 'file_name': 'sales.' + ds_type, 'write_options': {'compression': 'zstd', 'row_group_size': 10}}
+                filename = metl.write_data_to_ds(job_config, None, data, {})
+                assert os.path.basename(filename) == 'sales.' + ds_type
+                if ds_type == 'parquet':
+                    assert metl.fio.pq.ParquetFile(filename).metadata.num_row_groups == 10
+                # Only the columns used by the sequence are read, and only the rows of the leading filter steps:
+                job_config['datasources']['source'] = {'type': ds_type}
+                pushdown = metl.get_source_pushdown(job_config)
+                assert pushdown == {'columns': ['id', 'country', 'amount'], 'filters': [('id', '>=', 60)]}
+                source_data = metl.read_data_from_ds(job_config, ds_type, 'source')
+                assert list(source_data.columns) == ['id', 'country', 'amount'] and len(source_data) == 40
+                batches = list(metl.read_data_batches_from_ds(job_config, ds_type, 'source', 15))
+                assert sum(len(batch) for batch in batches) == 40 and max(len(batch) for batch in batches) <= 15
+                aggregated = metl.run_compiled_steps(metl.compile_transform_sequence(job_config, sequence), source_data)
+                assert list(aggregated['amount_sum']) == [sum(range(62, 100, 4)), sum(range(60, 100, 4)), sum(range(61, 100, 4))]
+                # Filters that cannot be pushed down (e.g. a value of the wrong type) are applied by the filter step only:
+                pushdown['filters'] = [('id', '>=', 'x')]
+                assert metl.read_columnar_data([filename], ds_type, pushdown).num_rows == 100
+                assert sum(chunk.num_rows for chunk in metl.iter_columnar_data([filename], ds_type, 15, pushdown)) == 100
+            # The same holds in streaming mode (e.g. a timestamp column filtered with a date string):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                dates = pd.DataFrame({'id': range(0, 100), 'day': pd.date_range('2024-01-01', periods=100, freq='D')})
+                job_config = make_csv_job_config(tmp_dir, tmp_dir, sequence=[{'type': 'filter', 'parameters': {'filter_parameters': {'filter_parameter': {
+                    'filter_parameter_name': 'day', 'filter_parameter_operator': 'ge', 'filter_parameter_value': '2024-03-01'}}}}])
+                job_config['datasources']['destination'] = {'type': ds_type, 'file_name': 'days.' + ds_type}
+                metl.write_data_to_ds(job_config, None, dates, {})
+                job_config['datasources']['source'] = {'type': ds_type}
+                job_config['datasources']['destination'] = {'type': 'csv', 'file_name': 'out.csv'}
+                for mode in ['batch', 'streaming']:
+                    job_config['execution'] = {'mode': mode, 'batch_size': 15}
+                    assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+                    assert job_config['run_stats']['rows_out'] == 100 - 60
+
+    # test the raw file datasource read modes (text, mmap and lines):
+    @classmethod
+    def test_ETL022_raw_file_read_modes(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for idx, content in enumerate(['a1\na2\n', '', 'c1\nc2\nc3']):
+                with open(os.path.join(tmp_dir, 'part_' + str(idx) + '.txt'), 'w') as file:
+                    file.write(content)
+            os.makedirs(os.path.join(tmp_dir, 'sub'))
+            job_config = make_csv_job_config(tmp_dir, tmp_dir)
+            job_config['datasources']['source'] = {'type': 'file'}
+            # Sub-directories are skipped and the files are read in name order:
+            assert metl.read_data_from_ds(job_config, 'file', 'source') == 'a1\na2\nc1\nc2\nc3'
+            job_config['datasources']['source']['read_options'] = {'read_mode': 'mmap'}
+            buffers = metl.read_data_from_ds(job_config, 'file', 'source')
+            assert [bytes(buffer[:]) for buffer in buffers] == [b'a1\na2\n', b'', b'c1\nc2\nc3']
+            assert buffers[2].find(b'c2') == 3
+            buffers[0].close()
+            buffers[2].close()
+            job_config['datasources']['source']['read_options'] = {'read_mode': 'lines'}
+            lines = metl.read_data_from_ds(job_config, 'file', 'source')
+            assert not isinstance(lines, list) and list(lines) == ['a1', 'a2', 'c1', 'c2', 'c3']
+            batches = list(metl.read_data_batches_from_ds(job_config, 'file', 'source', 2))
+            assert batches == [['a1', 'a2'], ['c1', 'c2'], ['c3']]
+            job_config['datasources']['source']['read_options'] = {'read_mode': 'bytes'}
+            try:
+                metl.get_file_read_mode(job_config['datasources']['source']['read_options'])
+                assert False, "invalid read modes must be rejected"
+            except ValueError:
+                pass
+
+    # test the JSON Lines reader and the JSON path streaming of large JSON documents:
+    @classmethod
+    def test_ETL023_json_streaming(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'events_0.ndjson'), 'w') as file:
+                file.write('\n'.join(json.dumps({'id': i, 'kind': 'a' if i % 2 else 'b'}) for i in range(0, 7)) + '\n\n')
+            with open(os.path.join(tmp_dir, 'events_1.jsonl'), 'w') as file:
+                file.write('{"id": 7, "kind": "c", "extra": 1.5}\n')
+            job_config = make_csv_job_config(tmp_dir, tmp_dir)
+            job_config['datasources']['source'] = {'type': 'ndjson', 'read_options': {'chunk_size': 3}}
+            data = metl.read_data_from_ds(job_config, 'ndjson', 'source')
+            assert list(data['id']) == list(range(0, 8)) and list(data.columns) == ['id', 'kind', 'extra']
+            batches = list(metl.read_data_batches_from_ds(job_config, 'ndjson', 'source', 3))
+            assert [len(batch) for batch in batches] == [3, 3, 1, 1]
+            for parser in ['json', 'orjson']:
+                if parser == 'orjson' and metl.fio.orjson is None:
+                    continue
+                records = list(metl.fio.iter_ndjson_records([os.path.join(tmp_dir, 'events_1.jsonl')], 10, parser))
+                assert records == [[{'id': 7, 'kind': 'c', 'extra': 1.5}]]
+            # The items of a JSON document are streamed from a JSON path:
+            document = {'meta': {'count': 5}, 'data': [{'id': i, 'tags': ['t' + str(i)]} for i in range(0, 5)]}
+            with open(os.path.join(tmp_dir, 'export.json'), 'w') as file:
+                json.dump(document, file)
+            job_config['datasources']['source'] = {'type': 'json', 'read_options': {'json_path': '$.data[*]'}}
+            batches = list(metl.read_data_batches_from_ds(job_config, 'json', 'source', 2))
+            assert [list(batch['id']) for batch in batches] == [[0, 1], [2, 3], [4]]
+            assert list(metl.read_data_from_ds(job_config, 'json', 'source')['tags'])[4] == ['t4']
+            assert list(metl.fio.walk_json_path(document, metl.fio.parse_json_path("$['data'][*].tags[*]"))) == ['t0', 't1', 't2', 't3', 't4']
+            for json_path in ['data[*]', '$.data', '$..data[*]']:
+                try:
+                    metl.fio.parse_json_path(json_path)
+                    assert False, "invalid JSON paths must be rejected"
+                except ValueError:
+                    pass
+
+    # test the on-disk cache of the parsed files (used by the Excel datasource):
+    @classmethod
+    def test_ETL024_parsed_file_cache(cls):
+        if metl.pa is None:
+            raise unittest.SkipTest("pyarrow is not installed")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': range(0, 1000), 'name': ['n' + str(i) for i in range(0, 1000)]})])
+            filename = os.path.join(tmp_dir, 'data_000.csv')
+            job_config = make_csv_job_config(tmp_dir, tmp_dir)
+            assert metl.get_file_cache_settings(job_config, 'source') is None
+            job_config['datasources']['source'] = {'type': 'excel', 'cache': {'max_size': '1MB'}}
+            cache = metl.get_file_cache_settings(job_config, 'source')
+            assert cache == {'path': os.path.join(tmp_dir, '.cache'), 'max_size': 1024 ** 2}
+            calls = []
+            def reader(name):
+                calls.append(name)
+                return pd.read_csv(name)
+            first = metl.fio.read_cached_file(filename, reader, {'usecols': None}, cache)
+            second = metl.fio.read_cached_file(filename, reader, {'usecols': None}, cache)
+            assert len(calls) == 1 and second.equals(first)
+            # Different options, or a changed file, are new cache entries:
+            metl.fio.read_cached_file(filename, reader, {'usecols': ['id']}, cache)
+            assert len(calls) == 2
+            os.utime(filename, ns=(0, 0))
+            metl.fio.read_cached_file(filename, reader, {'usecols': None}, cache)
+            assert len(calls) == 3 and len(os.listdir(cache['path'])) == 3
+            # The least recently used entries are evicted first:
+            entries = sorted(os.listdir(cache['path']), key=lambda name: os.stat(os.path.join(cache['path'], name)).st_mtime_ns)
+            entry_size = os.path.getsize(os.path.join(cache['path'], entries[-1]))
+            removed = metl.fio.evict_cache_entries(cache['path'], entry_size)
+            assert [os.path.basename(name) for name in removed] == entries[:-1]
+            assert os.listdir(cache['path']) == entries[-1:]
+
+    # test the incremental ingestion of the files (processed-files manifest):
+    @classmethod
+    def test_ETL025_incremental_ingestion(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inp_dir = os.path.join(tmp_dir, 'inp')
+            os.makedirs(inp_dir)
+            write_csv_files(inp_dir, [pd.DataFrame({'id': [1, 2]}), pd.DataFrame({'id': [3]})])
+            job_config = make_csv_job_config(inp_dir, tmp_dir)
+            job_config['paths']['base_path'] = tmp_dir
+            job_config['job_name'] = 'incremental.yaml'
+            job_config['datasources']['source']['incremental'] = {'hash': 'sha256'}
+            plan = metl.etleng_compile_pipeline(job_config)
+            assert metl.etleng_run_plan(plan) and job_config['run_stats']['rows_in'] == 2 + 1
+            manifest_file = os.path.join(tmp_dir, 'state', 'incremental.source.manifest.json')
+            assert len(metl.mnf.load_manifest(manifest_file)['files']) == 2
+            # Nothing changed, so no file is read:
+            assert metl.etleng_run_plan(plan) and job_config['run_stats']['rows_in'] == 0
+            # Only the new and changed files are read (a touched file with the same content is not):
+            write_csv_files(inp_dir, [pd.DataFrame({'id': [1, 2, 4]})])
+            pd.DataFrame({'id': [5, 6]}).to_csv(os.path.join(inp_dir, 'new.csv'), index=False)
+            os.utime(os.path.join(inp_dir, 'data_001.csv'), ns=(0, 0))
+            # A failed run does not commit the manifest:
+            failing_plan = metl.etleng_compile_pipeline(dict(job_config, actions={'source': {'name': 'read'}, 'transform': {'sequence': [
+                {'type': 'sort', 'parameters': {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'missing'}}}}]}}))
+            assert not metl.etleng_run_plan(failing_plan)
+            assert metl.etleng_run_plan(plan) and job_config['run_stats']['rows_in'] == 3 + 2
+            assert metl.etleng_run_plan(plan) and job_config['run_stats']['rows_in'] == 0
+            # A job with transforms succeeds when there are no new files, and does not replace its output:
+            filter_job = dict(job_config, job_name='filtered.yaml', actions={'source': {'name': 'read'}, 'transform': {'sequence': [
+                {'type': 'filter', 'parameters': {'filter_parameters': {'filter_parameter': {'filter_parameter_name': 'id', 'filter_parameter_operator': 'gt', 'filter_parameter_value': 1}}}}]}})
+            filter_job['datasources'] = dict(job_config['datasources'], destination={'type': 'csv', 'file_name': 'filtered.csv'})
+            filter_plan = metl.etleng_compile_pipeline(filter_job)
+            assert metl.etleng_run_plan(filter_plan) and filter_job['run_stats']['rows_out'] == 5
+            assert metl.etleng_run_plan(filter_plan) and filter_job['run_stats'] == {'rows_in': 0, 'rows_out': 0}
+            assert len(pd.read_csv(os.path.join(tmp_dir, 'filtered.csv'))) == 5
+
+    # test the compressed input and output files (gzip, bz2, xz and zstd):
+    @classmethod
+    def test_ETL026_compressed_files(cls):
+        codecs = {'gz': 'gzip', 'bz2': 'bz2', 'xz': 'xz'}
+        if metl.fio.zstandard is not None:
+            codecs['zst'] = 'zstd'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for idx, extension in enumerate(codecs):
+                with metl.fio.open_file(os.path.join(tmp_dir, 'part_' + str(idx) + '.csv.' + extension), 'wt') as file:
+                    file.write('id,name\n' + str(idx) + ',n' + str(idx) + '\n')
+                with metl.fio.open_file(os.path.join(tmp_dir, 'events_' + str(idx) + '.ndjson.' + extension), 'wb') as file:
+                    file.write(b'{"id": ' + str(idx).encode() + b'}\n')
+            # A compressed file without a known extension is detected from its content:
+            with metl.fio.open_file(os.path.join(tmp_dir, 'part_9.csv'), 'wt', compression='gzip') as file:
+                file.write('id,name\n9,n9\n')
+            assert metl.fio.get_compression(os.path.join(tmp_dir, 'part_9.csv')) == 'gzip'
+            assert metl.fio.get_compression(os.path.join(tmp_dir, 'part_0.csv.gz'), False) == 'gzip'
+            job_config = make_csv_job_config(tmp_dir, tmp_dir)
+            data = metl.read_data_from_ds(job_config, 'csv', 'source')
+            assert list(data['id']) == list(range(0, len(codecs))) + [9]
+            batches = list(metl.read_data_batches_from_ds(job_config, 'csv', 'source', 10))
+            assert sum(len(batch) for batch in batches) == len(codecs) + 1
+            job_config['datasources']['source'] = {'type': 'ndjson'}
+            assert list(metl.read_data_from_ds(job_config, 'ndjson', 'source')['id']) == list(range(0, len(codecs)))
+            job_config['datasources']['source'] = {'type': 'file', 'files': {'include': ['part_0.csv.gz']}, 'read_options': {'read_mode': 'lines'}}
+            assert list(metl.read_data_from_ds(job_config, 'file', 'source')) == ['id,name', '0,n0']
+            # Writers compress the files on the fly:
+            for extension, codec in codecs.items():
+                json_file = os.path.join(tmp_dir, 'out.json.' + extension)
+                metl.write_data_to_json(pd.DataFrame({'id': [1, 2]}), json_file)
+                os.rename(json_file, os.path.join(tmp_dir, 'out_' + extension))
+                json_file = os.path.join(tmp_dir, 'out_' + extension)
+                assert metl.fio.get_compression(json_file) == codec
+                with metl.fio.open_file(json_file, 'rt') as file:
+                    assert json.load(file) == [{'id': 1}, {'id': 2}]
+
+    # test the hive-style partitioned datasources, with partition pruning:
+    @classmethod
+    def test_ETL027_partitioned_datasources(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for dt in ['2026-09-30', '2026-10-01', '2026-10-02']:
+                for region in ['eu', 'us']:
+                    part_dir = os.path.join(tmp_dir, 'dt=' + dt, 'region=' + region)
+                    os.makedirs(part_dir)
+                    pd.DataFrame({'id': [1, 2], 'amount': [10.0, 20.0]}).to_csv(os.path.join(part_dir, 'part-0.csv'), index=False)
+            sequence = [{'type': 'filter', 'parameters': {'filter_parameters': [{'filter_parameter_name': 'dt', 'filter_parameter_operator': 'eq', 'filter_parameter_value': '2026-10-01'},
+                                                                                {'filter_parameter_name': 'region', 'filter_parameter_operator': 'in', 'filter_parameter_value': ['eu']}]}}]
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, sequence=sequence)
+            job_config['datasources']['source']['partitioning'] = 'hive'
+            files = metl.discover_datasource_files(job_config, 'source', tmp_dir, metl.fio.get_files_settings(job_config['datasources']['source'], 'csv'))
+            assert files == [os.path.join(tmp_dir, 'dt=2026-10-01', 'region=eu', 'part-0.csv')]
+            data = metl.read_data_from_ds(job_config, 'csv', 'source')
+            assert list(data.columns) == ['id', 'amount', 'dt', 'region'] and list(data['region']) == ['eu', 'eu']
+            # Without filters, every partition is read (in streaming mode too):
+            job_config['actions'].pop('transform')
+            batches = list(metl.read_data_batches_from_ds(job_config, 'csv', 'source', 10))
+            assert len(batches) == 6 and sorted(set(pd.concat(batches)['dt'])) == ['2026-09-30', '2026-10-01', '2026-10-02']
+            assert metl.fio.partition_matches({'n': '05'}, [('n', '>=', 5), ('m', '==', 1)])
+            assert not metl.fio.partition_matches({'dt': '2026-10-02'}, [('dt', '<', '2026-10-02')])
+            if metl.pa is None:
+                return
+            # Columnar files: partition keys are not read from the files, but added as columns:
+            for dt in ['2026-09-30', '2026-10-01']:
+                part_dir = os.path.join(tmp_dir, 'lake', 'dt=' + dt)
+                os.makedirs(part_dir)
+                metl.fio.pq.write_table(metl.pa.table({'id': [1, 2, 3], 'amount': [1.0, 2.0, 3.0]}), os.path.join(part_dir, 'part-0.parquet'))
+            job_config = make_csv_job_config(os.path.join(tmp_dir, 'lake'), tmp_dir, sequence=[
+                {'type': 'filter', 'parameters': {'filter_parameters': [{'filter_parameter_name': 'dt', 'filter_parameter_operator': 'ge', 'filter_parameter_value': '2026-10-01'},
+                                                                        {'filter_parameter_name': 'id', 'filter_parameter_operator': 'gt', 'filter_parameter_value': 1}]}}])
+            job_config['datasources']['source'] = {'type': 'parquet', 'partitioning': 'hive'}
+            data = metl.read_data_from_ds(job_config, 'parquet', 'source')
+            assert list(data['dt']) == ['2026-10-01', '2026-10-01'] and list(data['id']) == [2, 3]
+
+    # test the watch mode (polling of the landing directories and micro-batches):
+    @classmethod
+    def test_ETL028_watch_mode(cls):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            state = metl.wtc.new_watch_state(tmp_dir, ['*.csv'])
+            write_csv_files(tmp_dir, [pd.DataFrame({'id': [i]}) for i in range(0, 3)])
+            assert metl.wtc.poll_files(state, 0.0) == []
+            # Files are ready when they did not change between two polls:
+            assert len(metl.wtc.poll_files(state, 1.0)) == 3
+            assert metl.wtc.take_micro_batch(state, 1.0, 5, 10.0) == []
+            assert len(metl.wtc.take_micro_batch(state, 11.0, 2, 10.0)) == 2
+            batch = metl.wtc.take_micro_batch(state, 11.0, 2, 10.0)
+            assert batch == [os.path.join(tmp_dir, 'data_002.csv')]
+            metl.wtc.mark_processed(state, [os.path.join(tmp_dir, 'data_00' + str(i) + '.csv') for i in range(0, 3)])
+            assert metl.wtc.poll_files(state, 12.0) == [] and metl.wtc.poll_files(state, 13.0) == []
+            # A watched job runs on the new files only, with the plan compiled once:
+            cfg_dir = os.path.join(tmp_dir, 'jobs')
+            inp_dir = os.path.join(tmp_dir, 'inp')
+            os.makedirs(cfg_dir)
+            os.makedirs(inp_dir)
+            with open(os.path.join(cfg_dir, 'watched.yaml'), 'w') as job_file:
+                yaml.dump({'datasources': {'source': {'type': 'csv'}, 'destination': {'type': 'csv'}}, 'actions': {'source': {'name': 'read'}}}, job_file)
+            write_csv_files(inp_dir, [pd.DataFrame({'id': [i, i]}) for i in range(0, 3)])
+            out_dir = os.path.join(tmp_dir, 'out')
+            results = metl.etleng_watch_jobs(['watched.yaml'], tmp_dir, cfg_dir, inp_dir, out_dir, {'poll_interval': 0, 'batch_files': 2}, max_polls=3)
+            assert [(result['status'], result['files'], result['rows_in']) for result in results] == [('ok', 2, 4), ('ok', 1, 2)]
+            # Each micro-batch writes its own output file:
+            out_files = sorted(os.listdir(out_dir))
+            assert len(out_files) == 2 and all(filename.startswith('data_') and filename.endswith('.csv') for filename in out_files)
+            assert [len(pd.read_csv(os.path.join(out_dir, filename))) for filename in out_files] == [4, 2]
+            # The files of a failed micro-batch are pending again, retried after retry_delay and then given up:
+            with open(os.path.join(cfg_dir, 'failing.yaml'), 'w') as job_file:
+                yaml.dump({'datasources': {'source': {'type': 'csv'}, 'destination': {'type': 'csv'}}, 'actions': {'source': {'name': 'read'},
+                           'transform': {'sequence': [{'type': 'sort', 'parameters': {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'missing'}}}}]}}}, job_file)
+            watch_job = metl.etleng_prepare_watch_job('failing.yaml', tmp_dir, cfg_dir, inp_dir, out_dir)
+            state = watch_job['state']
+            metl.wtc.poll_files(state, 0.0)
+            metl.wtc.poll_files(state, 1.0)
+            files = metl.wtc.take_micro_batch(state, 1.0, 5, 10.0, True)
+            settings = {'max_retries': 1, 'retry_delay': 60.0}
+            assert len(files) == 3 and metl.etleng_run_micro_batch(watch_job, files, settings)['status'] == 'failed'
+            assert sorted(state['pending']) == files and state['processed'] == {} and all(retry[0] == 1 for retry in state['retries'].values())
+            metl.wtc.poll_files(state, time.monotonic())
+            assert metl.wtc.take_micro_batch(state, time.monotonic(), 5, 0.0, True) == []
+            assert metl.wtc.take_micro_batch(state, time.monotonic() + 61.0, 5, 0.0) == files
+            assert metl.etleng_run_micro_batch(watch_job, files, settings)['status'] == 'failed'
+            assert state['pending'] == {} and state['retries'] == {} and sorted(state['processed']) == files
+            metl.close_connection_pool(watch_job['config'])
+
+    # test the buffered, atomic file writers of the file destinations:
+    @classmethod
+    def test_ETL029_file_destinations(cls):
+        data = pd.DataFrame({'id': range(0, 10), 'name': ['n' + str(i) for i in range(0, 10)]})
+        formats = ['csv', 'ndjson'] + (['parquet', 'feather'] if metl.pa is not None else [])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            write_csv_files(tmp_dir, [data])
+            for file_format in formats:
+                for file_name in ['data.' + file_format, 'data.' + file_format + '.gz']:
+                    if file_format not in ['csv', 'ndjson'] and file_name.endswith('.gz'):
+                        continue
+                    # In streaming mode, each batch is written as soon as it is transformed:
+                    job_config = make_csv_job_config(tmp_dir, out_dir, execution={'mode': 'streaming', 'batch_size': 4, 'profile': True, 'profile_path': tmp_dir})
+                    job_config['datasources']['destination'] = {'type': file_format, 'file_name': file_name}
+                    assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+                    destination = [step for step in job_config['run_profile']['steps'] if step['kind'] == 'destination'][0]
+                    assert destination['calls'] == 3 and destination['rows_in'] == 10
+                    filename = job_config['run_stats']['output_file']
+                    assert filename == os.path.join(out_dir, file_name) and os.listdir(out_dir) == [file_name]
+                    if file_format == 'csv':
+                        written = pd.read_csv(filename)
+                    elif file_format == 'ndjson':
+                        written = pd.read_json(filename, lines=True)
+                    else:
+                        written = metl.read_columnar_data([filename], file_format, {'columns': None, 'filters': []}).to_pandas()
+                    assert written.equals(data)
+                    os.remove(filename)
+            # A failed run leaves neither the destination file nor its temporary file:
+            job_config = make_csv_job_config(tmp_dir, out_dir, sequence=[{'type': 'sort', 'parameters': {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'missing'}}}}])
+            job_config['datasources']['destination'] = {'type': 'csv', 'file_name': '{job}_{timestamp}.csv'}
+            assert not metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            assert os.listdir(out_dir) == []
+            writer = metl.fio.open_writer(os.path.join(out_dir, 'partial.csv'), 'csv')
+            metl.fio.write_batch(writer, data)
+            assert metl.fio.close_writer(writer, False) is None and os.listdir(out_dir) == []
+            assert os.path.basename(metl.get_destination_file(job_config)).startswith('job_')
+            # All the other braces of the file name are kept:
+            job_config['datasources']['destination']['file_name'] = '{job}_{0}_{other}_{.csv'
+            assert os.path.basename(metl.get_destination_file(job_config)) == 'job_{0}_{other}_{.csv'
+            # A write step writes to the destination of the run (which then writes nothing at the end):
+            for mode in ['batch', 'streaming']:
+                job_config = make_csv_job_config(tmp_dir, out_dir, sequence=[{'type': 'write'}, {'type': 'print'}], execution={'mode': mode, 'batch_size': 4})
+                job_config['datasources']['destination'] = {'type': 'csv', 'file_name': 'written.csv'}
+                with mock.patch('builtins.print'):
+                    assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+                assert job_config['run_stats']['rows_written'] == 10 and pd.read_csv(os.path.join(out_dir, 'written.csv')).equals(data)
+                assert os.listdir(out_dir) == ['written.csv']
+            # Writers of the same file use their own temporary files:
+            writers = [metl.fio.open_writer(os.path.join(out_dir, 'written.csv'), 'csv') for _ in range(0, 2)]
+            assert writers[0]['tmp_filename'] != writers[1]['tmp_filename']
+            for writer in writers:
+                metl.fio.close_writer(writer, False)
+
+    # test the Postgres COPY destination (with a stubbed connection):
+    @classmethod
+    def test_ETL030_postgres_copy_destination(cls):
+        data = pd.DataFrame({'id': range(0, 10), 'name': ['n' + str(i) for i in range(0, 9)] + [None]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [data])
+            # In streaming mode, every batch is copied but the load is committed once:
+            conn = FakeDBConnection()
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming', 'batch_size': 4})
+            job_config['datasources']['destination'] = {'db_type': 'postgres', 'table': 'public.items', 'write_options': {'batch_size': 3, 'staging': True}}
+            job_config['connection_pool'] = {'destination': conn}
+            assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            assert job_config['run_stats']['rows_loaded'] == 10 and job_config['run_stats']['output_table'] == 'public.items'
+            assert len(conn.copies) == 5 and conn.commits == 1 and conn.rollbacks == 0
+            # Staging table created, copied into the target table and dropped:
+            assert len(conn.statements) == 3
+            copied = pd.read_csv(io.BytesIO(b''.join(payload for _, payload in conn.copies)), header=None, names=['id', 'name'], na_values=['\\N'])
+            assert copied['id'].tolist() == list(range(0, 10)) and pd.isna(copied['name'].iloc[-1])
+            # A failed run rolls the load back:
+            conn = FakeDBConnection()
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, sequence=[{'type': 'sort', 'parameters': {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'missing'}}}}],
+                                             execution={'mode': 'streaming', 'batch_size': 4})
+            job_config['datasources']['destination'] = {'db_type': 'postgres', 'table': 'items'}
+            job_config['connection_pool'] = {'destination': conn}
+            assert not metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            assert conn.commits == 0 and conn.rollbacks == 1
+        # Binary COPY, encoded according to the types of the target table:
+        conn = FakeDBConnection([('id', 'bigint'), ('name', 'text')])
+        loader = metl.dbc.open_db_loader(conn, 'postgres', 'items', {'format': 'binary'})
+        assert metl.dbc.load_db_batch(loader, data.iloc[8:]) == 2
+        assert metl.dbc.close_db_loader(loader) == 2 and conn.commits == 1
+        payload = conn.copies[0][1]
+        assert payload.startswith(b'PGCOPY\n\xff\r\n\x00') and payload.endswith(b'\xff\xff')
+        assert payload[19:] == b'\x00\x02\x00\x00\x00\x08' + (8).to_bytes(8, 'big') + b'\x00\x00\x00\x02n8' + \
+                              b'\x00\x02\x00\x00\x00\x08' + (9).to_bytes(8, 'big') + b'\xff\xff\xff\xff' + b'\xff\xff'
+        # Numeric values are encoded in base 10000 digits (ndigits, weight, sign, dscale, digits):
+        conn = FakeDBConnection([('id', 'bigint'), ('amount', 'numeric')])
+        loader = metl.dbc.open_db_loader(conn, 'postgres', 'items', {'format': 'binary'})
+        metl.dbc.load_db_batch(loader, pd.DataFrame({'id': [1], 'amount': ['12345.678']}))
+        metl.dbc.close_db_loader(loader)
+        assert conn.copies[0][1][19:-2] == b'\x00\x02\x00\x00\x00\x08' + (1).to_bytes(8, 'big') + b'\x00\x00\x00\x0e' + \
+                                            struct.pack('>hhHh', 3, 1, 0, 3) + struct.pack('>hhh', 1, 2345, 6780)
+        encode_numeric = metl.dbc.postgres.encode_copy_binary_numeric
+        assert encode_numeric('-0.00001') == struct.pack('>hhHhh', 1, -2, 0x4000, 5, 1000)
+        assert encode_numeric(1000000) == struct.pack('>hhHhh', 1, 1, 0, 0, 100) and encode_numeric(0.0) == struct.pack('>hhHh', 0, 0, 0, 1)
+        assert encode_numeric('NaN') == struct.pack('>hhHh', 0, 0, 0xC000, 0)
+        # The text null marker is never a value of the data:
+        payload, null_marker = metl.dbc.postgres.encode_copy_text(pd.DataFrame({'name': ['\\N', None], 'amount': [1.5, None]}))
+        assert null_marker != '\\N' and payload.decode('utf-8').split('\n')[:2] == ['\\N,1.5', null_marker + ',' + null_marker]
+        try:
+            metl.dbc.open_db_loader(conn, 'postgres', 'items', {'format': 'xml'})
+            assert False
+        except ValueError:
+            pass
+
+    # test the Snowflake staged files destination (with a stubbed connector):
+    @classmethod
+    def test_ETL031_snowflake_stage_destination(cls):
+        data = pd.DataFrame({'id': range(0, 10), 'name': ['n' + str(i) for i in range(0, 10)]})
+        file_formats = ['csv'] + (['parquet'] if metl.pa is not None else [])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [data])
+            for file_format in file_formats:
+                # Batches are staged in files of batch_size rows and loaded by a single COPY INTO:
+                conn = FakeDBConnection()
+                job_config = make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming', 'batch_size': 4})
+                job_config['datasources']['destination'] = {'db_type': 'snowflake', 'table': 'sales.public.items',
+                                                            'write_options': {'file_format': file_format, 'batch_size': 3, 'parallel': 2}}
+                job_config['connection_pool'] = {'destination': conn}
+                assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+                assert job_config['run_stats']['rows_loaded'] == 10
+                puts = [statement for statement in conn.statements if statement.startswith('PUT ')]
+                copies = [statement for statement in conn.statements if statement.startswith('COPY INTO ')]
+                assert len(puts) == 5 and len(copies) == 1 and conn.commits == 1
+                assert all(' @sales.public.%items/microetl/' in statement for statement in puts)
+                assert not any(os.path.exists(statement.split("'")[1][len('file://'):]) for statement in puts)
+                assert ('TYPE = PARQUET' in copies[0]) == (file_format == 'parquet')
+            # A failed run removes the staged files instead of loading them:
+            conn = FakeDBConnection()
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, sequence=[{'type': 'sort', 'parameters': {'sort_parameters': {'sort_parameter': {'sort_parameter_name': 'missing'}}}}],
+                                             execution={'mode': 'streaming', 'batch_size': 4})
+            job_config['datasources']['destination'] = {'db_type': 'snowflake', 'table': 'items', 'write_options': {'file_format': 'csv', 'stage': 'landing'}}
+            job_config['connection_pool'] = {'destination': conn}
+            assert not metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            assert [statement.split('/')[0] for statement in conn.statements] == ['REMOVE @landing']
+        # With write_pandas, each batch is loaded by the connector in a temporary table, inserted into the table on commit:
+        loaded = []
+        stage = 'microetl_stage_' + str(os.getpid())
+        with mock.patch.object(metl.dbc.sf, 'write_pandas', lambda conn, df, table_name, **kwargs: loaded.append((table_name, len(df)))):
+            for commit in [True, False]:
+                conn = FakeDBConnection()
+                loader = metl.dbc.open_db_loader(conn, 'snowflake', 'public.items', {'method': 'write_pandas'})
+                metl.dbc.load_db_batch(loader, data)
+                assert metl.dbc.close_db_loader(loader, commit) == 10 and loaded[-1] == (stage, 10)
+                inserts = ['INSERT INTO public.items ("id", "name") SELECT "id", "name" FROM "' + stage + '"'] if commit else []
+                assert conn.statements == ['CREATE TEMPORARY TABLE "' + stage + '" LIKE public.items'] + inserts + ['DROP TABLE IF EXISTS "' + stage + '"']
+                assert conn.commits == (1 if commit else 0)
+
+    # test the Elasticsearch bulk indexing destination (with a stubbed cluster):
+    @classmethod
+    def test_ETL032_elasticsearch_bulk_destination(cls):
+        import elasticsearch
+        data = pd.DataFrame({'id': range(0, 10), 'name': ['n' + str(i) for i in range(0, 9)] + [None]})
+        documents = []
+        calls = []
+        def bulk(client, operations=None, **kwargs):
+            lines = [json.loads(line) for line in operations]
+            documents.extend(lines[1::2])
+            return mock.Mock(body={'errors': False, 'items': [{'index': {'status': 201, '_id': line['index'].get('_id')}} for line in lines[0::2]]})
+        def get_settings(indices, index=None, name=None):
+            calls.append(('get_settings', index))
+            return {index: {'settings': {'index': {'refresh_interval': '30s'}}}}
+        def put_settings(indices, index=None, settings=None):
+            calls.append(('put_settings', index, settings))
+        def refresh(indices, index=None):
+            calls.append(('refresh', index))
+        conn = elasticsearch.Elasticsearch('http://localhost:9200')
+        IndicesClient = type(conn.indices)
+        with mock.patch.object(elasticsearch.Elasticsearch, 'bulk', bulk), \
+             mock.patch.object(IndicesClient, 'get_settings', get_settings), \
+             mock.patch.object(IndicesClient, 'put_settings', put_settings), \
+             mock.patch.object(IndicesClient, 'refresh', refresh):
+            for method in ['parallel', 'streaming']:
+                documents.clear()
+                calls.clear()
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    write_csv_files(tmp_dir, [data])
+                    job_config = make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming', 'batch_size': 4})
+                    job_config['datasources']['destination'] = {'db_type': 'elasticsearch', 'table': 'items',
+                                                                'write_options': {'method': method, 'chunk_size': 3, 'thread_count': 2, 'id_column': 'id', 'tune_index': True}}
+                    job_config['connection_pool'] = {'destination': conn}
+                    assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+                assert job_config['run_stats']['rows_loaded'] == 10
+                assert sorted(document['id'] for document in documents) == list(range(0, 10))
+                assert [document for document in documents if document['id'] == 9][0]['name'] is None
+                # The index settings are changed during the load and restored after it:
+                assert calls == [('get_settings', 'items'),
+                                 ('put_settings', 'items', {'index': {'refresh_interval': '-1', 'number_of_replicas': 0}}),
+                                 ('put_settings', 'items', {'index': {'refresh_interval': '30s', 'number_of_replicas': None}}),
+                                 ('refresh', 'items')]
+
+    # test the MongoDB bulk write destination (with a stubbed client) and the write throughput:
+    @classmethod
+    def test_ETL033_mongodb_bulk_write_destination(cls):
+        data = pd.DataFrame({'id': range(0, 10), 'name': ['n' + str(i) for i in range(0, 9)] + [None]})
+        conn = FakeMongoClient()
+        conn['sales']['items'] = FakeMongoCollection()
+        conn['default']['items'] = FakeMongoCollection()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [data])
+            # Documents are inserted in unordered requests of batch_size documents:
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming', 'batch_size': 4})
+            job_config['datasources']['destination'] = {'db_type': 'mongodb', 'table': 'sales.items', 'write_options': {'batch_size': 3}}
+            job_config['connection_pool'] = {'destination': conn}
+            assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            collection = conn['sales']['items']
+            assert collection.requests == [('insert_many', 3, False), ('insert_many', 1, False)] * 2 + [('insert_many', 2, False)]
+            assert len(collection.documents) == 10 and collection.documents[9] == {'id': 9, 'name': None}
+            run_stats = job_config['run_stats']
+            assert run_stats['rows_loaded'] == 10 and run_stats['rows_written'] == 10 and run_stats['write_throughput'] > 0
+            # With key columns, documents are upserted by key (so loading twice does not duplicate them):
+            for run in range(0, 2):
+                job_config = make_csv_job_config(tmp_dir, tmp_dir)
+                job_config['datasources']['destination'] = {'db_type': 'mongodb', 'table': 'items', 'write_options': {'key_columns': 'id'}}
+                job_config['connection_pool'] = {'destination': conn}
+                assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            assert conn['default']['items'].requests == [('bulk_write', 10, False)] * 2
+            assert len(conn['default']['items'].documents) == 10
+            # The job summary reports the write throughput:
+            with open(os.path.join(tmp_dir, 'job.yaml'), 'w') as job_file:
+                yaml.dump({'datasources': {'source': {'type': 'csv'}, 'destination': {'type': 'csv'}}, 'actions': {'source': {'name': 'read'}}}, job_file)
+            summary = metl.etleng_run_job('job.yaml', tmp_dir, tmp_dir, tmp_dir, os.path.join(tmp_dir, 'out'))
+            assert summary['status'] == 'ok' and summary['write_throughput'] > 0
+
+    # test the Neo4j UNWIND destination (with a stubbed driver):
+    @classmethod
+    def test_ETL034_neo4j_unwind_destination(cls):
+        data = pd.DataFrame({'id': range(0, 10), 'name': ['n' + str(i) for i in range(0, 9)] + [None]})
+        cypher = 'MERGE (p:Person {id: row.id}) SET p.name = row.name'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [data])
+            # Records are written in lists of batch_size rows, by concurrent sessions:
+            conn = FakeNeo4jDriver()
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming', 'batch_size': 4})
+            job_config['datasources']['destination'] = {'db_type': 'neo4j', 'database': 'people', 'write_options': {'cypher': cypher, 'batch_size': 3, 'sessions': 2}}
+            job_config['connection_pool'] = {'destination': conn}
+            assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            assert job_config['run_stats']['rows_loaded'] == 10 and job_config['run_stats']['output_table'] == 'people'
+            assert len(conn.transactions) == 5
+            assert all(statement == 'UNWIND $rows AS row\n' + cypher and database == 'people' for statement, database, _ in conn.transactions)
+            rows = sorted((row for _, _, rows in conn.transactions for row in rows), key=lambda row: row['id'])
+            assert [row['id'] for row in rows] == list(range(0, 10)) and rows[-1]['name'] is None
+        # Templates that already unwind the rows are used as they are, and a template is required:
+        assert metl.dbc.neo4j.get_unwind_statement('UNWIND $rows AS r CREATE (:N {id: r.id})') == 'UNWIND $rows AS r CREATE (:N {id: r.id})'
+        try:
+            metl.dbc.open_db_loader(FakeNeo4jDriver(), 'neo4j', None, {})
+            assert False
+        except ValueError:
+            pass
+
+    # test the merge write mode of the SQL destinations (staged in temporary tables):
+    @classmethod
+    def test_ETL035_merge_write_mode(cls):
+        data = pd.DataFrame({'id': [1, 2, 3, 2], 'name': ['a', 'b', 'c', 'B']})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_csv_files(tmp_dir, [data])
+            # Postgres: the batches are copied in a temporary table merged by a single INSERT ... ON CONFLICT:
+            conn = FakeDBConnection()
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming', 'batch_size': 2})
+            job_config['datasources']['destination'] = {'db_type': 'postgres', 'table': 'public.items', 'write_options': {'write_mode': 'merge', 'key_columns': 'id'}}
+            job_config['connection_pool'] = {'destination': conn}
+            assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            assert job_config['run_stats']['rows_loaded'] == 4 and len(conn.copies) == 2 and conn.commits == 1
+            statements = [render_sql(statement) for statement in conn.statements]
+            stage = '"microetl_stage_' + str(os.getpid()) + '"'
+            assert statements == ['CREATE TEMPORARY TABLE ' + stage + ' (LIKE "public"."items" INCLUDING DEFAULTS) ON COMMIT DROP',
+                                  'INSERT INTO "public"."items" ("id", "name") SELECT DISTINCT ON ("id") "id", "name" FROM ' + stage +
+                                  ' ORDER BY "id", ctid DESC ON CONFLICT ("id") DO UPDATE SET "name" = EXCLUDED."name"']
+            assert all(render_sql(statement).startswith('COPY ' + stage) for statement, _ in conn.copies)
+            # Snowflake: the staged files are copied in a temporary table merged by a single MERGE, which uses the
+            # last record of each key (in load order):
+            conn = FakeDBConnection()
+            job_config = make_csv_job_config(tmp_dir, tmp_dir, execution={'mode': 'streaming', 'batch_size': 2})
+            job_config['datasources']['destination'] = {'db_type': 'snowflake', 'table': 'public.items', 'write_options': {'write_mode': 'merge', 'key_columns': ['id'], 'file_format': 'csv'}}
+            job_config['connection_pool'] = {'destination': conn}
+            with mock.patch.object(metl.dbc.sf, 'put_stage_file', lambda conn, filename, stage_path: staged.append((stage_path, pd.read_csv(filename, header=None)))):
+                staged = []
+                assert metl.etleng_run_plan(metl.etleng_compile_pipeline(job_config))
+            stage = '"microetl_stage_' + str(os.getpid()) + '"'
+            assert conn.statements[:2] == ['CREATE TEMPORARY TABLE ' + stage + ' LIKE public.items', 'ALTER TABLE ' + stage + ' ADD COLUMN "microetl_seq" NUMBER']
+            assert [statement.split(' ')[0] for statement in conn.statements] == ['CREATE', 'ALTER', 'COPY', 'MERGE', 'DROP'] and conn.commits == 1
+            assert conn.statements[2].startswith('COPY INTO ' + stage + ' ("id", "name", "microetl_seq") FROM @~/microetl/')
+            assert all(stage_path.startswith('@~/microetl/') for stage_path, _ in staged)
+            # (the files are PUT in parallel, so they are staged in any order)
+            assert sorted(pd.concat([chunk for _, chunk in staged])[2].tolist()) == [0, 1, 2, 3]
+            assert conn.statements[3] == ('MERGE INTO public.items t USING (SELECT "id", "name" FROM ' + stage + ' QUALIFY ROW_NUMBER() OVER (PARTITION BY "id" ' +
+                                          'ORDER BY "microetl_seq" DESC) = 1) s ON t."id" = s."id" WHEN MATCHED THEN UPDATE SET t."name" = s."name" ' +
+                                          'WHEN NOT MATCHED THEN INSERT ("id", "name") VALUES (s."id", s."name")')
+            # When the temporary table cannot be created, no local directory (nor PUT thread) is left behind:
+            conn = FakeDBConnection()
+            with mock.patch.object(FakeDBCursor, 'execute', side_effect=RuntimeError('no privileges')), mock.patch.object(metl.dbc.sf.tempfile, 'mkdtemp') as mkdtemp:
+                try:
+                    metl.dbc.open_db_loader(conn, 'snowflake', 'public.items', {'write_mode': 'merge', 'key_columns': ['id']})
+                    assert False
+                except RuntimeError:
+                    pass
+            assert not mkdtemp.called
+        # The merge write mode requires key columns, and a database that supports it:
+        for db_type, write_options in [('postgres', {'write_mode': 'merge'}), ('postgres', {'write_mode': 'upsert', 'key_columns': 'id'}),
+                                       ('mongodb', {'write_mode': 'merge', 'key_columns': 'id'})]:
+            try:
+                metl.dbc.open_db_loader(FakeDBConnection(), db_type, 'items', write_options)
+                assert False
+            except ValueError:
+                pass